@@ -10,6 +10,18 @@ VERSION = "3.0.1"
 __version__ = VERSION
 
 
+def warmup(*args, **kwargs):
+    """Compiles and caches PyARPES' numba kernels ahead of time.
+
+    See ``arpes.utilities.jit.warmup`` for details. Calling this in batch jobs
+    or process pool initializers avoids paying the JIT cost during the first
+    momentum conversion.
+    """
+    from arpes.utilities.jit import warmup as warmup_kernels
+
+    return warmup_kernels(*args, **kwargs)
+
+
 def check() -> None:
     """Verifies certain aspects of the installation and provides guidance broken installations."""
 
@@ -2,60 +2,229 @@
 
 This is very useful for determining spectral shifts before doing serious curve fitting analysis or similar.
 
-Implementations are included for each of 1D and 2D arrays, but this could be simply extended to ND if we need to.
-I doubt that this is necessary and don't mind the copied code too much at the present.
+All alignments are computed from FFT based normalized cross correlations (optionally phase
+correlations) with parabolic subpixel refinement of the correlation peak. The engine works on
+whole stacks of frames at once, so that a spatial or temperature series can be drift corrected
+in one call with `align_stack`.
 """
 
+from typing import Optional, Sequence, Union
+
 import numpy as np
+import scipy.fft
 import xarray as xr
 
-from scipy import signal
-from arpes.fits.fit_models import QuadraticModel
+__all__ = ("align2d", "align1d", "align", "align_stack")
 
-__all__ = ("align2d", "align1d", "align")
+# Upper bound in bytes on the size of the correlations computed at once when aligning stacks
+ALIGN_BLOCK_SIZE = 2 ** 28
 
+# The smallest fraction of their pixels in which frames must overlap for a lag to be considered
+MIN_OVERLAP = 0.5
 
-def align2d(a, b, subpixel=True):
-    """Returns the unitful offset of b in a for 2D arrays using 2D correlation.
+
+def _parabolic_peak(corr: np.ndarray, peak: np.ndarray) -> np.ndarray:
+    """Refines integer correlation peaks along each axis with a three point fit.
+
+    Where the peak and its neighbors are positive, a parabola is fit to their logarithm, which is
+    exact for Gaussian peaks and much less biased than a plain parabola for broad spectral features.
 
     Args:
-        a: The first input array.
-        b: The second input array.
-        subpixel: If True, will perform subpixel alignment using a curve fit to the peak.
+        corr: Correlations with shape [n_frames, *lags], periodic along the lag axes.
+        peak: The integer peak locations with shape [n_frames, n_axes].
 
     Returns:
-        The offset of a 2D array against another.
+        The subpixel corrections to `peak`.
     """
-    corr = signal.correlate2d(
-        a.values - np.mean(a.values), b.values - np.mean(b.values), boundary="fill", mode="same"
-    )
+    frames = np.arange(len(corr))
+    corrections = np.zeros(peak.shape)
+    for axis in range(peak.shape[1]):
+        n = corr.shape[axis + 1]
+        neighbors = []
+        for step in (-1, 0, 1):
+            index = [frames] + [peak[:, i] for i in range(peak.shape[1])]
+            index[axis + 1] = (peak[:, axis] + step) % n
+            neighbors.append(corr[tuple(index)])
 
-    y, x = np.unravel_index(np.argmax(corr), corr.shape)
+        low, center, high = neighbors
+        positive = (low > 0) & (center > 0) & (high > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            low, center, high = (
+                np.where(positive, np.log(np.where(positive, v, 1)), v) for v in (low, center, high)
+            )
+            curvature = low - 2 * center + high
+            correction = np.where(curvature < 0, 0.5 * (low - high) / curvature, 0)
+        corrections[:, axis] = np.clip(correction, -0.5, 0.5)
 
-    if subpixel:
-        marg = xr.DataArray(
-            corr[y - 10 : y + 10, x], coords={"index": np.linspace(-10, 9, 20)}, dims=["index"]
-        )
-        marg = marg / np.max(marg)
-        mod = QuadraticModel().guess_fit(marg)
-        true_y = y + -mod.params["b"].value / (2 * mod.params["a"].value)
+    return corrections
+
+
+def _hann_window(shape: Sequence[int]) -> np.ndarray:
+    """A separable Hann window, which tapers frames smoothly to zero at their boundaries."""
+    window = np.ones(shape)
+    for axis, n in enumerate(shape):
+        window_shape = [1] * len(shape)
+        window_shape[axis] = n
+        window = window * np.hanning(n).reshape(window_shape)
+
+    return window
+
+
+def _normalized_correlation(
+    references: np.ndarray, frames: np.ndarray, fft_shape: Sequence[int]
+) -> np.ndarray:
+    """Normalized cross correlations of frames against references, over their overlap at each lag.
+
+    The mean and variance of both frames are taken over the pixels which overlap at each lag, so
+    that content which does not vanish at the boundaries (such as a Fermi edge) does not bias the
+    peak towards zero lag. All sums over the overlap are themselves correlations, with an array of
+    ones, and are computed by FFT. Lags with too little overlap are given the minimum value, -1.
+
+    Args:
+        references: The reference frames, with shape [n_frames or 1, *frame_shape].
+        frames: The frames to correlate, with shape [n_frames, *frame_shape].
+        fft_shape: The zero padded shape of the correlations.
+
+    Returns:
+        The correlations with shape [n_frames, *fft_shape], periodic along the lag axes.
+    """
+    frame_shape = frames.shape[1:]
+    axes = tuple(range(1, frames.ndim))
+
+    def transform(arr):
+        return scipy.fft.rfftn(arr, fft_shape, axes=axes)
+
+    def correlate(a, b):
+        return scipy.fft.irfftn(a * np.conj(b), fft_shape, axes=axes)
+
+    references = references - references.mean(axis=axes, keepdims=True)
+    frames = frames - frames.mean(axis=axes, keepdims=True)
+
+    ones = transform(np.ones((1,) + frame_shape))
+    reference_transform, frame_transform = transform(references), transform(frames)
+
+    # lags without any overlap are discarded below, the count is kept positive to divide by it
+    overlap = np.maximum(np.round(correlate(ones, ones)), 1)
+    reference_sum = correlate(reference_transform, ones)
+    frame_sum = correlate(ones, frame_transform)
+    cross = correlate(reference_transform, frame_transform)
+
+    reference_variance = correlate(transform(references ** 2), ones) - reference_sum ** 2 / overlap
+    frame_variance = correlate(ones, transform(frames ** 2)) - frame_sum ** 2 / overlap
+    covariance = cross - reference_sum * frame_sum / overlap
+
+    valid = overlap >= MIN_OVERLAP * np.prod(frame_shape)
+    norm = np.where(valid, np.sqrt(np.maximum(reference_variance * frame_variance, 0)), 0)
+    valid = valid & (norm > 1e-12 * norm.max(initial=0))
+    return np.where(valid, covariance / np.where(valid, norm, 1), -1)
+
+
+def _phase_correlation(
+    references: np.ndarray, frames: np.ndarray, fft_shape: Sequence[int]
+) -> np.ndarray:
+    """Phase correlations of frames against references, see `_normalized_correlation`.
+
+    Frames are apodized with a Hann window, so that zero padding does not introduce edges at their
+    boundaries which would dominate the whitened spectrum. Whitening is regularized by the mean
+    amplitude, which keeps noise at high frequencies from swamping the peak.
+    """
+    axes = tuple(range(1, frames.ndim))
+    window = _hann_window(frames.shape[1:])
+
+    def transform(arr):
+        arr = arr - arr.mean(axis=axes, keepdims=True)
+        return scipy.fft.rfftn(arr * window, fft_shape, axes=axes)
+
+    cross = transform(references) * np.conj(transform(frames))
+    amplitude = np.abs(cross)
+    cross /= amplitude + amplitude.mean(axis=axes, keepdims=True) + 1e-300
+    return scipy.fft.irfftn(cross, fft_shape, axes=axes)
+
+
+def correlation_offsets(
+    frames: np.ndarray,
+    reference: Optional[np.ndarray] = None,
+    subpixel: bool = True,
+    method: str = "correlation",
+) -> np.ndarray:
+    """Pixel offsets of each of a stack of frames against a reference, or the previous frame.
+
+    Correlations are linear rather than circular, computed by FFT over zero padded frames. Plain
+    correlations are normalized over the overlap of the frames at each lag, which makes them
+    unbiased for content that does not vanish at the boundaries, as is the case for most spectra.
+    Offsets are searched over lags at which the frames overlap in at least half of their pixels.
+
+    Args:
+        frames: The frames to align, with shape [n_frames, *frame_shape].
+        reference: The frame to align against. If not provided, each frame is aligned against the
+          previous one (the first frame has offset zero).
+        subpixel: Whether to refine peaks to subpixel precision.
+        method: Either "correlation" for normalized cross correlation, or "phase" for phase
+          correlation of apodized frames, which whitens the spectra and is more robust to broad,
+          slowly varying backgrounds, but less so to noise.
 
-        marg = xr.DataArray(
-            corr[y, x - 10 : x + 10], coords={"index": np.linspace(-10, 9, 20)}, dims=["index"]
+    Returns:
+        The offsets k with shape [n_frames, n_axes], such that ``reference[i + k] ~ frame[i]``.
+    """
+    if method not in {"correlation", "phase"}:
+        raise ValueError(f"Unknown method {method}, expected correlation or phase.")
+
+    correlate = _phase_correlation if method == "phase" else _normalized_correlation
+
+    frames = np.asarray(frames, dtype=np.float64)
+    frame_shape = frames.shape[1:]
+    fft_shape = [scipy.fft.next_fast_len(2 * n - 1, real=True) for n in frame_shape]
+    if reference is not None:
+        reference = np.asarray(reference, dtype=np.float64)[np.newaxis]
+
+    offsets = np.zeros((len(frames), len(frame_shape)))
+    # normalized correlations keep about eight arrays of the padded size per frame
+    frame_size = 64 * int(np.prod(fft_shape))
+    block = max(ALIGN_BLOCK_SIZE // frame_size, 2)
+
+    start = 0 if reference is not None else 1
+    while start < len(frames):
+        stop = min(start + block, len(frames))
+        references = reference if reference is not None else frames[start - 1 : stop - 1]
+        corr = correlate(references, frames[start:stop], fft_shape)
+        peak = np.stack(
+            np.unravel_index(np.argmax(corr.reshape(len(corr), -1), axis=1), corr.shape[1:]),
+            axis=-1,
         )
-        marg = marg / np.max(marg)
-        mod = QuadraticModel().guess_fit(marg)
-        true_x = x + -mod.params["b"].value / (2 * mod.params["a"].value)
 
-        y, x = true_y, true_x
+        lags = peak.astype(np.float64)
+        if subpixel:
+            lags += _parabolic_peak(corr, peak)
 
-    y = 1.0 * y - a.values.shape[0] / 2.0
-    x = 1.0 * x - a.values.shape[1] / 2.0
+        # lags past the middle of the (periodic) correlation are negative
+        fft_lengths = np.asarray(fft_shape)
+        offsets[start:stop] = np.where(lags > fft_lengths / 2, lags - fft_lengths, lags)
+        start = stop
 
-    return (
-        y * a.G.stride(generic_dim_names=False)[a.dims[0]],
-        x * a.G.stride(generic_dim_names=False)[a.dims[1]],
-    )
+    if reference is None:
+        offsets = np.cumsum(offsets, axis=0)
+
+    return offsets
+
+
+def _unitful(offsets: np.ndarray, a: xr.DataArray, dims: Sequence[str]) -> np.ndarray:
+    stride = a.G.stride(generic_dim_names=False)
+    return offsets * np.asarray([stride[d] for d in dims])
+
+
+def align2d(a, b, subpixel=True):
+    """Returns the unitful offset of b in a for 2D arrays using 2D correlation.
+
+    Args:
+        a: The first input array.
+        b: The second input array.
+        subpixel: If True, will perform subpixel alignment with a three point fit to the peak.
+
+    Returns:
+        The offset of a 2D array against another.
+    """
+    offsets = correlation_offsets(b.values[np.newaxis], a.values, subpixel=subpixel)
+    return tuple(_unitful(offsets[0], a, a.dims))
 
 
 def align1d(a, b, subpixel=True):
@@ -64,24 +233,13 @@ def align1d(a, b, subpixel=True):
     Args:
         a: The first input array.
         b: The second input array.
-        subpixel: If True, will perform subpixel alignment using a curve fit to the peak.
+        subpixel: If True, will perform subpixel alignment with a three point fit to the peak.
 
     Returns:
         The offset of an array against another.
     """
-    corr = np.correlate(a.values - np.mean(a.values), b.values - np.mean(b.values), mode="same")
-    (x,) = np.unravel_index(np.argmax(corr), corr.shape)
-
-    if subpixel:
-        marg = xr.DataArray(
-            corr[x - 10 : x + 10], coords={"index": np.linspace(-10, 9, 20)}, dims=["index"]
-        )
-        marg = marg / np.max(marg)
-        mod = QuadraticModel().guess_fit(marg)
-        x = x + -mod.params["b"].value / (2 * mod.params["a"].value)
-
-    x = 1.0 * x - a.values.shape[0] / 2.0
-    return x * a.G.stride(generic_dim_names=False)[a.dims[0]]
+    offsets = correlation_offsets(b.values[np.newaxis], a.values, subpixel=subpixel)
+    return _unitful(offsets[0], a, a.dims)[0]
 
 
 def align(a, b, **kwargs):
@@ -90,13 +248,59 @@ def align(a, b, **kwargs):
     Args:
         a: The first input array.
         b: The second input array.
-        subpixel: If True, will perform subpixel alignment using a curve fit to the peak.
+        subpixel: If True, will perform subpixel alignment with a three point fit to the peak.
 
     Returns:
         The offset of an array against another.
     """
-    if len(a.dims == 1):
+    if len(a.dims) == 1:
         return align1d(a, b, **kwargs)
 
     assert len(a.dims) == 2
     return align2d(a, b, **kwargs)
+
+
+def align_stack(
+    data: xr.DataArray,
+    along: str,
+    reference: Optional[Union[xr.DataArray, str, int]] = 0,
+    subpixel: bool = True,
+    method: str = "correlation",
+) -> xr.DataArray:
+    """Aligns every frame of a stack against a reference in one pass.
+
+    Example:
+        To drift correct a temperature series of cuts against its first cut
+
+        >>> offsets = align_stack(cuts, "T")  # doctest: +SKIP
+        >>> corrected = cuts.G.shift_by(-offsets.sel(dim="eV"), shift_axis="eV")  # doctest: +SKIP
+
+    Args:
+        data: The stack of frames to align.
+        along: The dimension indexing the frames, all other dimensions are aligned.
+        reference: The frame to align against. This can be a DataArray, the index of a frame,
+          "mean" to use the average frame, or None to align each frame against the previous one
+          and accumulate the offsets, which follows slow drifts better.
+        subpixel: Whether to refine offsets to subpixel precision.
+        method: Either "correlation" or "phase", see `correlation_offsets`.
+
+    Returns:
+        The unitful offsets of each frame along each other dimension, with dims [along, "dim"].
+    """
+    dims = [d for d in data.dims if d != along]
+    frames = data.transpose(along, *dims).values
+
+    if isinstance(reference, xr.DataArray):
+        reference = reference.transpose(*dims).values
+    elif isinstance(reference, str) and reference == "mean":
+        reference = frames.mean(axis=0)
+    elif reference is not None:
+        reference = frames[reference]
+
+    offsets = correlation_offsets(frames, reference, subpixel=subpixel, method=method)
+
+    return xr.DataArray(
+        _unitful(offsets, data, dims),
+        coords={along: data.coords[along].values, "dim": dims},
+        dims=[along, "dim"],
+    )
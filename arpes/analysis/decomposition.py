@@ -1,10 +1,14 @@
 """Provides array decomposition approaches like principal component analysis for xarray types."""
+import inspect
 from functools import wraps
 
+import numpy as np
+import xarray as xr
+
 from arpes.provenance import provenance
 from arpes.typing import DataType
 from arpes.utilities import normalize_to_spectrum
-from typing import List, Tuple, Any
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
 __all__ = (
     "decomposition_along",
@@ -15,8 +19,176 @@ __all__ = (
 )
 
 
+# Decompositions which cannot be fit in batches, and the estimators used in their place
+STREAMING_EQUIVALENTS = {
+    "PCA": "IncrementalPCA",
+    "NMF": "MiniBatchNMF",
+    "DictionaryLearning": "MiniBatchDictionaryLearning",
+}
+
+
+def _observation_batches(
+    data: xr.DataArray, axes: List[str], batch_size: int
+) -> Callable[[], Iterator[Tuple[slice, np.ndarray]]]:
+    """Produces a reader of consecutive batches of (flattened) observations.
+
+    Batches are read lazily from slabs along the first observation axis, so that for data backed by
+    dask or a memory map only a little more than one batch is in memory at a time.
+    """
+    spectral_dims = [d for d in data.dims if d not in axes]
+    n_features = int(np.prod([data.sizes[d] for d in spectral_dims]))
+    inner = int(np.prod([data.sizes[d] for d in axes[1:]]))
+    n_observations = data.sizes[axes[0]] * inner
+
+    n_batches = max(n_observations // batch_size, 1)
+    bounds = np.linspace(0, n_observations, n_batches + 1).astype(int)
+
+    def batches():
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            first, last = start // inner, (stop - 1) // inner + 1
+            slab = data.isel(**{axes[0]: slice(first, last)}).transpose(*axes, *spectral_dims)
+            rows = np.asarray(slab.values).reshape(-1, n_features)
+            yield slice(start, stop), rows[start - first * inner : stop - first * inner]
+
+    return batches
+
+
+def _streaming_randomized_pca(
+    batches, n_components: int, n_oversamples=10, iterated_power=4, random_state=None, **kwargs
+):
+    """PCA by randomized subspace iteration, touching the data only through passes over batches.
+
+    Returns:
+        A fitted `sklearn.decomposition.PCA` instance.
+    """
+    from sklearn.decomposition import PCA
+    from sklearn.utils import check_random_state
+    from sklearn.utils.extmath import svd_flip
+
+    n_samples, total, squares = 0, 0, 0
+    for _, batch in batches():
+        n_samples += len(batch)
+        total = total + batch.sum(axis=0)
+        squares = squares + (batch ** 2).sum(axis=0)
+
+    mean = total / n_samples
+    total_variance = np.sum(squares - n_samples * mean ** 2) / (n_samples - 1)
+
+    rng = check_random_state(random_state)
+    basis = rng.normal(size=(len(mean), min(n_components + n_oversamples, len(mean))))
+    for _ in range(max(iterated_power, 1)):
+        projected = np.zeros_like(basis)
+        for _, batch in batches():
+            centered = batch - mean
+            projected += centered.T @ (centered @ basis)
+        basis, _ = np.linalg.qr(projected)
+
+    # the singular values and right singular vectors of the data projected onto the basis
+    gram = 0
+    for _, batch in batches():
+        sketch = (batch - mean) @ basis
+        gram = gram + sketch.T @ sketch
+
+    eigenvalues, vectors = np.linalg.eigh(gram)
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+    eigenvalues = np.maximum(eigenvalues[order], 0)
+    components = (basis @ vectors[:, order]).T
+    _, components = svd_flip(np.zeros((1, n_components)), components, u_based_decision=False)
+
+    decomp = PCA(
+        n_components=n_components, svd_solver="randomized", random_state=random_state, **kwargs
+    )
+    decomp.mean_ = mean
+    decomp.components_ = components
+    decomp.n_components_ = n_components
+    decomp.n_samples_ = n_samples
+    decomp.n_features_in_ = len(mean)
+    decomp.explained_variance_ = eigenvalues / (n_samples - 1)
+    decomp.explained_variance_ratio_ = decomp.explained_variance_ / total_variance
+    decomp.singular_values_ = np.sqrt(eigenvalues)
+    decomp.noise_variance_ = (total_variance - decomp.explained_variance_.sum()) / max(
+        len(mean) - n_components, 1
+    )
+    return decomp
+
+
+def _decomposition_in_batches(
+    data: xr.DataArray, axes: List[str], decomposition_cls, correlation, batch_size, **kwargs
+) -> Tuple[xr.DataArray, Any]:
+    """Fits a decomposition with passes over batches of observations, see `decomposition_along`."""
+    import sklearn.decomposition
+    from sklearn.preprocessing import StandardScaler
+
+    read_batches = _observation_batches(data, axes, batch_size)
+
+    scaler = None
+    if correlation:
+        scaler = StandardScaler()
+        for _, batch in read_batches():
+            scaler.partial_fit(batch)
+
+    def batches():
+        for where, batch in read_batches():
+            yield where, batch if scaler is None else scaler.transform(batch)
+
+    randomized = issubclass(decomposition_cls, sklearn.decomposition.PCA) and (
+        kwargs.get("svd_solver") == "randomized"
+    )
+    if randomized:
+        kwargs.pop("svd_solver")
+        decomp = _streaming_randomized_pca(batches, **kwargs)
+    else:
+        if not hasattr(decomposition_cls, "partial_fit"):
+            if decomposition_cls.__name__ not in STREAMING_EQUIVALENTS:
+                raise ValueError(
+                    f"{decomposition_cls.__name__} cannot be fit in batches, use a decomposition "
+                    "with partial_fit or do not pass batch_size."
+                )
+            streaming_name = STREAMING_EQUIVALENTS[decomposition_cls.__name__]
+            if not hasattr(sklearn.decomposition, streaming_name):
+                # MiniBatchNMF was added in scikit-learn 1.1
+                raise ImportError(
+                    f"Fitting {decomposition_cls.__name__} in batches requires {streaming_name}, "
+                    "which is not available in this version of scikit-learn."
+                )
+            decomposition_cls = getattr(sklearn.decomposition, streaming_name)
+            # solver options of the in memory estimator do not apply to its mini-batch equivalent
+            accepted = inspect.signature(decomposition_cls).parameters
+            kwargs = {k: v for k, v in kwargs.items() if k in accepted}
+
+        decomp = decomposition_cls(**kwargs)
+        for _, batch in batches():
+            decomp.partial_fit(batch)
+
+    n_observations = int(np.prod([data.sizes[d] for d in axes]))
+    transform = None
+    for where, batch in batches():
+        transformed = decomp.transform(batch)
+        if transform is None:
+            transform = np.empty((n_observations, transformed.shape[1]), dtype=transformed.dtype)
+        transform[where] = transformed
+
+    return (
+        xr.DataArray(
+            transform.T.reshape((-1,) + tuple(data.sizes[d] for d in axes)),
+            coords={
+                "components": np.arange(transform.shape[1]),
+                **{d: data.coords[d] for d in axes},
+            },
+            dims=["components", *axes],
+            attrs=data.attrs.copy(),
+        ),
+        decomp,
+    )
+
+
 def decomposition_along(
-    data: DataType, axes: List[str], decomposition_cls, correlation=False, **kwargs
+    data: DataType,
+    axes: List[str],
+    decomposition_cls,
+    correlation=False,
+    batch_size: Optional[int] = None,
+    **kwargs,
 ) -> Tuple[DataType, Any]:
     """Performs a change of basis of multidimensional data according to `sklearn` decomposition classes.
 
@@ -40,13 +212,27 @@ def decomposition_along(
     The results of `decomposition_along` can be explored with `arpes.widgets.pca_explorer`, regardless of
     the decomposition class.
 
+    Maps which are too large to flatten in memory can be decomposed by passing `batch_size`. The
+    observations are then read lazily in batches (which works well for data backed by dask or a
+    memory map) and fit with `partial_fit`. Decompositions without `partial_fit` are replaced by
+    their mini-batch equivalents (IncrementalPCA, MiniBatchNMF, MiniBatchDictionaryLearning, where
+    MiniBatchNMF requires scikit-learn 1.1 or newer), while PCA with ``svd_solver="randomized"``
+    uses randomized subspace iteration over several passes. In this mode the spectral axes do not
+    need to be stacked beforehand:
+
+    ```
+    transformed, decomp = pca_along(f, ['x', 'y'], n_components=10, batch_size=4096)
+    ```
+
     Args:
-        data: Input data, can be N-dimensional but should only include one "spectral" axis.
+        data: Input data, can be N-dimensional but should only include one "spectral" axis,
+          unless `batch_size` is provided.
         axes: Several axes to be treated as a single axis labeling the list of observations.
         decomposition_cls: A sklearn.decomposition class (such as PCA or ICA) to be used
           to perform the decomposition.
         correlation: Controls whether StandardScaler() is used as the first stage of the data ingestion
           pipeline for sklearn.
+        batch_size: If provided, the number of observations fit at a time.
         kwargs:
 
     Returns:
@@ -55,6 +241,24 @@ def decomposition_along(
     from sklearn.pipeline import make_pipeline
     from sklearn.preprocessing import StandardScaler
 
+    if batch_size is not None:
+        into, decomp = _decomposition_in_batches(
+            normalize_to_spectrum(data), axes, decomposition_cls, correlation, batch_size, **kwargs
+        )
+        provenance(
+            into,
+            data,
+            {
+                "what": "sklearn decomposition",
+                "by": "decomposition_along",
+                "axes": axes,
+                "correlation": correlation,
+                "batch_size": batch_size,
+                "decomposition_cls": type(decomp).__name__,
+            },
+        )
+        return into, decomp
+
     if len(axes) > 1:
         flattened_data = normalize_to_spectrum(data).stack(fit_axis=axes)
         stacked = True
@@ -78,12 +282,9 @@ def decomposition_along(
 
     transform = decomp.transform(flattened_data.values.T)
 
-    into = flattened_data.copy(deep=True)
-    into_first = into.dims[0]
-    into = into.isel(**dict([[into_first, slice(0, transform.shape[1])]]))
-    into = into.rename(dict([[into_first, "components"]]))
-
-    into.values = transform.T
+    into_first = flattened_data.dims[0]
+    into = flattened_data.isel(**dict([[into_first, slice(0, transform.shape[1])]]))
+    into = into.copy(data=transform.T).rename(dict([[into_first, "components"]]))
 
     if stacked:
         into = into.unstack("fit_axis")
@@ -1,7 +1,12 @@
 """Provides deconvolution implementations, especially for 2D Richardson-Lucy."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Union
+
 import numpy as np
 import scipy
 import scipy.ndimage
+import scipy.signal
 from tqdm import tqdm_notebook
 
 import xarray as xr
@@ -14,6 +19,7 @@ __all__ = (
     "deconvolve_ice",
     "deconvolve_rl",
     "make_psf1d",
+    "make_psf",
 )
 
 
@@ -60,142 +66,196 @@ def deconvolve_ice(data: DataType, psf, n_iterations=5, deg=None) -> DataType:
     return result
 
 
+# Kernels with more elements than this are convolved by FFT rather than directly
+FFT_KERNEL_SIZE_THRESHOLD = 64
+
+# Arrays with more elements than this are split into blocks deconvolved in parallel by default
+PARALLEL_SIZE_THRESHOLD = 2 ** 20
+
+# scipy.ndimage boundary modes and their np.pad equivalents, used for the FFT path
+_NDIMAGE_TO_PAD_MODE = {
+    "reflect": "symmetric",
+    "mirror": "reflect",
+    "nearest": "edge",
+    "wrap": "wrap",
+    "constant": "constant",
+}
+
+
+def _fft_convolve(arr: np.ndarray, kernel: np.ndarray, mode: str) -> np.ndarray:
+    """Equivalent to ``scipy.ndimage.convolve`` but using FFTs, for large kernels.
+
+    The boundary is handled by padding according to the ndimage mode and taking
+    the valid part of the full convolution.
+    """
+    axes = [i for i, n in enumerate(kernel.shape) if n > 1]
+    if not axes:
+        return arr * kernel.ravel()[0]
+
+    pad_width = [((n - 1) // 2, n - 1 - (n - 1) // 2) for n in kernel.shape]
+    padded = np.pad(arr, pad_width, mode=_NDIMAGE_TO_PAD_MODE[mode])
+    return scipy.signal.fftconvolve(padded, kernel, mode="valid", axes=axes)
+
+
+def _convolve(arr: np.ndarray, kernels: List[np.ndarray], mode: str, method: str) -> np.ndarray:
+    """Convolves by each of `kernels` in turn, i.e. by their (separable) product."""
+    for kernel in kernels:
+        use_fft = method == "fft" or (method == "auto" and kernel.size > FFT_KERNEL_SIZE_THRESHOLD)
+        if use_fft:
+            arr = _fft_convolve(arr, kernel, mode)
+        else:
+            arr = scipy.ndimage.convolve(arr, kernel, mode=mode)
+
+    return arr
+
+
+def _richardson_lucy(
+    arr: np.ndarray,
+    kernels: List[np.ndarray],
+    n_iterations: int,
+    mode: str,
+    method: str,
+    wrap_progress: Callable = lambda x, *args, **kwargs: x,
+) -> np.ndarray:
+    """Richardson-Lucy iteration on a whole array at once.
+
+    Every kernel has the same number of dimensions as `arr`, a kernel axis of length one
+    means that there is no blurring along that axis, so a 1D PSF is applied to every cut
+    of `arr` simultaneously.
+    """
+    flipped_kernels = [np.flip(kernel) for kernel in kernels]
+
+    estimate = arr
+    for _ in wrap_progress(range(n_iterations), desc="Richardson-Lucy"):
+        blurred = _convolve(estimate, kernels, mode, method)
+        estimate = estimate * _convolve(arr / blurred, flipped_kernels, mode, method)
+
+    return estimate
+
+
+def _kernels_for(arr: xr.DataArray, psf: Union[xr.DataArray, Dict[str, Any]]) -> List[np.ndarray]:
+    """Aligns a PSF to the dimensions of `arr`.
+
+    A DataArray PSF may span any subset of the dimensions of `arr`. A dict of
+    dimension names to one dimensional PSFs describes a separable PSF.
+    """
+    if isinstance(psf, dict):
+        return [
+            kernel
+            for d, psf_1d in psf.items()
+            for kernel in _kernels_for(
+                arr, psf_1d if isinstance(psf_1d, xr.DataArray) else xr.DataArray(psf_1d, dims=[d])
+            )
+        ]
+
+    if not set(psf.dims).issubset(arr.dims):
+        raise ValueError(
+            f"PSF dimensions {psf.dims} are not a subset of data dimensions {arr.dims}."
+        )
+
+    shape = [psf.sizes.get(d, 1) for d in arr.dims]
+    return [psf.transpose(*[d for d in arr.dims if d in psf.dims]).values.reshape(shape)]
+
+
 @update_provenance("Lucy Richardson Deconvolution")
 def deconvolve_rl(
-    data: DataType, psf=None, n_iterations=10, axis=None, sigma=None, mode="reflect", progress=True
+    data: DataType,
+    psf=None,
+    n_iterations=10,
+    axis=None,
+    sigma=None,
+    mode="reflect",
+    progress=True,
+    method="auto",
+    parallelize: Optional[bool] = None,
 ) -> DataType:
     """Deconvolves data by a given point spread function using the Richardson-Lucy method.
 
+    The PSF is applied to the whole array at once, so that a 1D PSF deconvolves every cut
+    along `axis` simultaneously. Large kernels are convolved by FFT. When the PSF does not span
+    every dimension of the data, the data can be split into independent blocks along the
+    remaining dimensions and deconvolved in parallel threads.
+
     Args:
-        data
-        axis
-        sigma
-        mode
-        progress
-        psf: for 1d, if not specified, must specify axis and sigma
+        data: The data to deconvolve.
+        psf: The point spread function. Either a 1D array along `axis`, a DataArray along
+          any subset of the dimensions of `data` (see `make_psf`), or a dict of dimension names
+          to 1D PSFs, which describes a separable PSF. If not provided, a Gaussian PSF is made
+          from `sigma`.
         n_iterations: the number of convolutions to use for the fit
+        axis: The dimension along which a 1D PSF or scalar `sigma` is applied.
+        sigma: The Gaussian width, either a scalar for `axis` or a dict of dimensions to widths,
+          in which case a separable Gaussian PSF is used.
+        mode: The boundary mode, as for `scipy.ndimage.convolve`.
+        progress: Whether to show a progress bar over iterations for multidimensional data.
+        method: One of "direct", "fft", or "auto", which uses FFT convolution for large kernels,
+          and for all kernels when deconvolving in parallel.
+        parallelize: Whether to deconvolve blocks in parallel. Defaults to parallelizing large data.
 
     Returns:
         The Richardson-Lucy deconvolved data.
     """
     arr = normalize_to_spectrum(data)
 
-    if psf is None and axis is not None and sigma is not None:
-        # if no psf is provided and we have the information to make a 1d one
+    if psf is None and sigma is not None:
+        # if no psf is provided and we have the information to make one
         # note: this assumes gaussian psf
-        psf = make_psf1d(data=arr, dim=axis, sigma=sigma)
-
-    if len(data.dims) > 1:
-        if axis is not None:
-            # perform one-dimensional deconvolution of multidimensional data
-
-            # support for progress bars
-            wrap_progress = lambda x, *args, **kwargs: x
-            if progress:
-                wrap_progress = tqdm_notebook
-
-            # dimensions over which to iterate
-            other_dim = list(data.dims)
-            other_dim.remove(axis)
-
-            if len(other_dim) == 1:
-                # two-dimensional data
-                other_dim = other_dim[0]
-                result = arr.copy(deep=True).transpose(
-                    other_dim, axis
-                )  # not sure why the dims only seems to work in this order. seems like I should be able to swap it to (axis,other_dim) and also change the data collection to result[x_ind,y_ind], but this gave different results
-
-                for i, (od, iteration) in wrap_progress(
-                    enumerate(arr.G.iterate_axis(other_dim)),
-                    desc="Iterating " + other_dim,
-                    total=len(arr[other_dim]),
-                ):  # TODO tidy this gross-looking loop
-                    # indices of data being deconvolved
-                    x_ind = xr.DataArray(list(range(len(arr[axis]))), dims=[axis])
-                    y_ind = xr.DataArray([i] * len(x_ind), dims=[other_dim])
-                    # perform deconvolution on this one-dimensional piece
-                    deconv = deconvolve_rl(
-                        data=iteration, psf=psf, n_iterations=n_iterations, axis=None, mode=mode
-                    )
-                    # build results out of these pieces
-                    result[y_ind, x_ind] = deconv.values
-            elif len(other_dim) == 2:
-                # three-dimensional data
-                result = arr.copy(deep=True).transpose(
-                    *other_dim, axis
-                )  # not sure why the dims only seems to work in this order. seems like I should be able to swap it to (axis,*other_dim) and also change the data collection to result[x_ind,y_ind,z_ind], but this gave different results
-                for i, (od0, iteration0) in wrap_progress(
-                    enumerate(arr.G.iterate_axis(other_dim[0])),
-                    desc="Iterating " + other_dim[0],
-                    total=len(arr[other_dim[0]]),
-                ):  # TODO tidy this gross-looking loop
-                    for j, (od1, iteration1) in wrap_progress(
-                        enumerate(iteration0.G.iterate_axis(other_dim[1])),
-                        desc="Iterating " + other_dim[1],
-                        total=len(arr[other_dim[1]]),
-                        leave=False,
-                    ):  # TODO tidy this gross-looking loop
-                        # indices of data being deconvolved
-                        x_ind = xr.DataArray(list(range(len(arr[axis]))), dims=[axis])
-                        y_ind = xr.DataArray([i] * len(x_ind), dims=[other_dim[0]])
-                        z_ind = xr.DataArray([j] * len(x_ind), dims=[other_dim[1]])
-                        # perform deconvolution on this one-dimensional piece
-                        deconv = deconvolve_rl(
-                            data=iteration1,
-                            psf=psf,
-                            n_iterations=n_iterations,
-                            axis=None,
-                            mode=mode,
-                        )
-                        # build results out of these pieces
-                        result[y_ind, z_ind, x_ind] = deconv.values
-            elif len(other_dim) >= 3:
-                # four- or higher-dimensional data
-                # TODO find way to compactify the different dimensionalities rather than having separate code
-                raise NotImplementedError("high-dimensional data not yet supported")
-
-        elif axis is None:
-            # crude attempt to perform multidimensional deconvolution. not clear if this is currently working
-            # TODO may be able to do this as a sequence of one-dimensional deconvolutions, assuming that the psf is separable (which I think it should be, if we assume it is a multivariate gaussian with principle axes aligned with the dimensions)
-            raise NotImplementedError("multi-dimensional convolutions not yet supported")
-
-            if not isinstance(arr, np.ndarray):
-                arr = arr.values
-
-            u = [arr]
-
-            for i in range(n_iterations):
-                c = scipy.ndimage.convolve(u[-1], psf, mode=mode)
-                u.append(
-                    u[-1] * scipy.ndimage.convolve(arr / c, np.flip(psf, None), mode=mode)
-                )  # careful about which axis (axes) to flip here...! need to explicitly specify for some versions of numpy
-
-            result = u[-1]
-    else:
-        if type(arr) is not np.ndarray:
-            arr = arr.values
+        if isinstance(sigma, dict):
+            psf = {d: make_psf1d(data=arr, dim=d, sigma=s) for d, s in sigma.items()}
+        elif axis is not None:
+            psf = make_psf1d(data=arr, dim=axis, sigma=sigma)
+
+    if psf is None:
+        raise ValueError("You must provide either a psf or sigma to deconvolve.")
+
+    if not isinstance(psf, (xr.DataArray, dict)):
+        psf = np.asarray(psf)
+        if psf.ndim != 1 and psf.ndim != len(arr.dims):
+            raise ValueError("An array PSF must be 1D or have the same dimensionality as the data.")
+        if psf.ndim == 1:
+            if axis is None and len(arr.dims) > 1:
+                raise ValueError("You must specify the axis for a 1D PSF.")
+            psf = xr.DataArray(psf, dims=[axis or arr.dims[0]])
+        else:
+            psf = xr.DataArray(psf, dims=arr.dims)
 
-        u = [arr]
+    kernels = _kernels_for(arr, psf)
+    values = arr.values.astype(np.float64)
 
-        for i in range(n_iterations):
-            c = scipy.ndimage.convolve(u[-1], psf, mode=mode)
-            u.append(
-                u[-1] * scipy.ndimage.convolve(arr / c, np.flip(psf, 0), mode=mode)
-            )  # not yet tested to ensure flip correct for asymmetric psf
-            # note: need to explicitly specify axis number in np.flip in lower versions of numpy
+    # dimensions along which no kernel blurs, which can be deconvolved independently
+    free_axes = [i for i in range(values.ndim) if all(k.shape[i] == 1 for k in kernels)]
 
-        if type(data) is np.ndarray:
-            result = u[-1].copy()
-        else:
-            result = normalize_to_spectrum(data).copy(deep=True)
-            result.values = u[-1]
+    if parallelize is None:
+        parallelize = values.size > PARALLEL_SIZE_THRESHOLD
 
-    try:
-        result = result.transpose(*arr.dims)
-    except:
-        pass
+    if parallelize and free_axes:
+        block_axis = max(free_axes, key=lambda i: values.shape[i])
+        n_blocks = min(os.cpu_count() or 1, values.shape[block_axis])
+        blocks = np.array_split(values, n_blocks, axis=block_axis)
 
-    return result
+        # scipy.fft releases the GIL, whereas scipy.ndimage does not in all supported versions
+        block_method = "fft" if method == "auto" else method
+
+        def deconvolve_block(block):
+            return _richardson_lucy(block, kernels, n_iterations, mode, block_method)
+
+        with ThreadPoolExecutor(max_workers=n_blocks) as executor:
+            deconvolved = list(executor.map(deconvolve_block, blocks))
+
+        deconvolved = np.concatenate(deconvolved, axis=block_axis)
+    else:
+        wrap_progress = lambda x, *args, **kwargs: x
+        if progress and values.ndim > 1:
+            wrap_progress = tqdm_notebook
+
+        deconvolved = _richardson_lucy(
+            values, kernels, n_iterations, mode, method, wrap_progress=wrap_progress
+        )
+
+    if isinstance(data, np.ndarray):
+        return deconvolved
+
+    return arr.copy(data=deconvolved)
 
 
 @update_provenance("Make 1D-Point Spread Function")
@@ -227,39 +287,30 @@ def make_psf1d(data: DataType, dim, sigma):
 
 
 @update_provenance("Make Point Spread Function")
-def make_psf(data: DataType, sigmas):
-    """Not yet operational; produces an n-dimensional gaussian point spread function for use in deconvolve_rl.
+def make_psf(data: DataType, sigmas: Dict[str, float]) -> xr.DataArray:
+    """Produces an n-dimensional gaussian point spread function for use in deconvolve_rl.
+
+    The PSF only spans the dimensions with a nonzero width, along all other dimensions
+    it acts as the identity.
 
     Args:
-        data
-        dim
-        sigma
+        data: The data the PSF will be applied to, which determines the sampling.
+        sigmas: The Gaussian width along each dimension.
 
     Returns:
         The PSF to use.
     """
-    raise NotImplementedError
-
     arr = normalize_to_spectrum(data)
-    dims = arr.dims
 
-    psf = arr.copy(deep=True) * 0 + 1
-
-    for dim in dims:
-        other_dims = list(arr.dims)
-        other_dims.remove(dim)
+    psf = None
+    for dim, sigma in sigmas.items():
+        if sigma == 0:
+            continue
 
-        psf1d = arr.copy(deep=True) * 0 + 1
-        for od in other_dims:
-            psf1d = psf1d[{od: 0}]
+        psf1d = make_psf1d(arr, dim, sigma)
+        psf = psf1d if psf is None else psf * psf1d
 
-        if sigmas[dim] == 0:
-            # TODO may need to do subpixel correction for when the dimension has an even length
-            psf1d = psf1d * 0
-            # psf1d[{dim:np.mean(psf1d.coords[dim])}] = 1
-            psf1d[{dim: len(psf1d.coords[dim]) / 2}] = 1
-        else:
-            psf1d = psf1d * gaussian(psf1d.coords[dim], np.mean(psf1d.coords[dim]), sigmas[dim])
+    if psf is None:
+        raise ValueError("At least one nonzero width is required to make a PSF.")
 
-        psf = psf * psf1d
     return psf
@@ -1,13 +1,23 @@
-"""Derivative, curvature, and minimum gradient analysis."""
+"""Derivative, curvature, and minimum gradient analysis.
+
+Curvature and minimum gradient analysis are computed by fused numba kernels which
+evaluate all of the derivatives they need pointwise, rather than materializing each
+of them as a full size array. Both operate on stacks of 2D cuts, so that every cut
+of a volume can be processed at once with memory use on the order of the input.
+"""
 import functools
 import warnings
+from typing import Dict, Optional, Tuple
 
+import numba
 import numpy as np
 
 import xarray as xr
+from arpes.analysis.filters import gaussian_filter_values
 from arpes.provenance import provenance, update_provenance
 from arpes.typing import DataType
 from arpes.utilities import normalize_to_spectrum
+from arpes.utilities.jit import kernel
 
 __all__ = (
     "curvature",
@@ -58,36 +68,209 @@ def vector_diff(arr: np.ndarray, delta, n=1):
     return arr[slice1] - arr[slice2]
 
 
+def _stack_examples(dtype):
+    return [(np.zeros((2, 4, 4), dtype=dtype),)]
+
+
+def _curvature_examples(dtype):
+    values = np.zeros((2, 4, 4), dtype=dtype)
+    return [(values, np.zeros_like(values), 1.0, 1.0, 1.0, 1.0)]
+
+
+def _gradient_modulus_examples(dtype):
+    values = np.zeros((2, 4, 4), dtype=dtype)
+    return [(values, np.zeros_like(values), 1, False)]
+
+
+@kernel()
+def _finite(value):
+    """Scalar ``np.nan_to_num``."""
+    if np.isnan(value):
+        return 0.0
+    if np.isinf(value):
+        return np.finfo(np.float64).max if value > 0 else -np.finfo(np.float64).max
+    return value
+
+
+@kernel()
+def _gradient_x(values, k, i, j):
+    """``np.gradient`` along axis 1 of a stack of cuts, in index units, at a single point."""
+    n = values.shape[1]
+    if i == 0:
+        return float(values[k, 1, j]) - float(values[k, 0, j])
+    if i == n - 1:
+        return float(values[k, n - 1, j]) - float(values[k, n - 2, j])
+    return (float(values[k, i + 1, j]) - float(values[k, i - 1, j])) / 2
+
+
+@kernel()
+def _gradient_y(values, k, i, j):
+    """``np.gradient`` along axis 2 of a stack of cuts, in index units, at a single point."""
+    n = values.shape[2]
+    if j == 0:
+        return float(values[k, i, 1]) - float(values[k, i, 0])
+    if j == n - 1:
+        return float(values[k, i, n - 1]) - float(values[k, i, n - 2])
+    return (float(values[k, i, j + 1]) - float(values[k, i, j - 1])) / 2
+
+
+@kernel(parallel=True, examples=_stack_examples)
+def _gradient_maxima(values):
+    """The largest absolute first derivatives along either axis of each row of a stack of cuts."""
+    n_cuts, nx, ny = values.shape
+    maxima = np.zeros((n_cuts * nx, 2))
+    for row in numba.prange(n_cuts * nx):
+        k, i = row // nx, row % nx
+        for j in range(ny):
+            maxima[row, 0] = max(maxima[row, 0], abs(_finite(_gradient_x(values, k, i, j))))
+            maxima[row, 1] = max(maxima[row, 1], abs(_finite(_gradient_y(values, k, i, j))))
+
+    return maxima
+
+
+@kernel(parallel=True, examples=_curvature_examples)
+def _curvature(values, out, dx, dy, cx, cy):
+    """Computes curvature over a stack of cuts, see `curvature` for the definition.
+
+    First derivatives are evaluated where they are needed rather than stored, and
+    second derivatives follow ``np.gradient`` applied to the (NaN zeroed) first derivatives.
+    """
+    n_cuts, nx, ny = values.shape
+    for row in numba.prange(n_cuts * nx):
+        k, i = row // nx, row % nx
+        i_low, i_high = max(i - 1, 0), min(i + 1, nx - 1)
+
+        for j in range(ny):
+            j_low, j_high = max(j - 1, 0), min(j + 1, ny - 1)
+
+            dfx = _finite(_gradient_x(values, k, i, j) / dx)
+            dfy = _finite(_gradient_y(values, k, i, j) / dy)
+
+            d2fx = (
+                _finite(_gradient_x(values, k, i_high, j) / dx)
+                - _finite(_gradient_x(values, k, i_low, j) / dx)
+            ) / ((i_high - i_low) * dx)
+            d2fy = (
+                _finite(_gradient_y(values, k, i, j_high) / dy)
+                - _finite(_gradient_y(values, k, i, j_low) / dy)
+            ) / ((j_high - j_low) * dy)
+            d2fxy = (
+                _finite(_gradient_x(values, k, i, j_high) / dx)
+                - _finite(_gradient_x(values, k, i, j_low) / dx)
+            ) / ((j_high - j_low) * dy)
+
+            denom = (1 + cx * dfx ** 2 + cy * dfy ** 2) ** 1.5
+            numerator = (
+                (1 + cx * dfx ** 2) * cy * d2fy
+                - 2 * cx * cy * dfx * dfy * d2fxy
+                + (1 + cy * dfy ** 2) * cx * d2fx
+            )
+            out[k, i, j] = numerator / denom
+
+
+@kernel(parallel=True, examples=_gradient_modulus_examples)
+def _gradient_modulus(values, out, delta, normalize):
+    """The norm of the differences to the eight neighbors at distance `delta` over a stack of cuts.
+
+    If `normalize` is set, the values are divided by this modulus instead, as for minimum
+    gradient analysis, with NaNs replaced by zero.
+    """
+    n_cuts, nx, ny = values.shape
+    for row in numba.prange(n_cuts * nx):
+        k, i = row // nx, row % nx
+        for j in range(ny):
+            center = float(values[k, i, j])
+            total = 0.0
+            for a in (-delta, 0, delta):
+                for b in (-delta, 0, delta):
+                    if (a == 0 and b == 0) or not (0 <= i + a < nx and 0 <= j + b < ny):
+                        continue
+                    total += (float(values[k, i + a, j + b]) - center) ** 2
+
+            modulus = np.sqrt(total)
+            if normalize:
+                result = center / modulus
+                out[k, i, j] = 0.0 if np.isnan(result) else result
+            else:
+                out[k, i, j] = modulus
+
+
+def _as_stack(values: np.ndarray, axes: Tuple[int, int]) -> np.ndarray:
+    """Views (or copies) `values` as a stack of the 2D cuts spanned by `axes`."""
+    moved = np.moveaxis(values, axes, (-2, -1))
+    return moved.reshape((-1,) + moved.shape[-2:])
+
+
+def _from_stack(stack: np.ndarray, values: np.ndarray, axes: Tuple[int, int]) -> np.ndarray:
+    moved_shape = np.moveaxis(values, axes, (-2, -1)).shape
+    return np.moveaxis(stack.reshape(moved_shape), (-2, -1), axes)
+
+
+def _smoothed_stack(
+    arr: xr.DataArray, directions: Tuple[str, str], smooth: Optional[Dict[str, float]]
+) -> np.ndarray:
+    """The stack of cuts along `directions`, Gaussian smoothed one cut at a time if requested.
+
+    `smooth` gives sigma in coordinate units, which need not be a whole number of pixels.
+    """
+    axes = tuple(arr.dims.index(d) for d in directions)
+    stack = _as_stack(arr.values, axes)
+    if not smooth:
+        return stack
+
+    sigma = [abs(smooth.get(d, 0) / float(arr.coords[d][1] - arr.coords[d][0])) for d in directions]
+    dtype = arr.dtype if np.issubdtype(arr.dtype, np.floating) else np.float64
+    smoothed = np.empty(stack.shape, dtype=dtype)
+    for k in range(len(stack)):
+        gaussian_filter_values(stack[k], sigma, out=smoothed[k])
+
+    return smoothed
+
+
+def _output_like(values: np.ndarray) -> np.ndarray:
+    dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+    return np.empty(values.shape, dtype=dtype)
+
+
 @update_provenance("Minimum Gradient")
-def minimum_gradient(data: DataType, delta=1):
-    """Implements the minimum gradient approach to defining the band in a diffuse spectrum."""
+def minimum_gradient(data: DataType, delta=1, smooth: Optional[Dict[str, float]] = None):
+    """Implements the minimum gradient approach to defining the band in a diffuse spectrum.
+
+    The gradient is taken over the first two dimensions, independently for every cut
+    along any others. If `smooth` is provided, each cut is first Gaussian smoothed with
+    sigma given in coordinate units.
+    """
     arr = normalize_to_spectrum(data)
-    new = arr / gradient_modulus(arr, delta=delta)
-    new.values[np.isnan(new.values)] = 0
-    return new
+    directions = arr.dims[:2]
+    stack = _smoothed_stack(arr, directions, smooth)
+
+    out = _output_like(stack)
+    _gradient_modulus(stack, out, delta, True)
+
+    axes = tuple(arr.dims.index(d) for d in directions)
+    return xr.DataArray(_from_stack(out, arr.values, axes), arr.coords, arr.dims, attrs=arr.attrs)
 
 
 @update_provenance("Gradient Modulus")
 def gradient_modulus(data: DataType, delta=1):
     spectrum = normalize_to_spectrum(data)
-    values = spectrum.values
-    gradient_vector = np.zeros(shape=(8,) + values.shape)
-
-    gradient_vector[0, :-delta, :] = vector_diff(values, (delta, 0))
-    gradient_vector[1, :, :-delta] = vector_diff(values, (0, delta))
-    gradient_vector[2, delta:, :] = vector_diff(values, (-delta, 0))
-    gradient_vector[3, :, delta:] = vector_diff(values, (0, -delta))
-    gradient_vector[4, :-delta, :-delta] = vector_diff(values, (delta, delta))
-    gradient_vector[5, :-delta, delta:] = vector_diff(values, (delta, -delta))
-    gradient_vector[6, delta:, :-delta] = vector_diff(values, (-delta, delta))
-    gradient_vector[7, delta:, delta:] = vector_diff(values, (-delta, -delta))
-
-    data_copy = spectrum.copy(deep=True)
-    data_copy.values = np.linalg.norm(gradient_vector, axis=0)
+    stack = _as_stack(spectrum.values, (0, 1))
+
+    out = _output_like(stack)
+    _gradient_modulus(stack, out, delta, False)
+
+    data_copy = spectrum.copy(deep=False)
+    data_copy.values = _from_stack(out, spectrum.values, (0, 1))
     return data_copy
 
 
-def curvature(arr: xr.DataArray, directions=None, alpha=1, beta=None):
+def curvature(
+    arr: xr.DataArray,
+    directions=None,
+    alpha=1,
+    beta=None,
+    smooth: Optional[Dict[str, float]] = None,
+):
     r"""Provides "curvature" analysis for band locations.
 
     Defined via
@@ -122,10 +305,18 @@ def curvature(arr: xr.DataArray, directions=None, alpha=1, beta=None):
 
     for some dimensionless parameter :math:`\alpha`.
 
+    Data with more than two dimensions is treated as a stack of cuts along `directions`,
+    all of which are analyzed at once. The maximal gradients above are taken over the
+    whole stack.
+
     Args:
         arr
+        directions: The two dimensions to take derivatives along, by default the first two.
         alpha: regulation parameter, chosen semi-universally, but with
             no particular justification
+        beta: If provided, sets alpha to 10 ** beta.
+        smooth: Gaussian smoothing sigma for each of `directions` in coordinate units,
+            applied to each cut before differentiating.
 
     Returns:
         The curvature of the intensity of the original data.
@@ -136,31 +327,24 @@ def curvature(arr: xr.DataArray, directions=None, alpha=1, beta=None):
     if directions is None:
         directions = arr.dims[:2]
 
+    directions = tuple(directions)
     axis_indices = tuple(arr.dims.index(d) for d in directions)
     dx, dy = tuple(float(arr.coords[d][1] - arr.coords[d][0]) for d in directions)
-    dfx, dfy = np.gradient(arr.values, dx, dy, axis=axis_indices)
-    np.nan_to_num(dfx, copy=False)
-    np.nan_to_num(dfy, copy=False)
 
-    mdfdx, mdfdy = np.max(np.abs(dfx)), np.max(np.abs(dfy))
+    stack = _smoothed_stack(arr, directions, smooth)
+    maxima = _gradient_maxima(stack).max(axis=0)
+    mdfdx, mdfdy = maxima[0] / abs(dx), maxima[1] / abs(dy)
 
     cy = (dy / dx) * (mdfdx ** 2 + mdfdy ** 2) * alpha
     cx = (dx / dy) * (mdfdx ** 2 + mdfdy ** 2) * alpha
 
-    dfx_2, dfy_2 = np.power(dfx, 2), np.power(dfy, 2)
-    d2fy = np.gradient(dfy, dy, axis=axis_indices[1])
-    d2fx = np.gradient(dfx, dx, axis=axis_indices[0])
-    d2fxy = np.gradient(dfx, dy, axis=axis_indices[1])
+    out = _output_like(stack)
+    _curvature(stack, out, dx, dy, cx, cy)
 
-    denom = np.power((1 + cx * dfx_2 + cy * dfy_2), 1.5)
-    numerator = (
-        (1 + cx * dfx_2) * cy * d2fy
-        - 2 * cx * cy * dfx * dfy * d2fxy
-        + (1 + cy * dfy_2) * cx * d2fx
+    curv = xr.DataArray(
+        _from_stack(out, arr.values, axis_indices), arr.coords, arr.dims, attrs=arr.attrs
     )
 
-    curv = xr.DataArray(numerator / denom, arr.coords, arr.dims, attrs=arr.attrs)
-
     if "id" in curv.attrs:
         del curv.attrs["id"]
         provenance(
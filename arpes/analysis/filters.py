@@ -1,52 +1,252 @@
-"""Provides coordinate aware filters and smoothing."""
-import copy
+"""Provides coordinate aware filters and smoothing.
 
+Gaussian smoothing is separable, and is applied one axis at a time with one of
+three methods:
+
+1. "direct": ``scipy.ndimage`` convolution by the truncated kernel, whose cost grows with sigma
+2. "fft": convolution by the same truncated kernel through FFTs, for very wide kernels
+3. "recursive": the Young-van Vliet recursive approximation, whose cost is independent of sigma
+
+The direct and FFT methods agree to rounding error. The recursive method approximates the
+Gaussian: on white noise in [0, 1] it differs from the direct method by up to about 0.05 at
+sigma = 1 pixel, 0.01 at sigma = 3 and less for wider kernels, and by much less on smooth data.
+It is only defined for sigma of at least ``RECURSIVE_MIN_SIGMA`` pixels.
+
+Very large arrays (including memory mapped ones) are filtered in slabs along their first axis
+with overlapping halos.
+"""
+import math
+from typing import Optional, Tuple, Union
+
+import numba
 import numpy as np
+import scipy.signal
 from scipy import ndimage
 
 import xarray as xr
 from arpes.provenance import provenance
+from arpes.utilities.jit import kernel
 
 __all__ = (
     "gaussian_filter_arr",
     "gaussian_filter",
     "boxcar_filter_arr",
     "boxcar_filter",
+    "gaussian_filter_values",
 )
 
+# Kernels wider than this many pixels on either side are applied by FFT rather than directly
+FFT_RADIUS_THRESHOLD = 64
+
+# Arrays larger than this many bytes are filtered in overlapping slabs along their first axis
+FILTER_BLOCK_SIZE = 2 ** 28
+
+# Gaussian kernels are truncated at this many standard deviations, as in ``scipy.ndimage``
+TRUNCATE = 4.0
+
+# The smallest sigma in pixels covered by the published fit of the recursive coefficients
+RECURSIVE_MIN_SIGMA = 0.5
+
+
+def _recursive_examples(dtype):
+    values = np.zeros((2, 8, 3), dtype=dtype)
+    return [(values, values.copy(), 0.5, -0.1, 0.01)]
+
+
+def _recursive_coefficients(sigma: float) -> Tuple[float, float, float]:
+    """Feedback coefficients of the Young-van Vliet recursive Gaussian for a given sigma.
 
-def gaussian_filter_arr(arr: xr.DataArray, sigma=None, n=1, default_size=1) -> xr.DataArray:
+    These follow the published fit, which matches the shape of the Gaussian closely in
+    the core, at the expense of slightly heavier tails. The fit is least accurate for small
+    sigma, and does not extend below ``RECURSIVE_MIN_SIGMA``.
+    """
+    if sigma < RECURSIVE_MIN_SIGMA:
+        raise ValueError(
+            f"The recursive Gaussian requires sigma of at least {RECURSIVE_MIN_SIGMA} pixels, "
+            f"got {sigma}. Use the direct method for narrower kernels."
+        )
+
+    if sigma < 2.5:
+        q = 3.97156 - 4.14554 * math.sqrt(1 - 0.26891 * sigma)
+    else:
+        q = 0.98711 * sigma - 0.96330
+
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    b1 = (2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3) / b0
+    b2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3) / b0
+    b3 = (0.422205 * q ** 3) / b0
+    return b1, b2, b3
+
+
+@kernel(parallel=True, examples=_recursive_examples)
+def _recursive_gaussian(values, out, b1, b2, b3):
+    """Young-van Vliet recursive Gaussian along axis 1 of a 3D array.
+
+    The filter is a causal followed by an anticausal third order IIR filter whose coefficients
+    depend on sigma but whose cost does not, see `_recursive_coefficients`. Boundaries are
+    initialized to the steady state of the edge values, which is similar to the "nearest"
+    boundary mode. `out` may be `values`.
+    """
+    gain = 1 - (b1 + b2 + b3)
+
+    n_outer, n, n_inner = values.shape
+    for outer in numba.prange(n_outer):
+        w = np.empty((n, n_inner))
+        for inner in range(n_inner):
+            w1 = w2 = w3 = float(values[outer, 0, inner])
+            for i in range(n):
+                w0 = gain * values[outer, i, inner] + b1 * w1 + b2 * w2 + b3 * w3
+                w[i, inner] = w0
+                w1, w2, w3 = w0, w1, w2
+
+            y1 = y2 = y3 = w[n - 1, inner]
+            for i in range(n - 1, -1, -1):
+                y0 = gain * w[i, inner] + b1 * y1 + b2 * y2 + b3 * y3
+                out[outer, i, inner] = y0
+                y1, y2, y3 = y0, y1, y2
+
+
+def _gaussian_kernel1d(sigma: float, radius: int) -> np.ndarray:
+    x = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 * (x / sigma) ** 2)
+    return weights / weights.sum()
+
+
+def _filter_axis(values: np.ndarray, out: np.ndarray, axis: int, sigma: float, method: str):
+    """Applies a 1D Gaussian along `axis` of `values`, writing into `out`, which may be `values`."""
+    radius = int(TRUNCATE * sigma + 0.5)
+    if method == "auto":
+        method = "fft" if radius > FFT_RADIUS_THRESHOLD else "direct"
+
+    if method == "direct":
+        ndimage.gaussian_filter1d(values, sigma, axis=axis, output=out, truncate=TRUNCATE)
+    elif method == "fft":
+        pad_width = [(0, 0)] * values.ndim
+        pad_width[axis] = (radius, radius)
+        padded = np.pad(values, pad_width, mode="symmetric")
+        weights = _gaussian_kernel1d(sigma, radius).reshape(
+            [-1 if i == axis else 1 for i in range(values.ndim)]
+        )
+        out[...] = scipy.signal.fftconvolve(padded, weights, mode="valid", axes=[axis])
+    elif method == "recursive":
+        shape = (int(np.prod(values.shape[:axis])), values.shape[axis], -1)
+        coefficients = _recursive_coefficients(sigma)
+        if out.flags.c_contiguous:
+            _recursive_gaussian(values.reshape(shape), out.reshape(shape), *coefficients)
+        else:
+            filtered = np.empty(values.reshape(shape).shape, dtype=out.dtype)
+            _recursive_gaussian(values.reshape(shape), filtered, *coefficients)
+            out[...] = filtered.reshape(values.shape)
+    else:
+        raise ValueError(
+            f"Unknown filter method {method}, expected direct, fft, recursive or auto."
+        )
+
+
+def _filter_in_memory(values: np.ndarray, out: np.ndarray, sigma: Tuple[float, ...], method: str):
+    source = values
+    for axis, s in enumerate(sigma):
+        if s > 1e-15:
+            _filter_axis(source, out, axis, s, method)
+            source = out
+
+    if source is values and out is not values:
+        out[...] = values
+
+
+def gaussian_filter_values(
+    values: np.ndarray,
+    sigma: Tuple[float, ...],
+    method: str = "auto",
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Gaussian filters an array with (fractional) sigma in pixels along each axis.
+
+    Args:
+        values: The array to filter, which may be memory mapped.
+        sigma: The standard deviation of the Gaussian along each axis, in pixels.
+        method: One of "direct", "fft", "recursive" or "auto". "auto" uses "fft" along axes
+          where the kernel is wider than ``FFT_RADIUS_THRESHOLD`` pixels, and "direct" elsewhere.
+          "recursive" is approximate, particularly for sigma of a few pixels or less, see the
+          module documentation.
+        out: Where to write the output, which may be `values` itself to filter in place.
+          Floating point inputs are filtered in their own precision, others in double precision.
+
+    Returns:
+        The filtered array, `out` if it was provided.
+    """
+    if out is None:
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+        out = np.empty(values.shape, dtype=dtype)
+
+    if values.nbytes <= FILTER_BLOCK_SIZE or values.ndim < 2:
+        _filter_in_memory(np.asarray(values), out, sigma, method)
+        return out
+
+    # overlapping slabs along the first axis, the halo covers the kernel (or most of the
+    # impulse response for recursive filters) so that slab interiors are unaffected by the cut
+    n = values.shape[0]
+    halo = int(TRUNCATE * sigma[0] + 0.5) + 1 if sigma[0] > 1e-15 else 0
+    step = max(FILTER_BLOCK_SIZE // (values.nbytes // n) - 2 * halo, 1)
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        read_from, read_to = max(start - halo, 0), min(stop + halo, n)
+
+        slab = np.array(values[read_from:read_to], dtype=out.dtype)
+        _filter_in_memory(slab, slab, sigma, method)
+        out[start:stop] = slab[start - read_from : stop - read_from]
+
+    return out
+
+
+def _sigma_in_pixels(arr: xr.DataArray, sigma: Optional[dict], default_size) -> Tuple[float, ...]:
+    sigma = sigma or {}
+    return tuple(
+        abs(float(sigma[d]) / float(arr.coords[d][1] - arr.coords[d][0]))
+        if d in sigma
+        else default_size
+        for d in arr.dims
+    )
+
+
+def gaussian_filter_arr(
+    arr: xr.DataArray,
+    sigma=None,
+    n=1,
+    default_size=1,
+    method: str = "auto",
+    out: Optional[Union[xr.DataArray, np.ndarray]] = None,
+) -> xr.DataArray:
     """Coordinate aware `scipy.ndimage.filters.gaussian_filter`.
 
     Args:
         arr
         sigma: Kernel sigma, specified in terms of axis units. An axis that is not specified
-          will have a kernel width of `default_size` in index units.
-        n: Repeats n times.
+          will have a kernel width of `default_size` in index units. Sigma need not be a whole
+          number of pixels.
+        n: Repeats n times. Because repeated Gaussian filters compose, this is performed as a
+          single pass with sigma scaled by sqrt(n).
         default_size: Changes the default kernel width for axes not specified in `sigma`. Changing this
           parameter and leaving `sigma` as None allows you to smooth with an even-width
           kernel in index-coordinates.
+        method: How to apply the filter, see `gaussian_filter_values`.
+        out: Optionally, an array (or DataArray) to write the output into. This can be `arr`
+          itself to filter in place.
 
     Returns:
         Smoothed data.
     """
-    if sigma is None:
-        sigma = {}
-
-    sigma = {k: int(v / (arr.coords[k][1] - arr.coords[k][0])) for k, v in sigma.items()}
-    for dim in arr.dims:
-        if dim not in sigma:
-            sigma[dim] = default_size
+    sigma = tuple(s * math.sqrt(n) for s in _sigma_in_pixels(arr, sigma, default_size))
 
-    sigma = tuple(sigma[k] for k in arr.dims)
+    out_values = out.values if isinstance(out, xr.DataArray) else out
+    values = gaussian_filter_values(arr.data, sigma, method=method, out=out_values)
 
-    values = arr.values
-    for _ in range(n):
-        values = ndimage.filters.gaussian_filter(values, sigma)
-
-    filtered_arr = xr.DataArray(values, arr.coords, arr.dims, attrs=copy.deepcopy(arr.attrs))
+    if isinstance(out, xr.DataArray):
+        filtered_arr = out
+    else:
+        filtered_arr = xr.DataArray(values, arr.coords, arr.dims, attrs=dict(arr.attrs))
 
-    if "id" in filtered_arr.attrs:
+    if "id" in filtered_arr.attrs and filtered_arr is not arr:
         del filtered_arr.attrs["id"]
 
         provenance(
@@ -117,32 +317,25 @@ def boxcar_filter_arr(
     Returns:
         smoothed data.
     """
-    if size is None:
-        size = {}
-
-    size = {k: int(v / (arr.coords[k][1] - arr.coords[k][0])) for k, v in size.items()}
-    for dim in arr.dims:
-        if dim not in size:
-            size[dim] = default_size
+    size = tuple(max(int(round(s)), 1) for s in _sigma_in_pixels(arr, size, default_size))
 
-    size = tuple(size[k] for k in arr.dims)
+    dtype = arr.dtype if np.issubdtype(arr.dtype, np.floating) else np.float64
+    values = np.array(arr.values, dtype=dtype)
 
     if skip_nan:
-        nan_mask = np.copy(arr.values) * 0 + 1
-        nan_mask[arr.values != arr.values] = 0
-        filtered_mask = ndimage.filters.uniform_filter(nan_mask, size)
-
-        values = np.copy(arr.values)
-        values[values != values] = 0
+        nan_mask = np.isnan(values)
+        filtered_mask = ndimage.uniform_filter((~nan_mask).astype(dtype), size)
+        values[nan_mask] = 0
 
         for _ in range(n):
-            values = ndimage.filters.uniform_filter(values, size) / filtered_mask
-            values[nan_mask == 0] = 0
+            ndimage.uniform_filter(values, size, output=values)
+            values /= filtered_mask
+            values[nan_mask] = 0
     else:
-        for i in range(n):
-            values = ndimage.filters.uniform_filter(values, size)
+        for _ in range(n):
+            ndimage.uniform_filter(values, size, output=values)
 
-    filtered_arr = xr.DataArray(values, arr.coords, arr.dims, attrs=copy.deepcopy(arr.attrs))
+    filtered_arr = xr.DataArray(values, arr.coords, arr.dims, attrs=dict(arr.attrs))
 
     if "id" in arr.attrs:
         del filtered_arr.attrs["id"]
@@ -1,5 +1,6 @@
 """Utilities for gap fitting in ARPES, contains tools to normalize by Fermi-Dirac occupation."""
 import warnings
+from typing import Optional
 
 import numpy as np
 
@@ -9,8 +10,14 @@ from arpes.fits.fit_models import AffineBroadenedFD
 from arpes.provenance import update_provenance
 from arpes.typing import DataType
 from arpes.utilities import normalize_to_spectrum
+from arpes.utilities.math import shift_by
 
-__all__ = ("normalize_by_fermi_dirac", "determine_broadened_fermi_distribution", "symmetrize")
+__all__ = (
+    "normalize_by_fermi_dirac",
+    "determine_broadened_fermi_distribution",
+    "symmetrize",
+    "shift_energy",
+)
 
 
 def determine_broadened_fermi_distribution(reference_data: DataType, fixed_temperature=True):
@@ -153,53 +160,75 @@ def normalize_by_fermi_dirac(
     return divided
 
 
-def _shift_energy_interpolate(data: DataType, shift=None):
-    if shift is not None:
-        pass
-        # raise NotImplementedError("arbitrary shift not yet implemented")
+def _per_trace(data: xr.DataArray, value) -> np.ndarray:
+    """Broadcasts a scalar, array, or DataArray to one value per trace along the energy axis."""
+    other_dims = [d for d in data.dims if d != "eV"]
+    if isinstance(value, xr.DataArray):
+        value = value.broadcast_like(data.isel(eV=0)).transpose(*other_dims).values
 
-    data = normalize_to_spectrum(data).S.transpose_to_front("eV")
-
-    new_data = data.copy(deep=True)
-    new_axis = new_data.coords["eV"]
-    new_values = new_data.values * 0
-
-    if shift is None:
-        closest_to_zero = data.coords["eV"].sel(eV=0, method="nearest")
-        shift = -closest_to_zero
-
-    stride = data.G.stride("eV", generic_dim_names=False)
-
-    if np.abs(shift) >= stride:
-        n_strides = int(shift / stride)
-        new_axis = new_axis + n_strides * stride
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), [data.sizes[d] for d in other_dims])
 
-        shift = shift - stride * n_strides
 
-    new_axis = new_axis + shift
+@update_provenance("Shift Energy")
+def shift_energy(
+    data: DataType, shift, cval=np.nan, out: Optional[np.ndarray] = None
+) -> xr.DataArray:
+    """Shifts every energy distribution curve in `data` along the energy axis.
 
-    weight = float(shift / stride)
+    Spectral features at an energy E move to E + `shift`, while the energy coordinate is unchanged.
+    All traces are resampled with linear interpolation in a single pass, so that per angle or per
+    temperature corrections do not require looping over the data.
 
-    new_values = new_values + data.values * (1 - weight)
-    if shift > 0:
-        new_values[1:] = new_values[1:] + data.values[:-1] * weight
-    if shift < 0:
-        new_values[:-1] = new_values[:-1] + data.values[1:] * weight
+    Args:
+        data: Input array.
+        shift: The shift in eV. Either a scalar, an array with one shift per trace which broadcasts
+            against the non-energy dimensions of `data` in order, or a DataArray over any of them.
+        cval: The value given to energies shifted in from outside of the data.
+        out: An optional array with the shape of `data` to write into. Passing ``data.values``
+            shifts the data in place.
 
-    new_data.coords["eV"] = new_axis
-    new_data.values = new_values
+    Returns:
+        The shifted data.
+    """
+    data = normalize_to_spectrum(data)
+    energy_axis = data.dims.index("eV")
+
+    values = data.values
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+
+    shifted = shift_by(
+        values,
+        _per_trace(data, shift) / data.G.stride("eV", generic_dim_names=False),
+        axis=energy_axis,
+        by_axis=tuple(i for i in range(data.ndim) if i != energy_axis),
+        order=1,
+        cval=cval,
+        out=out,
+    )
 
-    return new_data
+    return xr.DataArray(shifted, data.coords, data.dims, attrs=data.attrs.copy())
 
 
 @update_provenance("Symmetrize")
-def symmetrize(data: DataType, subpixel=False, full_spectrum=False):
+def symmetrize(
+    data: DataType,
+    subpixel=False,
+    full_spectrum=False,
+    shift=None,
+    out: Optional[np.ndarray] = None,
+):
     """Symmetrizes data across the chemical potential.
 
     This provides a crude tool by which
     gap analysis can be performed. In this implementation, subpixel accuracy is achieved by
     interpolating data.
 
+    Every trace along the energy axis is symmetrized at once, so whole stacks, such as a
+    temperature series of EDCs at kF, can be symmetrized in one call. If the chemical potential
+    varies from trace to trace, pass the per trace correction as `shift`, which is applied together
+    with the subpixel correction in a single resampling pass.
+
     Args:
         data: Input array.
         subpixel: Enable subpixel correction
@@ -207,38 +236,51 @@ def symmetrize(data: DataType, subpixel=False, full_spectrum=False):
             potential. By default, only the bound part of the spectrum
             (below the chemical potential) is returned, because the
             other half is identical.
+        shift: An energy shift applied to each trace before symmetrizing, typically minus the
+            chemical potential of each trace. See `shift_energy` for the accepted values.
+        out: An optional array to write the result into, with the energy axis first and the
+            shape of the result.
 
     Returns:
         The symmetrized data.
     """
     data = normalize_to_spectrum(data).S.transpose_to_front("eV")
 
-    if subpixel or full_spectrum:
-        data = _shift_energy_interpolate(data)
-
-    above = data.sel(eV=slice(0, None))
-    below = data.sel(eV=slice(None, 0)).copy(deep=True)
-
-    l = len(above.coords["eV"])
+    if full_spectrum and not subpixel:
+        warnings.warn("full spectrum symmetrization uses subpixel correction")
 
-    zeros = below.values * 0
-    zeros[-l:] = above.values[::-1]
+    energy = data.coords["eV"].values.copy()
+    stride = data.G.stride("eV", generic_dim_names=False)
+    closest_to_zero = np.argmin(np.abs(energy))
 
-    below.values = below.values + zeros
+    snap = 0
+    if subpixel or full_spectrum:
+        # resample onto a grid containing the chemical potential exactly
+        snap = -energy[closest_to_zero]
+        energy = energy + snap
+        energy[closest_to_zero] = 0
 
-    if full_spectrum:
-        if not subpixel:
-            warnings.warn("full spectrum symmetrization uses subpixel correction")
+    values = data.values
+    if shift is not None or snap:
+        shifts = _per_trace(data, 0 if shift is None else shift) - snap
+        values = shift_energy(data, shifts, cval=0).values
 
-        full_data = below.copy(deep=True)
+    below = np.searchsorted(energy, 0, side="right")
+    above = np.searchsorted(energy, 0, side="left")
+    n_mirrored = min(below, len(energy) - above)
 
-        new_above = full_data.copy(deep=True)[::-1]
-        new_above.coords["eV"] = new_above.coords["eV"] * -1
+    n_energy = 2 * below - 1 if full_spectrum else below
+    if out is None:
+        out = np.empty((n_energy,) + values.shape[1:], dtype=values.dtype)
 
-        full_data = xr.concat([full_data, new_above[1:]], dim="eV")
+    out[:below] = values[:below]
+    out[below - n_mirrored : below] += values[above : above + n_mirrored][::-1]
 
-        result = full_data
-    else:
-        result = below
+    energy = energy[:below]
+    if full_spectrum:
+        out[below:] = out[: below - 1][::-1]
+        energy = np.concatenate([energy, -energy[:-1][::-1]])
 
-    return result
+    coords = {k: v for k, v in data.coords.items() if "eV" not in v.dims}
+    coords["eV"] = energy
+    return xr.DataArray(out, coords, data.dims, attrs=data.attrs.copy())
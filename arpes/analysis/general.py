@@ -1,8 +1,6 @@
 """Some general purpose analysis routines otherwise defying categorization."""
-import itertools
-from collections import defaultdict
-
 import numpy as np
+import scipy.sparse
 
 import arpes.constants
 import arpes.models.band
@@ -159,6 +157,154 @@ def condense(data: xr.DataArray):
     return data
 
 
+# Upper bound in bytes on the size of input slabs which are read at once when rebinning
+REBIN_BLOCK_SIZE = 2 ** 27
+
+
+def _rebinning_matrix(edges: np.ndarray, n: int) -> scipy.sparse.csr_matrix:
+    """Builds the sparse matrix averaging input pixels into the bins between `edges`.
+
+    Edges are given in index space, where input pixel ``i`` covers ``[i, i + 1)``. Pixels
+    contribute in proportion to their overlap with each bin, and each bin is normalized by
+    its total overlap, so that fractional bins conserve flux. Bins which do not overlap the
+    data at all are NaN.
+    """
+    edges = np.clip(edges, 0, n)
+    low, high = np.minimum(edges[:-1], edges[1:]), np.maximum(edges[:-1], edges[1:])
+    first = np.floor(low).astype(int)
+    last = np.maximum(np.ceil(high).astype(int), first + 1)
+    counts = last - first
+
+    rows = np.repeat(np.arange(len(low)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = np.minimum(first[rows] + offsets, n - 1)
+
+    weights = np.clip(np.minimum(cols + 1, high[rows]) - np.maximum(cols, low[rows]), 0, None)
+    totals = np.bincount(rows, weights=weights, minlength=len(low))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = weights / totals[rows]
+
+    return scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(len(low), n))
+
+
+def _rebinning_target(coord: np.ndarray, reduction=None, shape=None):
+    """Determines bin edges (in index space) and new coordinates for one dimension.
+
+    Exactly one of `reduction` and `shape` should be provided. `shape` is either the number
+    of bins or an array of new bin centers.
+    """
+    n = len(coord)
+    index = np.arange(n)
+
+    if shape is not None and not np.isscalar(shape):
+        new_coord = np.asarray(shape, dtype=np.float64)
+        order = slice(None) if n < 2 or coord[-1] > coord[0] else slice(None, None, -1)
+        as_index = lambda c: np.interp(c, coord[order], index[order])
+
+        midpoints = (new_coord[1:] + new_coord[:-1]) / 2
+        first = new_coord[0] - (midpoints[0] - new_coord[0] if len(midpoints) else 0.5)
+        last = new_coord[-1] + (new_coord[-1] - midpoints[-1] if len(midpoints) else 0.5)
+        edges = as_index(np.concatenate([[first], midpoints, [last]])) + 0.5
+        return edges, new_coord
+
+    if shape is not None:
+        reduction = n // shape if n % shape == 0 else n / shape
+        n_bins = shape
+    else:
+        n_bins = int(np.floor(n / reduction + 1e-9))
+
+    edges = np.arange(n_bins + 1) * reduction
+    return edges, np.interp(edges[:-1], index, coord)
+
+
+def _block_factor(edges: np.ndarray) -> typing.Optional[int]:
+    """The reduction factor if bins are whole consecutive blocks of pixels, otherwise None."""
+    widths = np.diff(edges)
+    if not len(widths) or edges[0] != 0 or np.any(widths != widths[0]):
+        return None
+
+    if float(widths[0]).is_integer():
+        return int(widths[0])
+
+    return None
+
+
+def _apply_rebinning(
+    arr: np.ndarray, axis: int, matrix: scipy.sparse.csr_matrix, factor: typing.Optional[int] = None
+) -> np.ndarray:
+    if factor is not None:
+        # whole blocks of pixels are much cheaper to average with a reshape
+        n_bins = matrix.shape[0]
+        total = np.zeros(
+            arr.shape[:axis] + (n_bins,) + arr.shape[axis + 1 :],
+            dtype=np.result_type(arr.dtype, np.float32),
+        )
+        for offset in range(factor):
+            total += arr[(slice(None),) * axis + (slice(offset, n_bins * factor, factor),)]
+        total /= factor
+        return total
+
+    moved = np.moveaxis(arr, axis, 0)
+    rebinned = matrix @ moved.reshape(moved.shape[0], -1)
+    rebinned = rebinned.astype(np.result_type(arr.dtype, np.float32), copy=False)
+    return np.moveaxis(rebinned.reshape((matrix.shape[0],) + moved.shape[1:]), 0, axis)
+
+
+def _rebin_blockwise(
+    arr, matrices: typing.Dict[int, scipy.sparse.csr_matrix], factors: typing.Dict[int, int]
+) -> np.ndarray:
+    """Rebins an array which may be memory mapped or otherwise backed by disk.
+
+    The input is only read in slabs of at most ``REBIN_BLOCK_SIZE`` bytes along the first axis,
+    each of which is fully reduced before the next is read.
+    """
+    n = arr.shape[0]
+    first = matrices.get(0, scipy.sparse.identity(n, format="csr"))
+    others = {axis: matrix for axis, matrix in matrices.items() if axis != 0}
+
+    # the range of input rows each output row draws from, every row has at least one entry
+    low = np.minimum.reduceat(first.indices, first.indptr[:-1])
+    high = np.maximum.accumulate(np.maximum.reduceat(first.indices, first.indptr[:-1]) + 1)
+
+    row_size = arr.dtype.itemsize * int(np.prod(arr.shape[1:]))
+    step = max(REBIN_BLOCK_SIZE // max(row_size, 1), 1)
+
+    blocks = []
+    start = 0
+    while start < first.shape[0]:
+        stop = max(start + 1, int(np.searchsorted(high, low[start] + step, side="right")))
+        read_from, read_to = low[start:stop].min(), high[stop - 1]
+
+        slab = np.asarray(arr[read_from:read_to])
+        for axis, matrix in others.items():
+            slab = _apply_rebinning(slab, axis, matrix, factors.get(axis))
+        blocks.append(
+            _apply_rebinning(slab, 0, first[start:stop, read_from:read_to], factors.get(0))
+        )
+        start = stop
+
+    return np.concatenate(blocks, axis=0)
+
+
+def _rebin_dask(
+    arr, matrices: typing.Dict[int, scipy.sparse.csr_matrix], factors: typing.Dict[int, int]
+):
+    """Lazily rebins a dask array, one dimension at a time."""
+    for axis, matrix in matrices.items():
+        arr = arr.rechunk({axis: -1})
+        chunks = arr.chunks[:axis] + ((matrix.shape[0],),) + arr.chunks[axis + 1 :]
+        arr = arr.map_blocks(
+            _apply_rebinning,
+            axis,
+            matrix,
+            factors.get(axis),
+            chunks=chunks,
+            dtype=np.result_type(arr.dtype, np.float32),
+        )
+
+    return arr
+
+
 @update_provenance("Rebinned array")
 def rebin(
     data: DataType,
@@ -178,10 +324,21 @@ def rebin(
     Dimensions corresponding to missing entries in ``shape`` or ``reduction`` will not
     be changed.
 
+    Reduction factors need not be integers, and target shapes need not divide the
+    data. In this case pixels are split between neighboring bins in proportion to
+    their overlap, which conserves flux. Integer factors average whole blocks of
+    pixels and trim any remainder, and in all cases new coordinates are those at the
+    start of each bin. Instead of a number of bins, ``shape`` can also give the
+    target coordinates (bin centers) directly.
+
+    Data backed by dask is rebinned lazily, and other data (such as memory mapped
+    arrays) is read and reduced in bounded slabs, so that rebinning can happen as
+    data is loaded. See the ``rebin`` argument to ``load_data``.
+
     Args:
         data
-        interpolate: Use interpolation instead of integration
-        shape: Target shape
+        interpolate: Use (linear) interpolation instead of integration
+        shape: Target shape, or target coordinates
         reduction: Factor to reduce each dimension by
 
     Returns:
@@ -205,49 +362,50 @@ def rebin(
     if any(d in kwargs for d in data.dims):
         reduction = kwargs
 
-    if interpolate:
-        raise NotImplementedError("The interpolation option has not been implemented")
-
     assert shape is None or reduction is None
 
-    if isinstance(reduction, int):
-        reduction = {d: reduction for d in data.dims}
-
-    if reduction is None:
-        reduction = {}
-
-    # we standardize by computing reduction from shape is shape was supplied.
-    if shape is not None:
-        reduction = {k: len(data.coords[k]) // v for k, v in shape.items()}
-
-    # since we are not interpolating, we need to clip each dimension so that the reduction
-    # factor evenly divides the real shape of the input data.
-    slices = defaultdict(lambda: slice(None))
-
     if not data.dims:
         return data
 
-    for dim, reduction_factor in reduction.items():
-        remainder = len(data.coords[dim]) % reduction_factor
-        if remainder != 0:
-            slices[dim] = slice(None, -remainder)
+    if isinstance(reduction, (int, float)):
+        reduction = {d: reduction for d in data.dims}
+
+    targets = {
+        d: _rebinning_target(data.coords[d].values, reduction=v)
+        for d, v in (reduction or {}).items()
+        if d in data.dims
+    }
+    targets.update(
+        {
+            d: _rebinning_target(data.coords[d].values, shape=v)
+            for d, v in (shape or {}).items()
+            if d in data.dims
+        }
+    )
 
-    trimmed_data = data.data[tuple(slices[d] for d in data.dims)]
-    trimmed_coords = {d: coord[slices[d]] for d, coord in data.indexes.items()}
+    new_coords = {
+        c: targets[c][1] if c in targets else coord
+        for c, coord in data.coords.items()
+        if c in targets or not set(coord.dims).intersection(targets)
+    }
 
-    temp_shape = [
-        [trimmed_data.shape[i] // reduction.get(d, 1), reduction.get(d, 1)]
-        for i, d in enumerate(data.dims)
-    ]
-    temp_shape = itertools.chain(*temp_shape)
-    reduced_data = trimmed_data.reshape(*temp_shape)
+    if interpolate:
+        return data.interp({d: new_coords[d] for d in targets}).assign_coords(new_coords)
 
-    for i in range(len(data.dims)):
-        reduced_data = reduced_data.mean(i + 1)
+    matrices = {
+        data.dims.index(d): _rebinning_matrix(edges, len(data.coords[d]))
+        for d, (edges, _) in targets.items()
+    }
 
-    reduced_coords = {d: coord[:: reduction.get(d, 1)] for d, coord in trimmed_coords.items()}
-    reduced_coords.update(
-        {c: data.coords[c] for c in data.coords.keys() if c not in trimmed_coords}
-    )
+    factors = {
+        data.dims.index(d): _block_factor(edges)
+        for d, (edges, _) in targets.items()
+        if _block_factor(edges) is not None
+    }
+
+    if data.chunks is not None:
+        reduced_data = _rebin_dask(data.data, matrices, factors)
+    else:
+        reduced_data = _rebin_blockwise(data.data, matrices, factors)
 
-    return xr.DataArray(reduced_data, reduced_coords, data.dims, attrs=data.attrs)
+    return xr.DataArray(reduced_data, new_coords, data.dims, attrs=data.attrs)
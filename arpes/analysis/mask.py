@@ -1,4 +1,8 @@
 """Utilities for applying masks to data."""
+import functools
+from typing import Tuple
+
+import numba
 import numpy as np
 from matplotlib.path import Path
 
@@ -6,6 +10,7 @@ import xarray as xr
 from arpes.provenance import update_provenance
 from arpes.typing import DataType
 from arpes.utilities import normalize_to_spectrum
+from arpes.utilities.jit import kernel
 
 __all__ = (
     "polys_to_mask",
@@ -37,6 +42,107 @@ def raw_poly_to_mask(poly):
     }
 
 
+def _polygon_examples(dtype):
+    # polygons are rasterized in index space, so there is a single signature for all data types
+    if dtype != np.float64:
+        return []
+
+    vertices = np.array([0, 4, 4, 0, 0, 0, 4, 4], dtype=np.int64)
+    offsets = np.array([0, 4], dtype=np.int64)
+    return [(vertices[:4], vertices[4:], offsets, np.zeros((6, 6), dtype=np.bool_))]
+
+
+@kernel(parallel=True, examples=_polygon_examples)
+def _rasterize_polygons(xs, ys, offsets, out):
+    """Fills the interior of polygons given in index space into `out` by scanline.
+
+    Polygon `k` has vertices ``(xs[i], ys[i])`` for ``offsets[k] <= i < offsets[k + 1]``,
+    with the closing edge implied. A pixel ``(x, y)`` is inside if it has an odd number of
+    edge crossings to its right, using the same edge rules as matplotlib's ``Path.contains_points``,
+    so that results agree exactly for the integer vertices and pixel centers we use.
+
+    Each column ``y`` is a scanline along the first axis: every edge crossing it toggles all
+    pixels to its left, which we record in a difference array and resolve with a running parity.
+    """
+    n_x, n_y = out.shape
+    for y in numba.prange(n_y):
+        toggles = np.zeros(n_x + 1, dtype=np.bool_)
+        for k in range(len(offsets) - 1):
+            toggles[:] = False
+            start, stop = offsets[k], offsets[k + 1]
+            for i in range(start, stop):
+                x0, y0 = xs[i], ys[i]
+                j = i + 1 if i + 1 < stop else start
+                x1, y1 = xs[j], ys[j]
+
+                if (y0 >= y) == (y1 >= y):
+                    continue
+
+                num = (y - y1) * (x0 - x1)
+                den = y0 - y1
+                if den > 0:
+                    # pixels strictly left of the crossing
+                    n = x1 - ((-num) // den)
+                else:
+                    # pixels left of or on the crossing
+                    n = x1 + ((-num) // (-den)) + 1
+
+                n = min(max(n, 0), n_x)
+                toggles[n] = not toggles[n]
+
+            inside = False
+            for x in range(n_x - 1, -1, -1):
+                if toggles[x + 1]:
+                    inside = not inside
+                if inside:
+                    out[x, y] = True
+
+
+@kernel(parallel=True)
+def _polygon_edge_distance(xs, ys, offsets, out):
+    """Computes the distance (in pixels) from each pixel to the nearest polygon edge."""
+    n_x, n_y = out.shape
+    for x in numba.prange(n_x):
+        for y in range(n_y):
+            best = np.inf
+            for k in range(len(offsets) - 1):
+                start, stop = offsets[k], offsets[k + 1]
+                for i in range(start, stop):
+                    j = i + 1 if i + 1 < stop else start
+                    ex, ey = xs[j] - xs[i], ys[j] - ys[i]
+                    px, py = x - xs[i], y - ys[i]
+                    length = ex * ex + ey * ey
+                    t = 0.0
+                    if length > 0:
+                        t = min(max((px * ex + py * ey) / length, 0.0), 1.0)
+                    dx, dy = px - t * ex, py - t * ey
+                    best = min(best, dx * dx + dy * dy)
+            out[x, y] = np.sqrt(best)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_polygon_mask(
+    polys: Tuple[Tuple[Tuple[int, int], ...], ...], shape: Tuple[int, int], radius: float
+) -> np.ndarray:
+    xs = np.array([v[0] for poly in polys for v in poly], dtype=np.int64)
+    ys = np.array([v[1] for poly in polys for v in poly], dtype=np.int64)
+    offsets = np.cumsum([0] + [len(poly) for poly in polys]).astype(np.int64)
+
+    mask = np.zeros(shape, dtype=bool)
+    _rasterize_polygons(xs, ys, offsets, mask)
+
+    if radius:
+        distance = np.empty(shape, dtype=np.float64)
+        _polygon_edge_distance(xs, ys, offsets, distance)
+        if radius > 0:
+            mask |= distance <= radius
+        else:
+            mask &= distance > -radius
+
+    mask.flags.writeable = False
+    return mask
+
+
 def polys_to_mask(mask_dict, coords, shape, radius=None, invert=False):
     """Converts a mask definition in terms of the underlying polygon to a True/False mask array.
 
@@ -47,12 +153,17 @@ def polys_to_mask(mask_dict, coords, shape, radius=None, invert=False):
     polygon definitions are general to any data with appropriate dimensions, because
     waypoints are given in unitful values rather than index values.
 
+    Polygons are rasterized directly in index space, and the rasterized mask is cached on
+    the polygons and the index space they land in, so reapplying a mask to data on the
+    same coordinates, as the masking and BZ tools do, is essentially free.
+
     Args:
-        mask_dict
-        coords
-        shape
-        radius
-        invert
+        mask_dict: The mask definition, with keys "dims" and "polys".
+        coords: The coordinates of the target data.
+        shape: The shape of the target data along the masked dimensions, in the order of "dims".
+        radius: Distance in pixels by which to expand (or for a negative
+          value, contract) the masked region.
+        invert: Whether to invert the mask.
 
     Returns:
         The mask.
@@ -60,30 +171,20 @@ def polys_to_mask(mask_dict, coords, shape, radius=None, invert=False):
     dims = mask_dict["dims"]
     polys = mask_dict["polys"]
 
-    polys = [
-        [[np.searchsorted(coords[dims[i]], coord) for i, coord in enumerate(p)] for p in poly]
+    polys = tuple(
+        tuple(
+            tuple(int(np.searchsorted(coords[dims[i]], coord)) for i, coord in enumerate(p))
+            for p in poly
+        )
         for poly in polys
-    ]
+    )
 
-    mask_grids = np.meshgrid(*[np.arange(s) for s in shape])
-    mask_grids = tuple(k.flatten() for k in mask_grids)
-
-    points = np.vstack(mask_grids).T
-
-    mask = None
-    for poly in polys:
-        grid = Path(poly).contains_points(points, radius=radius or 0)
-        grid = grid.reshape(list(shape)[::-1]).T
-
-        if mask is None:
-            mask = grid
-        else:
-            mask = np.logical_or(mask, grid)
+    mask = _cached_polygon_mask(polys, tuple(int(s) for s in shape), float(radius or 0))
 
     if invert:
-        mask = np.logical_not(mask)
+        return np.logical_not(mask)
 
-    return mask
+    return mask.copy()
 
 
 def apply_mask_to_coords(data: xr.Dataset, mask, dims, invert=True):
@@ -145,15 +246,22 @@ def apply_mask(data: DataType, mask, replace=np.nan, radius=None, invert=False):
     fermi = mask.get("fermi")
 
     if isinstance(mask, dict):
-        dims = mask.get("dims", data.dims)
+        dims = list(mask.get("dims", data.dims))
         mask = polys_to_mask(
             mask,
             data.coords,
-            [s for i, s in enumerate(data.shape) if data.dims[i] in dims],
+            [len(data.coords[d]) for d in dims],
             radius=radius,
             invert=invert,
         )
 
+        # broadcast along any dimensions the mask is not defined on
+        mask = xr.DataArray(mask, dims=dims).transpose(*[d for d in data.dims if d in dims])
+        mask = np.broadcast_to(
+            mask.values.reshape([len(data.coords[d]) if d in dims else 1 for d in data.dims]),
+            data.shape,
+        )
+
     masked_data = data.copy(deep=True)
     masked_data.values = masked_data.values * 1.0
     masked_data.values[mask] = replace
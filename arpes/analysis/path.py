@@ -111,9 +111,4 @@ def select_along_path(
         The data selected along the path.
     """
     new_path = discretize_path(path, n_points, scaling)
-
-    selections = []
-    for _, view in new_path.G.iterate_axis("index"):
-        selections.append(data.S.select_around(view, radius=radius, fast=fast, **kwargs))
-
-    return xr.concat(selections, new_path.index)
+    return data.S.select_around(new_path, radius=radius, fast=fast, **kwargs)
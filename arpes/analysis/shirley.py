@@ -35,45 +35,59 @@ def remove_shirley_background(xps: DataType, **kwargs) -> DataType:
 def _calculate_shirley_background_full_range(
     xps: np.ndarray, eps=1e-7, max_iters=50, n_samples=5
 ) -> np.ndarray:
-    """Core routine for calculating a Shirley background on np.ndarray data."""
+    """Core routine for calculating a Shirley background on np.ndarray data.
+
+    The energy axis is the first axis of `xps`, any further axes index independent spectra
+    which are all solved simultaneously. Each iteration is a pair of cumulative sums
+    over the spectra which have not yet converged, so that a stack of spectra (i.e. a spatial
+    XPS map) costs about as much as a single spectrum per iteration in Python overhead.
+    """
+    xps = np.asarray(xps, dtype=np.float64)
+    stack_shape = xps.shape
+    xps = xps.reshape(stack_shape[0], -1)
+
     background = np.copy(xps)
     cumulative_xps = np.cumsum(xps, axis=0)
-    total_xps = np.sum(xps, axis=0)
-
-    rel_error = np.inf
+    total_xps = cumulative_xps[-1]
 
     i_left = np.mean(xps[:n_samples], axis=0)
     i_right = np.mean(xps[-n_samples:], axis=0)
+    k = i_left - i_right
 
-    iter_count = 0
+    rel_error = np.full(xps.shape[1], np.inf)
 
-    k = i_left - i_right
-    for iter_count in range(max_iters):
-        cumulative_background = np.cumsum(background, axis=0)
-        total_background = np.sum(background, axis=0)
+    # indices of the spectra which have not yet converged
+    active = np.arange(xps.shape[1])
 
-        new_bkg = np.copy(background)
+    for _ in range(max_iters):
+        current = background[:, active]
+        cumulative_background = np.cumsum(current, axis=0)
+        total_background = cumulative_background[-1]
 
-        for i in range(len(new_bkg)):
-            new_bkg[i] = i_right + k * (
-                (total_xps - cumulative_xps[i] - (total_background - cumulative_background[i]))
-                / (total_xps - total_background + 1e-5)
-            )
+        area_right = total_xps[active] - cumulative_xps[:, active]
+        background_right = total_background - cumulative_background
+        new_bkg = i_right[active] + k[active] * (
+            (area_right - background_right) / (total_xps[active] - total_background + 1e-5)
+        )
 
-        rel_error = np.abs(np.sum(new_bkg, axis=0) - total_background) / (total_background)
+        error = np.abs(np.sum(new_bkg, axis=0) - total_background) / total_background
 
-        background = new_bkg
+        background[:, active] = new_bkg
+        rel_error[active] = error
+        active = active[~(error < eps)]
 
-        if np.any(rel_error < eps):
+        if len(active) == 0:
             break
 
-    if (iter_count + 1) == max_iters:
+    if len(active):
         warnings.warn(
-            "Shirley background calculation did not converge "
-            + "after {} steps with relative error {}!".format(max_iters, rel_error)
+            "Shirley background calculation did not converge for {} of {} spectra ".format(
+                len(active), xps.shape[1]
+            )
+            + "after {} steps with relative error {}!".format(max_iters, np.max(rel_error[active]))
         )
 
-    return background
+    return background.reshape(stack_shape)
 
 
 @update_provenance("Calculate full range Shirley background")
@@ -107,7 +121,7 @@ def calculate_shirley_background_full_range(
     Returns:
         A monotonic Shirley backgruond over the entire energy range.
     """
-    xps = normalize_to_spectrum(xps).copy(deep=True)
+    xps = normalize_to_spectrum(xps)
     core_dims = [d for d in xps.dims if d != "eV"]
 
     return xr.apply_ufunc(
@@ -129,7 +143,8 @@ def calculate_shirley_background(
 ) -> DataType:
     """Calculates a shirley background iteratively over the full energy range `energy_range`.
 
-    Uses `calculate_shirley_background_full_range` internally.
+    Uses `calculate_shirley_background_full_range` internally. Every spectrum along the
+    non-energy axes of `xps` is processed at once, with convergence tracked per spectrum.
 
     Outside the indicated range, the background is extrapolated as a constant from
     the nearest in-range value.
@@ -152,13 +167,10 @@ def calculate_shirley_background(
 
     bkg = calculate_shirley_background_full_range(xps_for_calc, eps, max_iters, n_samples)
     bkg = bkg.transpose(*xps.dims)
-    full_bkg = xps * 0
-
-    left_idx = np.searchsorted(full_bkg.eV.values, bkg.eV.values[0], side="left")
-    right_idx = left_idx + len(bkg)
+    energy_axis = xps.dims.index("eV")
 
-    full_bkg.values[:left_idx] = bkg.values[0]
-    full_bkg.values[left_idx:right_idx] = bkg.values
-    full_bkg.values[right_idx:] = bkg.values[-1]
+    # extend the background as a constant outside the range by clamping energy indices
+    left_idx = np.searchsorted(xps.eV.values, bkg.eV.values[0], side="left")
+    source_indices = np.clip(np.arange(len(xps.eV)) - left_idx, 0, len(bkg.eV) - 1)
 
-    return full_bkg
+    return xps.copy(data=np.take(bkg.values, source_indices, axis=energy_axis))
@@ -18,7 +18,7 @@ import functools
 import random
 
 import scipy.stats
-from typing import Any, Callable, Dict, List, Optional, Set, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
 import numpy as np
 from tqdm import tqdm_notebook
 
@@ -36,6 +36,8 @@ __all__ = (
     "resample_true_counts",
     "bootstrap_counts",
     "bootstrap_intensity_polarization",
+    "OnlineStatistics",
+    "StreamingQuantile",
     "Normal",
     "propagate_errors",
 )
@@ -84,13 +86,17 @@ def resample_cycle(data: xr.DataArray, **kwargs) -> xr.DataArray:
 
     Args:
         data: The input data.
-        kwargs: Unused
+        kwargs: An optional `np.random.Generator` can be passed as `rng`, others are unused.
 
     Returns:
         Resampled data with selections from the cycle axis.
     """
     n_cycles = len(data.cycle)
-    which = [random.randint(0, n_cycles - 1) for _ in range(n_cycles)]
+    rng = kwargs.get("rng")
+    if rng is None:
+        which = [random.randint(0, n_cycles - 1) for _ in range(n_cycles)]
+    else:
+        which = rng.integers(0, n_cycles, n_cycles)
 
     resampled = data.isel(cycle=which).sum("cycle", keep_attrs=True)
 
@@ -102,9 +108,12 @@ def resample_cycle(data: xr.DataArray, **kwargs) -> xr.DataArray:
 
 @update_provenance("Resample with prior adjustment")
 @lift_dataarray_to_generic
-def resample(data: xr.DataArray, prior_adjustment=1, **kwargs):
+def resample(
+    data: xr.DataArray, prior_adjustment=1, rng: Optional[np.random.Generator] = None, **kwargs
+):
+    poisson = np.random.poisson if rng is None else rng.poisson
     resampled = xr.DataArray(
-        np.random.poisson(lam=data.values * prior_adjustment, size=data.values.shape),
+        poisson(lam=data.values * prior_adjustment, size=data.values.shape),
         coords=data.coords,
         dims=data.dims,
         attrs=data.attrs,
@@ -118,18 +127,22 @@ def resample(data: xr.DataArray, prior_adjustment=1, **kwargs):
 
 @update_provenance("Resample electron-counted data")
 @lift_dataarray_to_generic
-def resample_true_counts(data: xr.DataArray) -> xr.DataArray:
+def resample_true_counts(
+    data: xr.DataArray, rng: Optional[np.random.Generator] = None
+) -> xr.DataArray:
     """Resamples histogrammed data where each count represents an actual electron.
 
     Args:
         data: Input data representing actual electron counts from a time of flight
               system or delay line.
+        rng: The random generator to draw from, defaults to the global numpy state.
 
     Returns:
         Poisson resampled data.
     """
+    poisson = np.random.poisson if rng is None else rng.poisson
     resampled = xr.DataArray(
-        np.random.poisson(lam=data.values, size=data.values.shape),
+        poisson(lam=data.values, size=data.values.shape),
         coords=data.coords,
         dims=data.dims,
         attrs=data.attrs,
@@ -141,9 +154,122 @@ def resample_true_counts(data: xr.DataArray) -> xr.DataArray:
     return resampled
 
 
+class OnlineStatistics:
+    """Accumulates the elementwise mean and variance of a stream of arrays.
+
+    Batches of samples are merged with the parallel form of Welford's algorithm
+    (Chan et al.), so that only the running count, mean and sum of squared deviations
+    are held in memory.
+    """
+
+    def __init__(self):
+        """Starts with no samples."""
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, batch: np.ndarray) -> None:
+        """Adds a batch of samples, stacked along the first axis."""
+        batch = np.asarray(batch, dtype=np.float64)
+        n_batch = batch.shape[0]
+        if n_batch == 0:
+            return
+
+        batch_mean = np.mean(batch, axis=0)
+        batch_m2 = np.sum((batch - batch_mean) ** 2, axis=0)
+
+        if self.count == 0:
+            self.count, self.mean, self.m2 = n_batch, batch_mean, batch_m2
+            return
+
+        total = self.count + n_batch
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n_batch / total)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * n_batch / total)
+        self.count = total
+
+    def variance(self, ddof: int = 0) -> np.ndarray:
+        """The variance of the samples seen so far."""
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof: int = 0) -> np.ndarray:
+        """The standard deviation of the samples seen so far."""
+        return np.sqrt(self.variance(ddof=ddof))
+
+
+class StreamingQuantile:
+    """Estimates a quantile of a stream of arrays elementwise with the P-squared algorithm.
+
+    See Jain and Chlamtac, Commun. ACM 28, 1076 (1985). Five markers per element are
+    adjusted as samples arrive, so memory does not grow with the number of samples.
+    """
+
+    def __init__(self, q: float):
+        """Sets up the marker increments for quantile `q`, which lies in [0, 1]."""
+        self.q = q
+        self.count = 0
+        self.heights = None
+        self.positions = None
+        self.desired = np.array([1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5])
+        self.increments = np.array([0, q / 2, q, (1 + q) / 2, 1])
+        self._initial = []
+
+    def update(self, batch: np.ndarray) -> None:
+        """Adds a batch of samples, stacked along the first axis."""
+        for sample in np.asarray(batch, dtype=np.float64):
+            self._update_one(sample)
+
+    def _update_one(self, x: np.ndarray) -> None:
+        self.count += 1
+        if self.heights is None:
+            self._initial.append(x)
+            if len(self._initial) == 5:
+                self.heights = np.sort(np.stack(self._initial), axis=0)
+                self.positions = np.ones_like(self.heights) * np.arange(1, 6).reshape(
+                    (5,) + (1,) * x.ndim
+                )
+                self._initial = []
+            return
+
+        h, n = self.heights, self.positions
+        h[0] = np.minimum(h[0], x)
+        h[4] = np.maximum(h[4], x)
+
+        for i in range(1, 4):
+            n[i] += x < h[i]
+        n[4] += 1
+        self.desired = self.desired + self.increments
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            move = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+            if not np.any(move):
+                continue
+
+            s = np.sign(d)
+            parabolic = h[i] + s / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + s) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - s) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+            )
+            h_neighbor = np.where(s > 0, h[i + 1], h[i - 1])
+            n_neighbor = np.where(s > 0, n[i + 1], n[i - 1])
+            linear = h[i] + s * (h_neighbor - h[i]) / (n_neighbor - n[i])
+
+            adjusted = np.where((h[i - 1] < parabolic) & (parabolic < h[i + 1]), parabolic, linear)
+            h[i] = np.where(move, adjusted, h[i])
+            n[i] = np.where(move, n[i] + s, n[i])
+
+    @property
+    def value(self) -> np.ndarray:
+        """The current estimate of the quantile."""
+        if self.heights is None:
+            return np.quantile(np.stack(self._initial), self.q, axis=0)
+        return self.heights[2]
+
+
 @update_provenance("Bootstrap true electron counts")
 @lift_dataarray_to_generic
-def bootstrap_counts(data: DataType, N=1000, name=None) -> xr.Dataset:
+def bootstrap_counts(data: DataType, N=1000, name=None, batch_size=100, seed=None) -> xr.Dataset:
     """Performs a parametric bootstrap assuming recorded data are electron counts.
 
     Parametric bootstrap for the number of counts in each detector channel for a
@@ -152,12 +278,15 @@ def bootstrap_counts(data: DataType, N=1000, name=None) -> xr.Dataset:
     This function also introspects the data passed to determine whether there is a
     spin degree of freedom, and will bootstrap appropriately.
 
-    Currently we build all the samples at once instead of using a rolling algorithm.
+    Samples are drawn `batch_size` at a time and accumulated into a running mean and variance,
+    so memory use does not grow with `N`.
 
     Arguments:
         data: The input spectrum.
         N: The number of samples to draw.
         name: The name of the subarray which represents counts to resample. E.g. "up_spectrum"
+        batch_size: The number of samples to draw at once.
+        seed: Seeds the random generator, for reproducible resampling.
 
     Returns:
         A `xr.Dataset` which has the mean and standard error for the resampled named array.
@@ -167,15 +296,15 @@ def bootstrap_counts(data: DataType, N=1000, name=None) -> xr.Dataset:
 
     desc_fragment = " {}".format(name)
 
-    resampled_sets = []
-    for _ in tqdm_notebook(range(N), desc="Resampling{}...".format(desc_fragment)):
-        resampled_sets.append(resample_true_counts(data))
+    rng = np.random.default_rng(seed)
+    statistics = OnlineStatistics()
+    batch_starts = range(0, N, batch_size)
+    for start in tqdm_notebook(batch_starts, desc="Resampling{}...".format(desc_fragment)):
+        n_samples = min(batch_size, N - start)
+        statistics.update(rng.poisson(lam=data.values, size=(n_samples,) + data.values.shape))
 
-    resampled_arr = np.stack([s.values for s in resampled_sets], axis=0)
-    std = np.std(resampled_arr, axis=0)
-    std = xr.DataArray(std, data.coords, data.dims)
-    mean = np.mean(resampled_arr, axis=0)
-    mean = xr.DataArray(mean, data.coords, data.dims)
+    std = xr.DataArray(statistics.std(), data.coords, data.dims)
+    mean = xr.DataArray(statistics.mean, data.coords, data.dims)
 
     data_vars = {}
     data_vars[name] = mean
@@ -274,20 +403,127 @@ def bootstrap_intensity_polarization(data: xr.Dataset, N: int = 100) -> xr.Datas
     return bootstrapped_polarization(data, N=N)
 
 
+def _bootstrap_batch(
+    fn: Callable,
+    resample_fn: Callable,
+    args: tuple,
+    kwargs: Dict[str, Any],
+    resample_indices: List[int],
+    resample_kwargs: List[str],
+    prior_adjustment: float,
+    batch: Tuple[int, np.random.SeedSequence],
+) -> List[Any]:
+    """Evaluates `fn` on a batch of resamples, drawing from the batch's own random stream.
+
+    This lives at module scope so that it can be sent to worker processes.
+    """
+    n_runs, seed_sequence = batch
+    rng = np.random.default_rng(seed_sequence)
+
+    runs = []
+    for _ in range(n_runs):
+        new_args = list(args)
+        new_kwargs = copy.copy(kwargs)
+        for i in resample_indices:
+            new_args[i] = resample_fn(args[i], prior_adjustment=prior_adjustment, rng=rng)
+        for k in resample_kwargs:
+            new_kwargs[k] = resample_fn(kwargs[k], prior_adjustment=prior_adjustment, rng=rng)
+
+        runs.append(fn(*new_args, **new_kwargs))
+
+    return runs
+
+
+def _run_values(run: Any) -> Dict[str, np.ndarray]:
+    """The numeric contents of a bootstrap run, by variable name."""
+    if isinstance(run, xr.Dataset):
+        return {k: v.values for k, v in run.data_vars.items()}
+    if isinstance(run, xr.DataArray):
+        return {run.name if run.name is not None else "data": run.values}
+    return {"data": np.asarray(run)}
+
+
+def _summarize_runs(batches: Iterable[List[Any]], quantiles: Sequence[float]) -> Any:
+    """Reduces a stream of batches of bootstrap runs to their mean, deviation and quantiles."""
+    template = None
+    accumulators = {}
+
+    for runs in batches:
+        if not runs:
+            continue
+
+        if template is None:
+            template = runs[0]
+            accumulators = {
+                k: (OnlineStatistics(), [StreamingQuantile(q) for q in quantiles])
+                for k in _run_values(template)
+            }
+
+        values = [_run_values(run) for run in runs]
+        for k, (statistics, estimators) in accumulators.items():
+            stacked = np.stack([v[k] for v in values])
+            statistics.update(stacked)
+            for estimator in estimators:
+                estimator.update(stacked)
+
+    if not isinstance(template, (xr.DataArray, xr.Dataset)):
+        statistics, estimators = accumulators["data"]
+        summary = {"mean": statistics.mean, "std": statistics.std()}
+        if quantiles:
+            summary["quantile"] = np.stack([e.value for e in estimators])
+        return summary
+
+    templates = (
+        dict(template.data_vars.items())
+        if isinstance(template, xr.Dataset)
+        else {k: template for k in accumulators}
+    )
+
+    data_vars = {}
+    for k, (statistics, estimators) in accumulators.items():
+        like = templates[k]
+        data_vars[k] = like.copy(data=statistics.mean)
+        data_vars[k + "_std"] = like.copy(data=statistics.std())
+        if quantiles:
+            data_vars[k + "_quantile"] = xr.concat(
+                [like.copy(data=e.value) for e in estimators],
+                dim=xr.DataArray(list(quantiles), dims=["quantile"], name="quantile"),
+            )
+
+    return xr.Dataset(data_vars, attrs=template.attrs.copy())
+
+
 def bootstrap(
     fn: Callable,
     skip: Optional[Union[Set[int], List[int]]] = None,
     resample_method: Optional[str] = None,
+    streaming: bool = False,
+    quantiles: Optional[Sequence[float]] = None,
+    batch_size: int = 10,
+    parallelize: bool = False,
 ) -> Callable:
     """Produces function which performs a bootstrap of an arbitrary function by sampling.
 
     This is a functor which takes a function operating on plain data and produces one which
     internally bootstraps over counts on the input data.
 
+    Resamples are evaluated in batches of `batch_size` runs. Each batch draws from its own random
+    stream spawned from the `seed=` passed to the bootstrapped function, so results are
+    reproducible whether or not batches are distributed over the process pool.
+
+    By default all runs are returned, concatenated along a "bootstrap" dimension. With
+    `streaming=True`, runs are instead reduced as they arrive into a `xr.Dataset` with variables
+    `{name}`, `{name}_std` and, if `quantiles` are requested, `{name}_quantile`, so that only
+    a batch of runs is held in memory at any time.
+
     Args:
-        fn: The function to be bootstrapped.
+        fn: The function to be bootstrapped. Must be picklable if `parallelize` is set.
         skip: Which arguments to leave alone. Defaults to None.
         resample_method: How the resampling should be performed. See `resample` and `resample_cycle`. Defaults to None.
+        streaming: Whether to reduce runs to summary statistics rather than returning all of them.
+        quantiles: Quantiles to estimate in streaming mode, in [0, 1].
+        batch_size: The number of runs in each batch.
+        parallelize: Whether to evaluate batches on the multiprocessing pool.
 
     Returns:
         A function which vectorizes the ouptut of the input function `fn` over samples.
@@ -297,21 +533,21 @@ def bootstrap(
 
     skip = set(skip)
 
+    if quantiles is None:
+        quantiles = []
+
     if resample_method is None:
         resample_fn = resample
     elif resample_method == "cycle":
         resample_fn = resample_cycle
 
-    def bootstrapped(*args, N=20, prior_adjustment=1, **kwargs):
+    def bootstrapped(*args, N=20, prior_adjustment=1, seed=None, **kwargs):
         # examine args to determine which to resample
         resample_indices = [
             i
             for i, arg in enumerate(args)
             if isinstance(arg, (xr.DataArray, xr.Dataset)) and i not in skip
         ]
-        data_is_arraylike = False
-
-        runs = []
 
         def get_label(i):
             if isinstance(args[i], xr.Dataset):
@@ -339,23 +575,35 @@ def bootstrap(
             "Fair warning 2: Ensure that the data to resample is in a DataArray and not a Dataset"
         )
 
-        for _ in tqdm_notebook(range(N), desc="Resampling..."):
-            new_args = list(args)
-            new_kwargs = copy.copy(kwargs)
-            for i in resample_indices:
-                new_args[i] = resample_fn(args[i], prior_adjustment=prior_adjustment)
-            for k in resample_kwargs:
-                new_kwargs[k] = resample_fn(kwargs[k], prior_adjustment=prior_adjustment)
+        batch_sizes = [min(batch_size, N - start) for start in range(0, N, batch_size)]
+        seed_sequences = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+        run_batch = functools.partial(
+            _bootstrap_batch,
+            fn,
+            resample_fn,
+            args,
+            kwargs,
+            resample_indices,
+            resample_kwargs,
+            prior_adjustment,
+        )
+
+        if parallelize:
+            from arpes.fits.hot_pool import hot_pool
+
+            batches = hot_pool.pool.imap(run_batch, zip(batch_sizes, seed_sequences))
+        else:
+            batches = map(run_batch, zip(batch_sizes, seed_sequences))
+
+        batches = tqdm_notebook(batches, total=len(batch_sizes), desc="Resampling...")
 
-            run = fn(*new_args, **new_kwargs)
-            if isinstance(run, (xr.DataArray, xr.Dataset)):
-                data_is_arraylike = True
-            runs.append(run)
+        if streaming:
+            return _summarize_runs(batches, quantiles)
 
-        if data_is_arraylike:
-            for i, run in enumerate(runs):
-                run = run.assign_coords(bootstrap=i)
+        runs = [run for batch in batches for run in batch]
 
+        if any(isinstance(run, (xr.DataArray, xr.Dataset)) for run in runs):
             return xr.concat(runs, dim="bootstrap")
 
         return runs
@@ -10,9 +10,12 @@ earlier in a dataset which can be used to furnish equivalent references.
 """
 from collections import OrderedDict
 
+import xarray as xr
+
 from arpes.typing import DataType
 from arpes.utilities import normalize_to_dataset, deep_equals
 from .fermi_edge_corrections import *
+from .edge_calibration import *
 
 
 __all__ = (
@@ -33,18 +36,30 @@ class HashableDict(OrderedDict):
 
 def reference_key(data: DataType):
     """Calculates a key/hash for data determining reference/correction equality."""
-    data = normalize_to_dataset(data)
+    if not isinstance(data, xr.DataArray):
+        data = normalize_to_dataset(data)
 
     return HashableDict(data.S.reference_settings)
 
 
 def correction_from_reference_set(data: DataType, reference_set):
-    """Determines which correction to use from a set of references."""
-    data = normalize_to_dataset(data)
+    """Determines which correction to use from a set of references.
+
+    References are looked up by hash first, so that only settings which hash differently but
+    compare equal (such as differently ordered settings) fall back to a scan of the references.
+    For many scans against a fixed set of references, see `FermiEdgeCalibration`.
+    """
+    key = reference_key(data)
+
+    try:
+        if key in reference_set:
+            return reference_set[key]
+    except TypeError:  # unhashable settings
+        pass
 
     correction = None
     for k, corr in reference_set.items():
-        if deep_equals(dict(reference_key(data)), dict(k)):
+        if deep_equals(dict(key), dict(k)):
             correction = corr
             break
 
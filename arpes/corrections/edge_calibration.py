@@ -0,0 +1,445 @@
+"""Batch fitted Fermi edge corrections which are cached and looked up by reference settings.
+
+Over a beamtime, a handful of Fermi edge references (gold or polycrystalline copper at each
+photon energy and spectrometer setting) is used to correct thousands of scans. Fitting edges with
+``broadcast_model`` produces a full ``lmfit.ModelResult`` per trace and is slow, and looking up a
+correction with ``correction_from_reference_set`` compares the settings of every reference.
+
+A `FermiEdgeCalibration` instead fits the edges of all references at once with a vectorized
+Levenberg-Marquardt solver, reduces each reference to a small correction (quadratic coefficients
+or an edge stencil) and stores it under a stable digest of its ``reference_key``. Corrections can
+be persisted to a directory, so that they are fit once and then reused across sessions.
+
+Example:
+    >>> calibration = FermiEdgeCalibration("corrections/", kind="quadratic")  # doctest: +SKIP
+    >>> calibration.fit(gold_references)  # doctest: +SKIP
+    >>> corrected = [calibration.apply(scan) for scan in scans]  # doctest: +SKIP
+"""
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import xarray as xr
+from scipy.ndimage import gaussian_filter1d
+from scipy.special import erfc
+
+from arpes.typing import DataType
+from arpes.utilities import normalize_to_dataset, normalize_to_spectrum
+
+__all__ = (
+    "FermiEdgeCalibration",
+    "StoredEdgeCorrection",
+    "fit_fermi_edges",
+    "reference_digest",
+)
+
+# matches the scaling of the error function in ``arpes.fits.fit_models.functional_forms.gstep``
+ERF_SCALE = 1.66511
+
+# center, width, amplitude, background
+N_EDGE_PARAMS = 4
+
+CORRECTION_KINDS = {"quadratic", "direct", "photon_energy"}
+
+
+def _canonical(value):
+    if value is None or isinstance(value, (bool, str)):
+        return value
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def reference_digest(data: DataType, exclude: Iterable[str] = ()) -> str:
+    """A stable hash of ``reference_key(data)``, suitable for file names and dictionary keys.
+
+    Unlike ``hash(reference_key(data))``, this does not change between interpreter sessions and
+    does not depend on whether settings are stored as Python or numpy scalars.
+
+    Args:
+        data: The scan or reference.
+        exclude: Settings to leave out of the key. Photon energy corrections exclude "hv", so that
+          photon energy scans and single photon energy scans share their correction.
+    """
+    if not isinstance(data, xr.DataArray):
+        data = normalize_to_dataset(data)
+
+    exclude = set(exclude)
+    if "hv" in exclude:
+        settings = data.S.spectrometer_settings
+    else:
+        settings = data.S.reference_settings
+
+    canonical = {str(k): _canonical(v) for k, v in settings.items() if k not in exclude}
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def _edge_model(x: np.ndarray, params: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Evaluates Gaussian broadened Fermi edges and their Jacobian for a batch of parameters.
+
+    Args:
+        x: The energies of each trace with shape [n_traces, n_energies].
+        params: The parameters of each trace with shape [n_traces, N_EDGE_PARAMS].
+
+    Returns:
+        The model with the shape of `x` and the Jacobian with shape [*x.shape, N_EDGE_PARAMS].
+    """
+    center, width, amplitude, background = (params[:, [i]] for i in range(N_EDGE_PARAMS))
+    dx = x - center
+    z = ERF_SCALE * dx / width
+
+    step = 0.5 * erfc(z)
+    model = background + amplitude * step
+
+    # derivative of the step with respect to its center
+    peak = amplitude * ERF_SCALE * np.exp(-(z ** 2)) / (np.sqrt(np.pi) * width)
+    jacobian = np.stack([peak, peak * dx / width, step, np.ones_like(dx)], axis=-1)
+    return model, jacobian
+
+
+def _initial_edge_params(x: np.ndarray, y: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Guesses edge parameters from the steepest descent of each smoothed trace."""
+    filled = np.where(valid, y, np.nanmean(np.where(valid, y, np.nan), axis=1, keepdims=True))
+    smoothed = gaussian_filter1d(np.nan_to_num(filled), 1.5, axis=1, mode="nearest")
+    slope = np.where(valid[:, 1:] & valid[:, :-1], np.diff(smoothed, axis=1), np.inf)
+    steepest = np.argmin(slope, axis=1)
+    rows = np.arange(len(x))
+
+    low = np.nanpercentile(np.where(valid, y, np.nan), 10, axis=1)
+    high = np.nanpercentile(np.where(valid, y, np.nan), 90, axis=1)
+    spacing = np.nanmedian(np.abs(np.diff(np.where(valid, x, np.nan), axis=1)), axis=1)
+
+    params = np.zeros((len(x), N_EDGE_PARAMS))
+    params[:, 0] = 0.5 * (x[rows, steepest] + x[rows, steepest + 1])
+    params[:, 1] = np.maximum(0.02, 2 * spacing)
+    params[:, 2] = np.maximum(high - low, 1e-12)
+    params[:, 3] = low
+    return params
+
+
+def _fit_edges(
+    x: np.ndarray, y: np.ndarray, max_iterations: int = 100, tolerance: float = 1e-10
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fits a Gaussian broadened Fermi edge to every row of `y` with one batched solver.
+
+    This is a Levenberg-Marquardt iteration in which every trace keeps its own damping, but the
+    normal equations of all traces are formed and solved together.
+
+    Args:
+        x: The energies, either shared with shape [n_energies] or per trace. NaN marks padding.
+        y: The traces with shape [n_traces, n_energies]. NaN marks missing data.
+        max_iterations: The maximum number of iterations.
+        tolerance: Relative change in the residual below which a trace is considered converged.
+
+    Returns:
+        The fitted parameters and their standard errors, each with shape [n_traces, N_EDGE_PARAMS].
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    x = np.broadcast_to(np.asarray(x, dtype=np.float64), y.shape)
+    valid = np.isfinite(x) & np.isfinite(y)
+    mask = valid.astype(np.float64)
+    x, y = np.where(valid, x, 0), np.where(valid, y, 0)
+
+    params = _initial_edge_params(np.where(valid, x, np.nan), np.where(valid, y, np.nan), valid)
+    # fit in units of the typical intensity, so that the damping is well scaled for every trace
+    scale = params[:, [2]].copy()
+    y = y / scale
+    params[:, 2:] /= scale
+
+    model, jacobian = _edge_model(x, params)
+    residual = (model - y) * mask
+    cost = np.sum(residual ** 2, axis=1)
+    damping = np.full(len(y), 1e-3)
+    active = np.ones(len(y), dtype=bool)
+    identity = np.eye(N_EDGE_PARAMS)
+
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+
+        weighted = jacobian * mask[..., np.newaxis]
+        normal = np.einsum("nmi,nmj->nij", weighted, weighted)
+        gradient = np.einsum("nmi,nm->ni", weighted, residual)
+        diagonal = np.einsum("nii->ni", normal)
+        damped = normal + (damping[:, None] * diagonal)[..., np.newaxis] * identity
+        step = -np.linalg.solve(damped + 1e-12 * identity, gradient[..., np.newaxis])[..., 0]
+        step[~active] = 0
+
+        trial = params + step
+        trial[:, 1] = np.maximum(np.abs(trial[:, 1]), 1e-5)
+        trial_model, trial_jacobian = _edge_model(x, trial)
+        trial_residual = (trial_model - y) * mask
+        trial_cost = np.sum(trial_residual ** 2, axis=1)
+
+        improved = active & (trial_cost < cost)
+        converged = improved & (cost - trial_cost <= tolerance * np.maximum(cost, 1e-300))
+        params[improved] = trial[improved]
+        jacobian[improved] = trial_jacobian[improved]
+        residual[improved] = trial_residual[improved]
+        cost[improved] = trial_cost[improved]
+
+        damping = np.where(improved, damping * 0.3, damping * 10)
+        active &= ~converged & (damping < 1e10)
+
+    weighted = jacobian * mask[..., np.newaxis]
+    normal = np.einsum("nmi,nmj->nij", weighted, weighted)
+    dof = np.maximum(mask.sum(axis=1) - N_EDGE_PARAMS, 1)
+    with np.errstate(invalid="ignore"):
+        covariance = np.linalg.pinv(normal) * (cost / dof)[:, None, None]
+        stderr = np.sqrt(np.einsum("nii->ni", covariance))
+
+    params[:, 2:] *= scale
+    stderr[:, 2:] *= scale
+    return params, stderr
+
+
+def _edge_traces(data: xr.DataArray, along: str, energy_range: slice) -> xr.DataArray:
+    others = [d for d in data.dims if d not in {"eV", along}]
+    return data.sum(others).sel(eV=energy_range).transpose(along, "eV")
+
+
+def _edges_dataset(traces: xr.DataArray, params: np.ndarray, stderr: np.ndarray) -> xr.Dataset:
+    along = traces.dims[0]
+    coords = {along: traces.coords[along].values}
+    return xr.Dataset(
+        {
+            "center": ([along], params[:, 0]),
+            "center_stderr": ([along], stderr[:, 0]),
+            "width": ([along], params[:, 1]),
+            "amplitude": ([along], params[:, 2]),
+        },
+        coords=coords,
+    )
+
+
+def fit_fermi_edges(
+    data: xr.DataArray, along: str = "phi", energy_range: Optional[slice] = None
+) -> xr.Dataset:
+    """Fits the Fermi edge of the EDC at every coordinate `along` in a single vectorized batch.
+
+    The model is that of ``GStepBModel``, a Gaussian broadened step on a constant background, so
+    that edge positions agree with those from ``broadcast_model``. All dimensions other than "eV"
+    and `along` are summed over.
+
+    Args:
+        data: The Fermi edge reference.
+        along: The dimension along which the edge position varies.
+        energy_range: The energy range around the edge to fit, by default 100 meV about 0.
+
+    Returns:
+        The edge center, its standard error, the edge width and amplitude along `along`.
+    """
+    if energy_range is None:
+        energy_range = slice(-0.1, 0.1)
+
+    traces = _edge_traces(data, along, energy_range)
+    params, stderr = _fit_edges(traces.coords["eV"].values, traces.values)
+    return _edges_dataset(traces, params, stderr)
+
+
+@dataclass
+class StoredEdgeCorrection:
+    """A Fermi edge correction reduced to a few numbers, as stored by `FermiEdgeCalibration`.
+
+    Attributes:
+        kind: Either "quadratic", for a quadratic in `along`, or "direct" and "photon_energy",
+          for an edge stencil which is linearly interpolated between `coordinates`.
+        along: The coordinate the edge position depends on.
+        values: The polynomial coefficients (highest power first) or the stencil edge positions.
+        coordinates: The coordinates of the stencil, empty for quadratic corrections.
+        settings: The reference settings the correction was determined for.
+    """
+
+    kind: str
+    along: str
+    values: List[float]
+    coordinates: List[float]
+    settings: Dict[str, object]
+
+    def edge(self, coordinate: np.ndarray) -> np.ndarray:
+        """The edge position at the given values of `along`."""
+        if self.kind == "quadratic":
+            return np.polyval(self.values, coordinate)
+
+        order = np.argsort(self.coordinates)
+        return np.interp(
+            coordinate, np.asarray(self.coordinates)[order], np.asarray(self.values)[order]
+        )
+
+    def stencil(self, data: xr.DataArray) -> xr.DataArray:
+        """The edge position along the coordinates of `data`.
+
+        This can be passed as the correction to ``apply_direct_fermi_edge_correction`` or to
+        ``FermiEdgeShift.from_direct_correction``.
+        """
+        coordinate = data.coords[self.along].values
+        return xr.DataArray(
+            self.edge(coordinate), coords={self.along: coordinate}, dims=[self.along]
+        )
+
+
+class FermiEdgeCalibration:
+    """Fits, caches, and looks up Fermi edge corrections keyed by reference settings.
+
+    Args:
+        path: A directory in which corrections are persisted as JSON. If None, corrections are
+          only kept in memory.
+        kind: Which correction to build. "quadratic" fits a quadratic to the edge along phi,
+          "direct" keeps the well determined edges along phi as a stencil, and "photon_energy"
+          keeps the edges along hv.
+        energy_range: The energy range around the edge which is fit.
+        fit_limit: Edges along phi with a larger standard error in eV are discarded.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        kind: str = "quadratic",
+        energy_range: Optional[slice] = None,
+        fit_limit: float = 0.001,
+    ):
+        """Validate the correction kind and start with no corrections in memory."""
+        if kind not in CORRECTION_KINDS:
+            raise ValueError(f"Unknown correction kind {kind}, expected one of {CORRECTION_KINDS}.")
+
+        self.path = None if path is None else Path(path)
+        self.kind = kind
+        self.along = "hv" if kind == "photon_energy" else "phi"
+        self.energy_range = energy_range if energy_range is not None else slice(-0.1, 0.1)
+        self.fit_limit = fit_limit
+        self.exclude = ("hv",) if kind == "photon_energy" else ()
+        self._corrections: Dict[str, StoredEdgeCorrection] = {}
+
+    def _filename(self, digest: str) -> Path:
+        return self.path / f"{self.kind}-{digest}.json"
+
+    def _reduce(self, traces: xr.DataArray, edges: xr.Dataset, settings) -> StoredEdgeCorrection:
+        coordinate = edges.coords[self.along].values
+        center = edges.center.values
+        good = np.isfinite(center)
+        if self.kind != "photon_energy":
+            good &= edges.center_stderr.values < self.fit_limit
+
+        if self.kind == "quadratic":
+            # as in ``build_quadratic_fermi_edge_correction``, ignore mostly empty traces
+            good &= np.isfinite(traces.values).sum(axis=1) > 0.3 * traces.shape[1]
+
+        if good.sum() < 3:
+            raise ValueError(
+                f"Only {good.sum()} well determined Fermi edges for settings {settings}, "
+                "check the energy range or the fit limit."
+            )
+
+        values, coordinates = center[good], coordinate[good]
+        if self.kind == "quadratic":
+            values, coordinates = np.polyfit(coordinate[good], center[good], 2), []
+
+        return StoredEdgeCorrection(
+            kind=self.kind,
+            along=self.along,
+            values=[float(v) for v in values],
+            coordinates=[float(c) for c in coordinates],
+            settings={str(k): _canonical(v) for k, v in settings.items()},
+        )
+
+    def fit(
+        self, references: Iterable[DataType], refit: bool = False
+    ) -> Dict[str, StoredEdgeCorrection]:
+        """Determines the corrections for a set of references, fitting all of their edges at once.
+
+        References whose settings already have a correction, in memory or on disk, are skipped
+        unless `refit` is set. Several references with the same settings are fit, but only the
+        last one is kept.
+
+        Returns:
+            The corrections, keyed by the `reference_digest` of the reference.
+        """
+        pending = {}
+        for reference in references:
+            reference = normalize_to_spectrum(reference)
+            digest = reference_digest(reference, self.exclude)
+            if not refit and self.lookup(digest) is not None:
+                continue
+
+            settings = reference.S.spectrometer_settings
+            if not self.exclude:
+                settings = reference.S.reference_settings
+
+            pending[digest] = (_edge_traces(reference, self.along, self.energy_range), settings)
+
+        if pending:
+            # pad all traces onto a common number of energies, padding is masked by the solver
+            trace_sets = [traces for traces, _ in pending.values()]
+            n_energies = max(len(t.coords["eV"]) for t in trace_sets)
+            x = np.concatenate(
+                [
+                    np.broadcast_to(
+                        np.pad(
+                            t.coords["eV"].values.astype(np.float64),
+                            (0, n_energies - len(t.coords["eV"])),
+                            constant_values=np.nan,
+                        ),
+                        (len(t), n_energies),
+                    )
+                    for t in trace_sets
+                ]
+            )
+            y = np.concatenate(
+                [
+                    np.pad(
+                        t.values.astype(np.float64),
+                        ((0, 0), (0, n_energies - len(t.coords["eV"]))),
+                        constant_values=np.nan,
+                    )
+                    for t in trace_sets
+                ]
+            )
+            params, stderr = _fit_edges(x, y)
+
+            start = 0
+            for digest, (traces, settings) in pending.items():
+                stop = start + len(traces)
+                edges = _edges_dataset(traces, params[start:stop], stderr[start:stop])
+                self.store(digest, self._reduce(traces, edges, settings))
+                start = stop
+
+        return dict(self._corrections)
+
+    def store(self, digest: str, correction: StoredEdgeCorrection):
+        """Records a correction in memory and, if configured, on disk."""
+        self._corrections[digest] = correction
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._filename(digest), "w") as f:
+                json.dump(asdict(correction), f)
+
+    def lookup(self, digest: str) -> Optional[StoredEdgeCorrection]:
+        """The correction stored under `digest`, or None if there is none."""
+        if digest not in self._corrections and self.path is not None:
+            filename = self._filename(digest)
+            if filename.exists():
+                with open(filename) as f:
+                    self._corrections[digest] = StoredEdgeCorrection(**json.load(f))
+
+        return self._corrections.get(digest)
+
+    def correction_for(self, data: DataType) -> Optional[StoredEdgeCorrection]:
+        """The correction for a scan, determined from its reference settings by a hash lookup."""
+        return self.lookup(reference_digest(data, self.exclude))
+
+    def apply(self, data: DataType) -> xr.DataArray:
+        """Corrects the Fermi edge of a scan with the correction for its reference settings."""
+        from .fermi_edge_corrections import apply_direct_fermi_edge_correction  # circular import
+
+        arr = normalize_to_spectrum(data)
+        correction = self.correction_for(arr)
+        if correction is None:
+            raise KeyError(f"No Fermi edge correction for settings {arr.S.spectrometer_settings}.")
+
+        return apply_direct_fermi_edge_correction(arr, correction=correction.stencil(arr))
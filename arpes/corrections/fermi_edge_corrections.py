@@ -8,6 +8,8 @@ from arpes.fits import GStepBModel, LinearModel, QuadraticModel, broadcast_model
 from arpes.provenance import provenance, update_provenance
 from arpes.utilities.math import shift_by
 
+from .edge_calibration import fit_fermi_edges
+
 
 def _exclude_from_set(excluded):
     def exclude(l):
@@ -110,7 +112,8 @@ def build_direct_fermi_edge_correction(
     """Builds a direct fermi edge correction stencil.
 
     This means that fits are performed at each value of the 'phi' coordinate
-    to get a list of fits. Bad fits are thrown out to form a stencil.
+    to get a list of fits. Bad fits are thrown out to form a stencil. The fits are
+    performed together in a single vectorized batch, see `fit_fermi_edges`.
 
     This can be used to shift coordinates by the nearest value in the stencil.
 
@@ -127,14 +130,8 @@ def build_direct_fermi_edge_correction(
     if energy_range is None:
         energy_range = slice(-0.1, 0.1)
 
-    exclude_axes = ["eV", along]
-    others = [d for d in arr.dims if d not in exclude_axes]
-    edge_fit = broadcast_model(GStepBModel, arr.sum(others).sel(eV=energy_range), along).results
-
-    def sieve(c, v):
-        return v.item().params["center"].stderr < 0.001
-
-    corrections = edge_fit.G.filter_coord(along, sieve).G.map(lambda x: x.params["center"].value)
+    edges = fit_fermi_edges(arr, along=along, energy_range=energy_range)
+    corrections = edges.center[edges.center_stderr < fit_limit]
 
     if plot:
         corrections.plot()
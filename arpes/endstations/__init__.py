@@ -363,7 +363,7 @@ class EndstationBase:
             }
         )
 
-    def load(self, scan_desc: dict = None, **kwargs) -> xr.Dataset:
+    def load(self, scan_desc: dict = None, rebin: Optional[dict] = None, **kwargs) -> xr.Dataset:
         """Loads a scan from a single file or a sequence of files.
 
         This defines the contract and structure for standard data loading plugins:
@@ -376,6 +376,12 @@ class EndstationBase:
         You can read more about the plugin system in the detailed documentation,
         but for the most part loaders just specializing one or more of these different steps
         as appropriate for a beamline.
+
+        If `rebin` is provided, as a mapping from dimensions to (possibly fractional)
+        reduction factors, each frame is rebinned after it is loaded and postprocessed,
+        before frames are concatenated. Only one frame is held at full resolution at a
+        time, so this is much cheaper than rebinning the whole scan after loading for
+        heavily oversampled data. See `rebin_frame`.
         """
         self.trace("Resolving frame locations")
         resolved_frame_locations = self.resolve_frame_locations(scan_desc)
@@ -386,7 +392,8 @@ class EndstationBase:
         frames = [
             self.load_single_frame(fpath, scan_desc, **kwargs) for fpath in resolved_frame_locations
         ]
-        frames = [self.postprocess(f) for f in frames]
+        frames = [self.rebin_frame(self.postprocess(f), rebin) for f in frames]
+
         concatted = self.concatenate_frames(frames, scan_desc)
         concatted = self.postprocess_final(concatted, scan_desc)
 
@@ -395,6 +402,20 @@ class EndstationBase:
 
         return concatted
 
+    def rebin_frame(self, frame: xr.Dataset, rebin: Optional[dict] = None) -> xr.Dataset:
+        """Rebins loaded data by the reduction factors in `rebin`, if any.
+
+        Plugins which override `load` entirely should call this on the data they load, so that
+        they honor the `rebin` argument to `load_data`. See `arpes.analysis.general.rebin`.
+        """
+        if not rebin:
+            return frame
+
+        from arpes.analysis.general import rebin as rebin_data
+
+        self.trace(f"Rebinning by {rebin}")
+        return rebin_data(frame, reduction=rebin)
+
 
 class SingleFileEndstation(EndstationBase):
     """Abstract endstation which loads data from a single file.
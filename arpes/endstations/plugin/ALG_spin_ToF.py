@@ -264,7 +264,7 @@ class SpinToFEndstation(EndstationBase):
 
         return dataset
 
-    def load(self, scan_desc: dict = None, **kwargs):
+    def load(self, scan_desc: dict = None, rebin: dict = None, **kwargs):
         """Loads Lanzara group Spin-ToF data."""
         if scan_desc is None:
             warnings.warn("Attempting to make due without user associated scan_desc for the file")
@@ -276,6 +276,6 @@ class SpinToFEndstation(EndstationBase):
         }
 
         if os.path.splitext(data_loc)[1] == ".fits":
-            return self.load_SToF_fits(scan_desc)
+            return self.rebin_frame(self.load_SToF_fits(scan_desc), rebin)
 
-        return self.load_SToF_hdf5(scan_desc)
+        return self.rebin_frame(self.load_SToF_hdf5(scan_desc), rebin)
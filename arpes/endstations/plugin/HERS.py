@@ -26,7 +26,7 @@ class HERSEndstation(SynchrotronEndstation, HemisphericalEndstation):
     PRINCIPAL_NAME = "ALS-BL1001"
     ALIASES = ["ALS-BL1001", "HERS", "ALS-HERS", "BL1001"]
 
-    def load(self, scan_desc: dict = None, **kwargs):
+    def load(self, scan_desc: dict = None, rebin: dict = None, **kwargs):
         """Loads HERS data from FITS files. Shares a lot in common with the Lanzara group formats."""
         if scan_desc is None:
             warnings.warn("Attempting to make due without user associated scan_desc for the file")
@@ -86,4 +86,4 @@ class HERSEndstation(SynchrotronEndstation, HemisphericalEndstation):
         dataset = xr.Dataset(data_vars, relevant_coords, scan_desc)
         provenance_from_file(dataset, data_loc, {"what": "Loaded BL10 dataset", "by": "load_DLD"})
 
-        return dataset
+        return self.rebin_frame(dataset, rebin)
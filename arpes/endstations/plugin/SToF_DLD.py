@@ -19,7 +19,7 @@ class SToFDLDEndstation(EndstationBase):
 
     PRINCIPAL_NAME = "ALG-SToF-DLD"
 
-    def load(self, scan_desc: dict = None, **kwargs):
+    def load(self, scan_desc: dict = None, rebin: dict = None, **kwargs):
         """Load a FITS file containing run data from Ping and Anton's delay line detector ARToF.
 
         Params:
@@ -61,4 +61,4 @@ class SToFDLDEndstation(EndstationBase):
             },
         )
 
-        return xr.Dataset(dataset_contents, attrs=metadata)
+        return self.rebin_frame(xr.Dataset(dataset_contents, attrs=metadata), rebin)
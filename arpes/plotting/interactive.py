@@ -1,4 +1,5 @@
 """Implements a 2D and 3D data browser via Bokeh."""
+import collections
 import copy
 import warnings
 
@@ -11,11 +12,20 @@ from .interactive_utils import CursorTool, SaveableTool
 
 __all__ = ("ImageTool",)
 
+# The number of cursor selections (images and curves) from the data kept by a tool
+MAX_CACHED_SELECTIONS = 16
+
 # TODO Implement alignment tool
 
 
 class ImageTool(SaveableTool, CursorTool):
-    """Implements a 2D and 3D data browser via Bokeh."""
+    """Implements a 2D and 3D data browser via Bokeh.
+
+    Images are served at the resolution of the screen for the region in view, and refined on
+    zoom, so that the data does not need to be rebinned before it is shown.
+    """
+
+    auto_rebin = False
 
     def __init__(self, curs=None, **kwargs):
         """Load application and fetch marginal sizes from settings."""
@@ -32,15 +42,62 @@ class ImageTool(SaveableTool, CursorTool):
     # TODO select path in image
     def prep_image(self, image_arr):
         """Optionally, postprocess data before showing it."""
+        values = np.asarray(getattr(image_arr, "values", image_arr))
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             if self.app_context["color_mode"] == "linear":
-                return image_arr.values
+                return values
 
             # avoid dependency conflict with numpy v0.16 for now
             from skimage import exposure  # pylint: disable=import-error
 
-            return exposure.equalize_adapthist(image_arr.values, clip_limit=0.03)
+            return exposure.equalize_adapthist(values, clip_limit=0.03)
+
+    def select_nearest(self, **coords):
+        """Selects the data nearest to `coords`, caching recent selections in memory.
+
+        Repeated cursor positions, and positions which differ by less than a pixel, do not
+        read the data again, which matters for data backed by dask.
+        """
+        key = tuple(
+            sorted(
+                (d, int(np.abs(self.arr.coords[d].values - v).argmin())) for d, v in coords.items()
+            )
+        )
+        selections = self.app_context.setdefault("selections", collections.OrderedDict())
+        if key in selections:
+            selections.move_to_end(key)
+            return selections[key]
+
+        selections[key] = self.arr.isel(dict(key)).load()
+        while len(selections) > MAX_CACHED_SELECTIONS:
+            selections.popitem(last=False)
+
+        return selections[key]
+
+    def show_images(self, *plot_dims):
+        """Serves images with `show_image` and rescales their colormaps to the images served.
+
+        Args:
+            plot_dims: Tuples of the plot name, the image and its x and y dimensions.
+        """
+        for plot_name, image, x_dim, y_dim in plot_dims:
+            self.show_image(plot_name, image, x_dim, y_dim)
+            self.rescale_colormap(plot_name)
+
+    def rescale_colormap(self, plot_name, color_range=(0, 100)):
+        """Sets the colormap range of `plot_name`, as a percentage of the displayed range."""
+        slider = self.app_context["widgets"].get(f"{plot_name}_color_range")
+        if slider is not None:
+            color_range = slider.value
+
+        self.update_colormap_for(plot_name)(None, None, color_range)
+
+    def refresh_images(self, event=None):
+        """Refines all images to the current view and rescales their colormaps."""
+        super().refresh_images(event)
+        for plot_name in self.app_context["pyramids"]:
+            self.rescale_colormap(plot_name)
 
     def tool_handler(self, doc):
         """Delegates widget creation to 2D and 3D code based on array dimensions."""
@@ -125,12 +182,8 @@ class ImageTool(SaveableTool, CursorTool):
 
         # create the main inset plot
         main_image = arr
-        prepped_main_image = self.prep_image(main_image)
         self.app_context["color_maps"]["main"] = LinearColorMapper(
-            default_palette,
-            low=np.min(prepped_main_image),
-            high=np.max(prepped_main_image),
-            nan_color="black",
+            default_palette, nan_color="black"
         )
 
         main_tools = ["wheel_zoom", "tap", "reset", "save"]
@@ -157,18 +210,19 @@ class ImageTool(SaveableTool, CursorTool):
         figures["main"].toolbar.logo = None
         figures["main"].background_fill_color = "#fafafa"
         plots["main"] = figures["main"].image(
-            [prepped_main_image.T],
-            x=self.app_context["data_range"]["x"][0],
-            y=self.app_context["data_range"]["y"][0],
-            dw=self.app_context["data_range"]["x"][1] - self.app_context["data_range"]["x"][0],
-            dh=self.app_context["data_range"]["y"][1] - self.app_context["data_range"]["y"][0],
+            [np.zeros((1, 1))],
+            x=0,
+            y=0,
+            dw=1,
+            dh=1,
             color_mapper=self.app_context["color_maps"]["main"],
         )
+        self.show_images(("main", main_image, arr.dims[0], arr.dims[1]))
 
         app_widgets["info_div"] = Div(text="", width=self.app_marginal_size, height=100)
 
         # Create the bottom marginal plot
-        bottom_marginal = arr.sel(**dict([[arr.dims[1], self.cursor[1]]]), method="nearest")
+        bottom_marginal = self.select_nearest(**{arr.dims[1]: self.cursor[1]})
         figures["bottom_marginal"] = figure(
             plot_width=self.app_main_size,
             plot_height=200,
@@ -187,7 +241,7 @@ class ImageTool(SaveableTool, CursorTool):
         )
 
         # Create the right marginal plot
-        right_marginal = arr.sel(**dict([[arr.dims[0], self.cursor[0]]]), method="nearest")
+        right_marginal = self.select_nearest(**{arr.dims[0]: self.cursor[0]})
         figures["right_marginal"] = figure(
             plot_width=200,
             plot_height=self.app_main_size,
@@ -259,23 +313,8 @@ class ImageTool(SaveableTool, CursorTool):
         ]
 
         def on_change_color_mode(event):
-            new_color_mode = event.item
-            self.app_context["color_mode"] = new_color_mode
-            if old is None or old != new_color_mode:
-                right_image_data = arr.sel(
-                    **dict([[arr.dims[0], self.cursor[0]]]), method="nearest"
-                )
-                bottom_image_data = arr.sel(
-                    **dict([[arr.dims[1], self.cursor[1]]]), method="nearest"
-                )
-                main_image_data = arr
-                prepped_right_image = self.prep_image(right_image_data)
-                prepped_bottom_image = self.prep_image(bottom_image_data)
-                prepped_main_image = self.prep_image(main_image_data)
-                plots["right"].data_source.data = {"image": [prepped_right_image]}
-                plots["bottom"].data_source.data = {"image": [prepped_bottom_image.T]}
-                plots["main"].data_source.data = {"image": [prepped_main_image.T]}
-                update_main_colormap(None, None, main_color_range_slider.value)
+            self.app_context["color_mode"] = event.item
+            self.refresh_images()
 
         color_mode_dropdown = widgets.Dropdown(
             label="Color Mode", button_type="primary", menu=COLOR_MODES
@@ -334,6 +373,7 @@ class ImageTool(SaveableTool, CursorTool):
             ),
             title="Color Range (Main)",
         )
+        app_widgets["main_color_range"] = main_color_range_slider
 
         layout = row(
             column(figures["main"], figures["bottom_marginal"]),
@@ -396,10 +436,8 @@ class ImageTool(SaveableTool, CursorTool):
         def click_main_image(event):
             self.cursor = [event.x, event.y]
 
-            right_marginal_data = arr.sel(**dict([[arr.dims[0], self.cursor[0]]]), method="nearest")
-            bottom_marginal_data = arr.sel(
-                **dict([[arr.dims[1], self.cursor[1]]]), method="nearest"
-            )
+            right_marginal_data = self.select_nearest(**{arr.dims[0]: self.cursor[0]})
+            bottom_marginal_data = self.select_nearest(**{arr.dims[1]: self.cursor[1]})
             plots["bottom_marginal"].data_source.data = {
                 "x": bottom_marginal_data.coords[arr.dims[0]].values,
                 "y": bottom_marginal_data.values,
@@ -421,6 +459,7 @@ class ImageTool(SaveableTool, CursorTool):
         figures["main"].on_event(events.Tap, click_main_image)
         main_color_range_slider.on_change("value", update_main_colormap)
 
+        self.enable_level_of_detail()
         doc.add_root(layout)
         doc.title = "Bokeh Tool"
         self.load_app()
@@ -533,13 +572,9 @@ class ImageTool(SaveableTool, CursorTool):
             ]  # try a sensible default
 
         # create the main inset plot
-        main_image = arr.sel(**dict([[arr.dims[2], self.cursor[2]]]), method="nearest")
-        prepped_main_image = self.prep_image(main_image)
+        main_image = self.select_nearest(**{arr.dims[2]: self.cursor[2]})
         self.app_context["color_maps"]["main"] = LinearColorMapper(
-            default_palette,
-            low=np.min(prepped_main_image),
-            high=np.max(prepped_main_image),
-            nan_color="black",
+            default_palette, nan_color="black"
         )
 
         main_title = "Bokeh Tool: WARNING Unidentified"
@@ -567,17 +602,18 @@ class ImageTool(SaveableTool, CursorTool):
         figures["main"].toolbar.logo = None
         figures["main"].background_fill_color = "#fafafa"
         plots["main"] = figures["main"].image(
-            [prepped_main_image.T],
-            x=self.app_context["data_range"]["x"][0],
-            y=self.app_context["data_range"]["y"][0],
-            dw=self.app_context["data_range"]["x"][1] - self.app_context["data_range"]["x"][0],
-            dh=self.app_context["data_range"]["y"][1] - self.app_context["data_range"]["y"][0],
+            [np.zeros((1, 1))],
+            x=0,
+            y=0,
+            dw=1,
+            dh=1,
             color_mapper=self.app_context["color_maps"]["main"],
         )
+        self.show_images(("main", main_image, arr.dims[0], arr.dims[1]))
 
         # Create the z-selector
-        z_marginal_data = arr.sel(
-            **dict([[arr.dims[0], self.cursor[0]], [arr.dims[1], self.cursor[1]]]), method="nearest"
+        z_marginal_data = self.select_nearest(
+            **{arr.dims[0]: self.cursor[0], arr.dims[1]: self.cursor[1]}
         )
         z_hover_tool = HoverTool(
             tooltips=[
@@ -656,13 +692,9 @@ class ImageTool(SaveableTool, CursorTool):
                 )
 
         # Create the bottom marginal plot
-        bottom_image = arr.sel(**dict([[arr.dims[1], self.cursor[1]]]), method="nearest")
-        prepped_bottom_image = self.prep_image(bottom_image)
+        bottom_image = self.select_nearest(**{arr.dims[1]: self.cursor[1]})
         self.app_context["color_maps"]["bottom"] = LinearColorMapper(
-            default_palette,
-            low=np.min(prepped_bottom_image),
-            high=np.max(prepped_bottom_image),
-            nan_color="black",
+            default_palette, nan_color="black"
         )
         figures["bottom"] = figure(
             plot_width=self.app_main_size,
@@ -676,13 +708,14 @@ class ImageTool(SaveableTool, CursorTool):
         )
         figures["bottom"].xaxis.major_label_text_font_size = "0pt"
         plots["bottom"] = figures["bottom"].image(
-            [prepped_bottom_image.T],
-            x=self.app_context["data_range"]["x"][0],
-            y=self.app_context["data_range"]["z"][0],
-            dw=self.app_context["data_range"]["x"][1] - self.app_context["data_range"]["x"][0],
-            dh=self.app_context["data_range"]["z"][1] - self.app_context["data_range"]["z"][0],
+            [np.zeros((1, 1))],
+            x=0,
+            y=0,
+            dw=1,
+            dh=1,
             color_mapper=self.app_context["color_maps"]["bottom"],
         )
+        self.show_images(("bottom", bottom_image, arr.dims[0], arr.dims[2]))
         bottom_marginal = bottom_image.sel(
             **dict([[arr.dims[2], self.cursor[2]]]), method="nearest"
         )
@@ -704,13 +737,9 @@ class ImageTool(SaveableTool, CursorTool):
         )
 
         # Create the right marginal plot
-        right_image = arr.sel(**dict([[arr.dims[0], self.cursor[0]]]), method="nearest")
-        prepped_right_image = self.prep_image(right_image)
+        right_image = self.select_nearest(**{arr.dims[0]: self.cursor[0]})
         self.app_context["color_maps"]["right"] = LinearColorMapper(
-            default_palette,
-            low=np.min(prepped_right_image),
-            high=np.max(prepped_right_image),
-            nan_color="black",
+            default_palette, nan_color="black"
         )
         figures["right"] = figure(
             plot_width=self.app_marginal_size,
@@ -723,13 +752,14 @@ class ImageTool(SaveableTool, CursorTool):
         )
         figures["right"].yaxis.major_label_text_font_size = "0pt"
         plots["right"] = figures["right"].image(
-            [prepped_right_image],
-            x=self.app_context["data_range"]["z"][0],
-            y=self.app_context["data_range"]["y"][0],
-            dw=self.app_context["data_range"]["z"][1] - self.app_context["data_range"]["z"][0],
-            dh=self.app_context["data_range"]["y"][1] - self.app_context["data_range"]["y"][0],
+            [np.zeros((1, 1))],
+            x=0,
+            y=0,
+            dw=1,
+            dh=1,
             color_mapper=self.app_context["color_maps"]["right"],
         )
+        self.show_images(("right", right_image, arr.dims[2], arr.dims[1]))
         right_marginal = right_image.sel(**dict([[arr.dims[2], self.cursor[2]]]), method="nearest")
         figures["right_marginal"] = figure(
             plot_width=200,
@@ -757,12 +787,11 @@ class ImageTool(SaveableTool, CursorTool):
             self.app_context["show_stat_variation"] = should_show
 
             if should_show:
-                main_image_data = arr.sel(**dict([[arr.dims[2], self.cursor[2]]]), method="nearest")
+                main_image_data = self.select_nearest(**{arr.dims[2]: self.cursor[2]})
                 update_stat_variation(
                     "z",
-                    arr.sel(
-                        **dict([[arr.dims[0], self.cursor[0]], [arr.dims[1], self.cursor[1]]]),
-                        method="nearest"
+                    self.select_nearest(
+                        **{arr.dims[0]: self.cursor[0], arr.dims[1]: self.cursor[1]}
                     ),
                 )
                 update_stat_variation(
@@ -811,22 +840,8 @@ class ImageTool(SaveableTool, CursorTool):
         ]
 
         def on_change_color_mode(event):
-            new_color_mode = event.item
-            self.app_context["color_mode"] = new_color_mode
-            if old is None or old != new_color_mode:
-                cursor = self.cursor
-                right_image_data = arr.sel(**dict([[arr.dims[0], cursor[0]]]), method="nearest")
-                bottom_image_data = arr.sel(**dict([[arr.dims[1], cursor[1]]]), method="nearest")
-                main_image_data = arr.sel(**dict([[arr.dims[2], cursor[2]]]), method="nearest")
-                prepped_right_image = self.prep_image(right_image_data)
-                prepped_bottom_image = self.prep_image(bottom_image_data)
-                prepped_main_image = self.prep_image(main_image_data)
-                plots["right"].data_source.data = {"image": [prepped_right_image]}
-                plots["bottom"].data_source.data = {"image": [prepped_bottom_image.T]}
-                plots["main"].data_source.data = {"image": [prepped_main_image.T]}
-                update_right_colormap(None, None, right_color_range_slider.value)
-                update_bottom_colormap(None, None, bottom_color_range_slider.value)
-                update_main_colormap(None, None, main_color_range_slider.value)
+            self.app_context["color_mode"] = event.item
+            self.refresh_images()
 
         color_mode_dropdown = widgets.Dropdown(
             label="Color Mode", button_type="primary", menu=COLOR_MODES
@@ -885,6 +900,7 @@ class ImageTool(SaveableTool, CursorTool):
             ),
             title="Color Range (Main)",
         )
+        app_widgets["main_color_range"] = main_color_range_slider
         right_color_range_slider = widgets.RangeSlider(
             start=0,
             end=100,
@@ -903,6 +919,8 @@ class ImageTool(SaveableTool, CursorTool):
             ),
             title="Color Range (%s Marginal)" % arr.dims[0],
         )
+        app_widgets["bottom_color_range"] = bottom_color_range_slider
+        app_widgets["right_color_range"] = right_color_range_slider
         layout = row(
             column(figures["main"], figures["bottom"], figures["bottom_marginal"]),
             column(
@@ -978,9 +996,8 @@ class ImageTool(SaveableTool, CursorTool):
             self.cursor = [self.cursor[0], self.cursor[1], event.x]
             cursor = self.cursor
 
-            main_image = arr.sel(**dict([[arr.dims[2], cursor[2]]]), method="nearest")
-            plots["main"].data_source.data = {"image": [self.prep_image(main_image).T]}
-            update_main_colormap(None, None, main_color_range_slider.value)
+            main_image = self.select_nearest(**{arr.dims[2]: cursor[2]})
+            self.show_images(("main", main_image, arr.dims[0], arr.dims[1]))
             right_marginal_data = main_image.sel(
                 **dict([[arr.dims[0], cursor[0]]]), method="nearest"
             )
@@ -1006,23 +1023,19 @@ class ImageTool(SaveableTool, CursorTool):
         def click_main_image(event):
             self.cursor = [event.x, event.y, self.cursor[2]]
             cursor = self.cursor
-            right_image_data = arr.sel(**dict([[arr.dims[0], cursor[0]]]), method="nearest")
-            bottom_image_data = arr.sel(**dict([[arr.dims[1], cursor[1]]]), method="nearest")
-            prepped_right_image = self.prep_image(right_image_data)
-            prepped_bottom_image = self.prep_image(bottom_image_data)
-            plots["right"].data_source.data = {"image": [prepped_right_image]}
-            plots["bottom"].data_source.data = {"image": [prepped_bottom_image.T]}
-            update_right_colormap(None, None, right_color_range_slider.value)
-            update_bottom_colormap(None, None, bottom_color_range_slider.value)
+            right_image_data = self.select_nearest(**{arr.dims[0]: cursor[0]})
+            bottom_image_data = self.select_nearest(**{arr.dims[1]: cursor[1]})
+            self.show_images(
+                ("right", right_image_data, arr.dims[2], arr.dims[1]),
+                ("bottom", bottom_image_data, arr.dims[0], arr.dims[2]),
+            )
             right_marginal_data = right_image_data.sel(
                 **dict([[arr.dims[2], cursor[2]]]), method="nearest"
             )
             bottom_marginal_data = bottom_image_data.sel(
                 **dict([[arr.dims[2], cursor[2]]]), method="nearest"
             )
-            z_data = arr.sel(
-                **dict([[arr.dims[0], cursor[0]], [arr.dims[1], cursor[1]]]), method="nearest"
-            )
+            z_data = self.select_nearest(**{arr.dims[0]: cursor[0], arr.dims[1]: cursor[1]})
             plots["z_marginal"].data_source.data = {
                 "x": z_coords.values,
                 "y": z_data.values,
@@ -1080,6 +1093,7 @@ class ImageTool(SaveableTool, CursorTool):
         bottom_color_range_slider.on_change("value", update_bottom_colormap)
         right_color_range_slider.on_change("value", update_right_colormap)
 
+        self.enable_level_of_detail()
         doc.add_root(layout)
         doc.title = "Bokeh Tool"
         self.load_app()
@@ -13,6 +13,7 @@ import xarray as xr
 from arpes.analysis.general import rebin
 from arpes.io import load_data
 from arpes.utilities import deep_equals
+from arpes.plotting.level_of_detail import ImagePyramid
 from typing import List, Union
 
 __all__ = (
@@ -148,7 +149,7 @@ class BokehInteractiveTool(ABC):
 
         def update_plot_colormap(attr, old, new):
             plot_data = self.plots[plot_name].data_source.data["image"]
-            low, high = np.min(plot_data), np.max(plot_data)
+            low, high = np.nanmin(plot_data), np.nanmax(plot_data)
             dynamic_range = high - low
             self.color_maps[plot_name].update(
                 low=low + new[0] / 100 * dynamic_range, high=low + new[1] / 100 * dynamic_range
@@ -208,6 +209,7 @@ class BokehInteractiveTool(ABC):
             "figures": {},
             "color_maps": {},
             "widgets": {},
+            "pyramids": {},
         }
 
         self.init_bokeh_server()
@@ -227,6 +229,56 @@ class BokehInteractiveTool(ABC):
             if item in self.app_context:
                 return self.app_context[item]
 
+    def prep_image(self, image_arr):
+        """Optionally, postprocess data before showing it."""
+        return np.asarray(getattr(image_arr, "values", image_arr))
+
+    def show_image(self, plot_name: str, image: xr.DataArray, x_dim: str, y_dim: str):
+        """Shows `image` on the image glyph `plot_name`, at the resolution of its figure.
+
+        Only the region in view is sent to the browser, averaged down to roughly one pixel per
+        screen pixel. Once `enable_level_of_detail` is called, the image is refined whenever the
+        view changes. The figure is expected to share the name of the plot.
+
+        Returns:
+            The image which was sent to the browser, after `prep_image`.
+        """
+        self.app_context["pyramids"][plot_name] = ImagePyramid(image, x_dim, y_dim)
+        return self.refresh_image(plot_name)
+
+    def refresh_image(self, plot_name: str):
+        """Serves the region of the image `plot_name` which is in view of its figure."""
+        figure = self.app_context["figures"][plot_name]
+        view = self.app_context["pyramids"][plot_name].view(
+            (figure.x_range.start, figure.x_range.end),
+            (figure.y_range.start, figure.y_range.end),
+            figure.plot_width,
+            figure.plot_height,
+        )
+
+        image = self.prep_image(view.image)
+        plot = self.app_context["plots"][plot_name]
+        plot.data_source.data = {"image": [image]}
+        plot.glyph.update(x=view.x, y=view.y, dw=view.dw, dh=view.dh)
+        return image
+
+    def refresh_images(self, event=None):
+        """Serves the regions in view of all images shown with `show_image`."""
+        for plot_name in self.app_context["pyramids"]:
+            self.refresh_image(plot_name)
+
+    def enable_level_of_detail(self):
+        """Refines images shown with `show_image` whenever one of their figures is zoomed or panned.
+
+        Ranges are shared between figures, so any zoom refreshes all images, which are then
+        mostly served from cached levels.
+        """
+        from bokeh import events
+
+        for plot_name in self.app_context["pyramids"]:
+            figure = self.app_context["figures"][plot_name]
+            figure.on_event(events.RangesUpdate, self.refresh_images)
+
     @abstractmethod
     def tool_handler(self, doc):
         """Hook for the application configuration and widget definition, without boilerplate."""
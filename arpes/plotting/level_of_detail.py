@@ -0,0 +1,162 @@
+"""Level of detail images for the Bokeh based interactive tools.
+
+Browser based tools cannot show more pixels than the screen has, but sending a full resolution
+image to the browser costs time and memory proportional to the data. An `ImagePyramid` instead
+serves the part of an image which is in view, averaged down to roughly the resolution of the
+figure showing it. Zooming in serves finer levels of a smaller region, down to the raw data.
+
+Downsampled levels are computed with ``DataArray.coarsen`` on first use and cached, so that data
+backed by dask is only read when a level is first needed, and zoomed in views only read the
+region in view.
+"""
+import collections
+import warnings
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import xarray as xr
+
+__all__ = ("ImagePyramid", "ImageView")
+
+# Downsampled levels larger than this in bytes are computed for the region in view only
+LEVEL_CACHE_SIZE = 2 ** 27
+
+# The number of downsampled levels kept per image
+MAX_CACHED_LEVELS = 8
+
+# The fraction of the view on each side which is served in addition, so that small pans
+# do not expose an empty border before the view is refreshed
+VIEW_MARGIN = 0.25
+
+
+@dataclass
+class ImageView:
+    """A region of an image, as drawn by a Bokeh image glyph.
+
+    Attributes:
+        image: The image, with rows along y and columns along x, both increasing.
+        x: The left edge of the image in data coordinates.
+        y: The bottom edge of the image in data coordinates.
+        dw: The width of the image in data coordinates.
+        dh: The height of the image in data coordinates.
+        factors: The number of data pixels averaged into each image pixel along y and x.
+    """
+
+    image: np.ndarray
+    x: float
+    y: float
+    dw: float
+    dh: float
+    factors: Tuple[int, int]
+
+
+class _Axis:
+    """Conversions between coordinates and pixel indices along a uniformly spaced axis."""
+
+    def __init__(self, coords: np.ndarray):
+        self.size = len(coords)
+        self.origin = float(coords[0])
+        self.step = float(coords[1] - coords[0]) if len(coords) > 1 else 1.0
+
+    def index_range(self, value_range: Optional[Tuple[float, float]]) -> Tuple[int, int]:
+        """The pixels overlapping a range of coordinates, as a half open index range."""
+        if value_range is None or any(v is None or not np.isfinite(v) for v in value_range):
+            return 0, self.size
+
+        low, high = sorted((np.asarray(value_range) - self.origin) / self.step)
+        start, stop = int(np.floor(low + 0.5)), int(np.ceil(high + 0.5))
+        start, stop = min(max(start, 0), self.size - 1), min(max(stop, 1), self.size)
+        return start, max(stop, start + 1)
+
+    def extent(self, start: int, stop: int) -> Tuple[float, float]:
+        """The lower edge and the width of the pixels [start, stop) in coordinates."""
+        edges = self.origin + (np.asarray([start, stop]) - 0.5) * self.step
+        return float(edges.min()), float(np.abs(edges[1] - edges[0]))
+
+
+class ImagePyramid:
+    """Serves views of an image at the resolution of the figure showing them.
+
+    Args:
+        data: A two dimensional DataArray with uniformly spaced coordinates.
+        x_dim: The dimension along the horizontal axis of the figure.
+        y_dim: The dimension along the vertical axis of the figure.
+    """
+
+    def __init__(self, data: xr.DataArray, x_dim: str, y_dim: str):
+        """Orient the image with rows along y, with no downsampled levels computed yet."""
+        self.data = data.transpose(y_dim, x_dim)
+        self.axes = (_Axis(self.data.coords[y_dim].values), _Axis(self.data.coords[x_dim].values))
+        self._levels: Dict[Tuple[int, int], np.ndarray] = collections.OrderedDict()
+
+    def _coarsen(self, data: xr.DataArray, factors: Tuple[int, int]) -> np.ndarray:
+        windows = {d: f for d, f in zip(data.dims, factors) if f > 1}
+        if not windows:
+            return np.asarray(data.values)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)  # all NaN blocks
+            return np.asarray(data.coarsen(windows, boundary="pad").mean().values)
+
+    def level(self, factors: Tuple[int, int], region: Tuple[slice, slice]) -> np.ndarray:
+        """The image averaged over blocks of `factors` pixels, restricted to `region`.
+
+        Args:
+            factors: The number of pixels averaged along y and x.
+            region: The region to return, in pixels of the downsampled level.
+        """
+        if factors == (1, 1):
+            return np.asarray(self.data[region].values)
+
+        if factors in self._levels:
+            self._levels.move_to_end(factors)
+            return self._levels[factors][region]
+
+        level_size = self.data.dtype.itemsize * int(np.prod(self.data.shape) / np.prod(factors))
+        if level_size > LEVEL_CACHE_SIZE:
+            source = tuple(slice(s.start * f, s.stop * f) for s, f in zip(region, factors))
+            return self._coarsen(self.data[source], factors)
+
+        self._levels[factors] = self._coarsen(self.data, factors)
+        while len(self._levels) > MAX_CACHED_LEVELS:
+            self._levels.popitem(last=False)
+
+        return self._levels[factors][region]
+
+    def view(
+        self,
+        x_range: Optional[Tuple[float, float]] = None,
+        y_range: Optional[Tuple[float, float]] = None,
+        width: int = 600,
+        height: int = 600,
+    ) -> ImageView:
+        """The visible part of the image, at between one and two pixels per screen pixel.
+
+        Args:
+            x_range: The visible range of x, by default the full image.
+            y_range: The visible range of y, by default the full image.
+            width: The width of the figure in screen pixels.
+            height: The height of the figure in screen pixels.
+        """
+        region, factors = [], []
+        for axis, value_range, pixels in zip(self.axes, (y_range, x_range), (height, width)):
+            start, stop = axis.index_range(value_range)
+            visible = stop - start
+            factor = 2 ** int(np.floor(np.log2(max(visible / max(pixels, 1), 1))))
+
+            margin = int(VIEW_MARGIN * visible)
+            start, stop = max(start - margin, 0), min(stop + margin, axis.size)
+            region.append(slice(start // factor, -(-stop // factor)))
+            factors.append(factor)
+
+        factors = tuple(factors)
+        image = self.level(factors, tuple(region))
+
+        (y, dh), (x, dw) = (
+            axis.extent(s.start * f, s.stop * f) for axis, s, f in zip(self.axes, region, factors)
+        )
+
+        # image glyphs are drawn with coordinates increasing along rows and columns
+        flips = tuple(slice(None, None, -1 if axis.step < 0 else 1) for axis in self.axes)
+        return ImageView(image=image[flips], x=x, y=y, dw=dw, dh=dh, factors=factors)
@@ -1,19 +1,46 @@
-"""Utilities and an example of how to make an animated plot to export as a movie."""
+"""Utilities and an example of how to make an animated plot to export as a movie.
+
+`plot_movie` animates a matplotlib figure, which re-renders the whole figure for every frame.
+For long sweeps through large maps, `write_movie` instead renders frames straight from slices of
+the data: values are normalized and mapped through a colormap lookup table in NumPy, blocks of
+frames are rendered on worker threads, and raw RGB frames are piped into ffmpeg as they are
+produced. Only one block of frames per worker is ever loaded, so data backed by dask or a memory
+map is streamed from disk.
+"""
+import collections
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union
+
+import matplotlib.cm
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib import animation
+from matplotlib.colors import Colormap
 
 import arpes.config
 import xarray as xr
 from arpes.plotting.utils import path_for_plot
 from arpes.provenance import save_plot_provenance
+from arpes.utilities.jit import kernel
+
+__all__ = ("plot_movie", "render_frames", "write_movie")
+
+# Upper bound in bytes on the rendered frames held by each block
+MOVIE_BLOCK_SIZE = 2 ** 25
 
-__all__ = ("plot_movie",)
+# Entries in colormap lookup tables, the last entry holds the color for NaN
+LOOKUP_TABLE_SIZE = 256
 
 
 @save_plot_provenance
 def plot_movie(data: xr.DataArray, time_dim, interval=None, fig=None, ax=None, out=None, **kwargs):
-    """Make an animated plot of a 3D dataset using one dimension as "time"."""
+    """Make an animated plot of a 3D dataset using one dimension as "time".
+
+    To export long or large movies, `write_movie` is much faster.
+    """
     if not isinstance(data, xr.DataArray):
         raise TypeError("You must provide a DataArray")
 
@@ -72,3 +99,250 @@ def plot_movie(data: xr.DataArray, time_dim, interval=None, fig=None, ax=None, o
 
     # plt.show()
     return anim
+
+
+def _color_limits(data: xr.DataArray, vmin=None, vmax=None, cmap=None):
+    """Colormap and limits for `data`, chosen in the same way as by `plot_movie`."""
+    if cmap is None:
+        cmap = arpes.config.SETTINGS.get("interactive", {}).get("palette", "viridis")
+
+    if vmin is None or vmax is None:
+        data_max, data_min = data.max().item(), data.min().item()
+        if data.S.is_subtracted:
+            cmap = "RdBu"
+            data_max = max(abs(data_min), abs(data_max))
+            data_min = -data_max
+
+        vmin = data_min if vmin is None else vmin
+        vmax = data_max if vmax is None else vmax
+
+    return cmap, vmin, vmax
+
+
+def _lookup_table(cmap: Union[str, Colormap]) -> np.ndarray:
+    """RGB values of a colormap with LOOKUP_TABLE_SIZE - 1 colors followed by the NaN color."""
+    if isinstance(cmap, str):
+        cmap = matplotlib.cm.get_cmap(cmap)
+
+    colors = cmap(np.linspace(0, 1, LOOKUP_TABLE_SIZE - 1))
+    colors = np.concatenate([colors, [cmap.get_bad()]])
+    return np.round(colors[:, :3] * 255).astype(np.uint8)
+
+
+def _frame_layout(data: xr.DataArray, time_dim: str) -> Tuple[List[str], Tuple[slice, slice]]:
+    """The frame dimensions in raster order (rows, columns) and the flips to apply to them.
+
+    Frames are drawn as by `plot_movie`, with the first frame dimension horizontal and the second
+    vertical, and with coordinates increasing to the right and upwards.
+    """
+    horizontal, vertical = [d for d in data.dims if d != time_dim]
+
+    def increasing(dim):
+        coordinate = data.coords[dim].values if dim in data.coords else None
+        return coordinate is None or len(coordinate) < 2 or coordinate[-1] >= coordinate[0]
+
+    flips = (
+        slice(None, None, -1 if increasing(vertical) else 1),
+        slice(None, None, 1 if increasing(horizontal) else -1),
+    )
+    return [time_dim, vertical, horizontal], flips
+
+
+def _render_examples(dtype):
+    values = np.zeros((2, 3, 3), dtype=dtype)
+    lut = np.zeros((LOOKUP_TABLE_SIZE, 3), dtype=np.uint8)
+    return [(values, lut, 0.0, 1.0, 1, np.zeros((2, 4, 4, 3), dtype=np.uint8))]
+
+
+@kernel(nogil=True, examples=_render_examples)
+def _render_block(values, lut, vmin, factor, scale, out):
+    """Colors frames [n_frames, rows, columns] through a lookup table into RGB frames `out`.
+
+    Each value is enlarged to `scale` x `scale` pixels. Rows and columns of `out` beyond the
+    enlarged frame repeat the last row or column, which pads frames to an even size.
+    """
+    levels = lut.shape[0] - 1
+    for i in range(out.shape[0]):
+        for r in range(out.shape[1]):
+            source_row = min(r // scale, values.shape[1] - 1)
+            for c in range(out.shape[2]):
+                value = values[i, source_row, min(c // scale, values.shape[2] - 1)]
+                if np.isnan(value):
+                    level = levels
+                else:
+                    level = int(min(max((value - vmin) * factor + 0.5, 0), levels - 1))
+
+                for channel in range(3):
+                    out[i, r, c, channel] = lut[level, channel]
+
+
+def _frame_blocks(
+    data: xr.DataArray,
+    time_dim: str,
+    vmin,
+    vmax,
+    cmap,
+    scale: int = 1,
+    workers: Optional[int] = None,
+) -> Iterator[np.ndarray]:
+    """Renders the frames of a movie in order, one block of frames at a time.
+
+    Blocks are rendered on a pool of worker threads, at most two blocks ahead per worker of the
+    consumer, so that memory use stays bounded for arbitrarily long movies.
+    """
+    dims, flips = _frame_layout(data, time_dim)
+    data = data.transpose(*dims)
+    lut = _lookup_table(cmap)
+    factor = (LOOKUP_TABLE_SIZE - 2) / (vmax - vmin if vmax != vmin else 1)
+
+    # most video encoders require an even frame size
+    n_frames, rows, columns = data.shape
+    height, width = (-(-n * scale // 2) * 2 for n in (rows, columns))
+    block = max(MOVIE_BLOCK_SIZE // (3 * height * width), 1)
+    workers = workers or os.cpu_count() or 1
+
+    def render(start):
+        values = np.asarray(data[start : start + block].values)
+        if values.dtype.kind != "f":
+            values = values.astype(np.float64)
+
+        out = np.empty((len(values), height, width, 3), dtype=np.uint8)
+        _render_block(values[(slice(None),) + flips], lut, float(vmin), factor, scale, out)
+        return out
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        starts = iter(range(0, n_frames, block))
+        for start in starts:
+            pending.append(executor.submit(render, start))
+            if len(pending) >= 2 * workers:
+                break
+
+        while pending:
+            yield pending.popleft().result()
+            start = next(starts, None)
+            if start is not None:
+                pending.append(executor.submit(render, start))
+
+
+def render_frames(
+    data: xr.DataArray,
+    time_dim: str,
+    vmin=None,
+    vmax=None,
+    cmap: Optional[Union[str, Colormap]] = None,
+    scale: int = 1,
+    workers: Optional[int] = None,
+) -> np.ndarray:
+    """Renders each slice of `data` along `time_dim` to an RGB image.
+
+    Args:
+        data: A 3D DataArray.
+        time_dim: The dimension which is animated.
+        vmin: The value at the bottom of the colormap, by default the minimum of the data.
+        vmax: The value at the top of the colormap, by default the maximum of the data.
+        cmap: The colormap, by default the interactive palette (or "RdBu" for subtracted data).
+        scale: An integer factor by which each pixel is enlarged.
+        workers: The number of threads rendering frames, by default one per core.
+
+    Returns:
+        The frames as uint8 with shape [n_frames, height, width, 3], padded to an even height
+        and width.
+    """
+    cmap, vmin, vmax = _color_limits(data, vmin, vmax, cmap)
+    return np.concatenate(list(_frame_blocks(data, time_dim, vmin, vmax, cmap, scale, workers)))
+
+
+@save_plot_provenance
+def write_movie(
+    data: xr.DataArray,
+    time_dim: str,
+    out: str,
+    fps: float = 10,
+    vmin=None,
+    vmax=None,
+    cmap: Optional[Union[str, Colormap]] = None,
+    scale: int = 1,
+    codec: str = "libx264",
+    workers: Optional[int] = None,
+    ffmpeg: str = "ffmpeg",
+    ffmpeg_args: Optional[List[str]] = None,
+) -> str:
+    """Renders a movie of a 3D dataset using one dimension as "time", streaming frames to ffmpeg.
+
+    Frames show the raw pixels of each slice, without axes. Hardware encoders can be used by
+    passing their name as the codec, such as "h264_nvenc" or "h264_videotoolbox".
+
+    Example:
+        A sweep through the energy of a Fermi surface map
+
+        >>> write_movie(fermi_surface, "eV", "fs-sweep.mp4", fps=25, scale=2)  # doctest: +SKIP
+
+    Args:
+        data: A 3D DataArray, which can be backed by dask or a memory map.
+        time_dim: The dimension which is animated.
+        out: The desired path of the movie, placed into the workspace as for `plot_movie`.
+        fps: The frame rate.
+        vmin: The value at the bottom of the colormap, by default the minimum of the data.
+        vmax: The value at the top of the colormap, by default the maximum of the data.
+        cmap: The colormap, by default the interactive palette (or "RdBu" for subtracted data).
+        scale: An integer factor by which each pixel is enlarged.
+        codec: The ffmpeg video encoder.
+        workers: The number of threads rendering frames, by default one per core.
+        ffmpeg: The ffmpeg executable.
+        ffmpeg_args: Further ffmpeg output options, such as ``["-crf", "18"]``.
+
+    Returns:
+        The path of the movie.
+    """
+    if not isinstance(data, xr.DataArray):
+        raise TypeError("You must provide a DataArray")
+
+    cmap, vmin, vmax = _color_limits(data, vmin, vmax, cmap)
+    blocks = _frame_blocks(data, time_dim, vmin, vmax, cmap, scale, workers)
+    first = next(blocks)
+    height, width = first.shape[1:3]
+
+    path = path_for_plot(out)
+    command = [
+        ffmpeg,
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+        "-an",
+        "-c:v",
+        codec,
+        "-pix_fmt",
+        "yuv420p",
+        *(ffmpeg_args or []),
+        path,
+    ]
+
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=log)
+        try:
+            process.stdin.write(first.tobytes())
+            for block in blocks:
+                process.stdin.write(block.tobytes())
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+            return_code = process.wait()
+
+        if return_code != 0:
+            log.seek(0)
+            message = log.read().decode(errors="replace")
+            raise RuntimeError(f"ffmpeg exited with status {return_code}: {message}")
+
+    return path
@@ -18,6 +18,9 @@ __all__ = (
 
 qt_info.setup_pyqtgraph()
 
+# The momentum conversion is first previewed on every n-th point of the momentum grid
+COARSE_PREVIEW_STEP = 4
+
 
 class KTool(SimpleApp):
     """Provides a live momentum converting tool.
@@ -46,6 +49,7 @@ class KTool(SimpleApp):
             self.segments_x, self.segments_y = segments_standard(zone)
         else:
             self.segments_x, self.segments_y = None, None
+        self.bz_items = []
 
         self.conversion_kwargs = kwargs
         self.data = None
@@ -122,23 +126,57 @@ class KTool(SimpleApp):
     def update_data(self):
         """The main redraw method for this tool.
 
-        Converts data into momentum space and populates both the angle-space and momentum
-        space views.
-
-        If a Brillouin zone was requestd, plots that over the data as well.
+        Populates the angle-space view, and converts data into momentum space in the background.
+        A coarse preview of the momentum space view is shown first and then refined, and changes
+        to the offsets while a conversion is running replace it.
         """
         self.views["xy"].setImage(self.data)
 
-        kdata = convert_to_kspace(self.data, **self.conversion_kwargs)
-        if "eV" in kdata.dims:
-            kdata = kdata.S.transpose_to_back("eV")
-
-        self.views["kxy"].setImage(kdata.S.nan_to_num())
-        if self.segments_x is not None:
-            bz_plot = self.views["kxy"].plot_item
-            kx, ky = self.conversion_kwargs["kx"], self.conversion_kwargs["ky"]
-            for segx, segy in zip(self.segments_x, self.segments_y):
-                bz_plot.plot((segx - kx[0]) / (kx[1] - kx[0]), (segy - ky[0]) / (ky[1] - ky[0]))
+        # the conversion runs on a snapshot, as offsets are applied to the data in place
+        data = self.data.copy(deep=False)
+        coarse_kwargs = {
+            k: v[::COARSE_PREVIEW_STEP] if isinstance(v, np.ndarray) else v
+            for k, v in self.conversion_kwargs.items()
+        }
+
+        def convert(kwargs):
+            kdata = convert_to_kspace(data, **kwargs)
+            if "eV" in kdata.dims:
+                kdata = kdata.S.transpose_to_back("eV")
+
+            return kdata.S.nan_to_num()
+
+        # results are reused for the same data, momentum grid and offsets
+        grid = tuple(
+            (k, v.tobytes() if isinstance(v, np.ndarray) else v)
+            for k, v in sorted(self.conversion_kwargs.items())
+        )
+        offsets = tuple(sorted((k, v) for k, v in data.attrs.items() if k.endswith("_offset")))
+        self.background.submit(
+            "kxy",
+            [lambda: convert(coarse_kwargs), lambda: convert(self.conversion_kwargs)],
+            self.show_kdata,
+            key=(id(self.data), grid, offsets),
+        )
+
+    def show_kdata(self, kdata, final=True):
+        """Shows converted data, and the Brillouin zone over it if one was requested.
+
+        The zone is drawn in pixel units of the image, so its segments are moved rather than
+        drawn again whenever the image, which may be a coarse preview, is replaced.
+        """
+        self.views["kxy"].setImage(kdata)
+        if self.segments_x is None:
+            return
+
+        bz_plot = self.views["kxy"].plot_item
+        kx, ky = kdata.coords["kx"].values, kdata.coords["ky"].values
+        for i, (segx, segy) in enumerate(zip(self.segments_x, self.segments_y)):
+            x, y = (segx - kx[0]) / (kx[1] - kx[0]), (segy - ky[0]) / (ky[1] - ky[0])
+            if i < len(self.bz_items):
+                self.bz_items[i].setData(x, y)
+            else:
+                self.bz_items.append(bz_plot.plot(x, y))
 
     def before_show(self):
         """Lifecycle hook for configuration before app show."""
@@ -172,6 +210,9 @@ class KTool(SimpleApp):
 
         self.data = data.copy(deep=True)
 
+        # the identity of replaced data can be reused, so results for it are dropped
+        self.background.clear_cache()
+
         if not self.conversion_kwargs:
             rng_mul = 1
             if data.coords["hv"] < 12:
@@ -13,6 +13,7 @@ from typing import List, Union
 import arpes.config
 import arpes.xarray_extensions
 from arpes.utilities import normalize_to_spectrum
+from arpes.utilities.marginals import MarginalCache
 from arpes.typing import DataType
 from arpes.utilities.qt.data_array_image_view import DataArrayPlot
 
@@ -160,6 +161,8 @@ class QtTool(SimpleApp):
         self.kspace_info_widgets = []
 
         self._binning = None
+        self._marginals = None
+        self._pending_cursor = None
 
     def center_cursor(self):
         """Scrolls so that the cursors are in the center of the data volume."""
@@ -299,12 +302,46 @@ class QtTool(SimpleApp):
         owner = weakref.ref(self)
 
         def connected_cursor(line: CursorRegion):
-            new_cursor = list(owner().context["cursor"])
+            new_cursor = owner().cursor
             new_cursor[dimension] = line.getRegion()[0]
-            owner().update_cursor_position(new_cursor)
+            owner().request_cursor_position(new_cursor)
 
         the_line.sigRegionChanged.connect(connected_cursor)
 
+    @property
+    def cursor(self):
+        """The latest cursor position, including a requested position which is not drawn yet."""
+        if self._pending_cursor is not None:
+            return list(self._pending_cursor)
+
+        return list(self.context["cursor"])
+
+    def request_cursor_position(self, new_cursor):
+        """Moves the cursor once pending events are handled, coalescing rapid cursor moves.
+
+        Dragging a cursor emits many more events than can be drawn. Each request replaces the
+        pending position, which is drawn when the event loop is next idle, so that only the
+        latest position is rendered.
+        """
+        already_pending = self._pending_cursor is not None
+        self._pending_cursor = list(new_cursor)
+
+        if not already_pending:
+            QtCore.QTimer.singleShot(0, self._draw_pending_cursor)
+
+    def _draw_pending_cursor(self):
+        new_cursor, self._pending_cursor = self._pending_cursor, None
+        if new_cursor is not None:
+            self.update_cursor_position(new_cursor)
+
+    def marginal(self, select_coord):
+        """The data averaged over the index windows in `select_coord`, from cached prefix sums."""
+        if self._marginals is None:
+            self._marginals = MarginalCache(self.data)
+
+        marginal = self._marginals.marginal(select_coord)
+        return marginal.transpose(*[d for d in self.data.dims if d in marginal.dims])
+
     def update_cursor_position(self, new_cursor, force=False, keep_levels=True):
         """Sets the current cursor position.
 
@@ -366,15 +403,11 @@ class QtTool(SimpleApp):
                         )
                     )
                     if isinstance(reactive.view, DataArrayImageView):
-                        image_data = self.data.isel(**select_coord)
-                        if select_coord:
-                            image_data = image_data.mean(list(select_coord.keys()))
+                        image_data = self.marginal(select_coord)
                         reactive.view.setImage(image_data, keep_levels=keep_levels)
 
                     elif isinstance(reactive.view, pg.PlotWidget):
-                        for_plot = self.data.isel(**select_coord)
-                        if select_coord:
-                            for_plot = for_plot.mean(list(select_coord.keys()))
+                        for_plot = self.marginal(select_coord)
 
                         cursors = [
                             l
@@ -483,6 +516,7 @@ class QtTool(SimpleApp):
 
         self.data = data
         self._binning = [1 for _ in self.data.dims]
+        self._marginals = MarginalCache(data)
 
 
 def _qt_tool(data: DataType, **kwargs):
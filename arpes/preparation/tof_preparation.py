@@ -1,7 +1,9 @@
 """Data prep routines for time-of-flight data."""
+import functools
 import math
 
 import numpy as np
+import scipy.sparse
 
 import xarray as xr
 from arpes.provenance import update_provenance
@@ -9,6 +11,7 @@ from arpes.provenance import update_provenance
 from .axis_preparation import transform_dataarray_axis
 
 __all__ = [
+    "build_kinetic_energy_rebinning",
     "build_KE_coords_to_time_pixel_coords",
     "build_KE_coords_to_time_coords",
     "process_DLD",
@@ -16,8 +19,81 @@ __all__ = [
 ]
 
 
+def _time_bin_edges(timing: np.ndarray) -> np.ndarray:
+    """Edges of the bins around each timing sample, halfway between neighboring samples."""
+    midpoints = (timing[1:] + timing[:-1]) / 2
+    first = 2 * timing[0] - midpoints[0]
+    last = 2 * timing[-1] - midpoints[-1]
+    return np.concatenate([[first], midpoints, [last]])
+
+
+def build_kinetic_energy_rebinning(
+    timing: np.ndarray, kinetic_energy_axis: np.ndarray, conversion: float
+) -> scipy.sparse.csr_matrix:
+    """Builds the sparse matrix redistributing counts from timing bins into kinetic energy bins.
+
+    Each timing sample is treated as a bin extending halfway to its neighbors, with its counts
+    uniformly distributed across the bin. An energy bin E +/- dE/2 receives the counts from
+    the portion of each timing bin which overlaps the interval of flight times sqrt(c / E)
+    it corresponds to, so that spectral weight is conserved.
+
+    The matrix depends only on the timing axis, the energy axis, and the spectrometer
+    conversion constant and can be reused for every spectrum sharing these.
+
+    Args:
+        timing: The increasing time coordinate of the data.
+        kinetic_energy_axis: The centers of the desired (evenly spaced) kinetic energy bins.
+        conversion: The constant c in t = sqrt(c / E).
+
+    Returns:
+        A [len(kinetic_energy_axis), len(timing)] sparse matrix.
+    """
+    timing = np.asarray(timing, dtype=np.float64)
+    kinetic_energy_axis = np.asarray(kinetic_energy_axis, dtype=np.float64)
+    assert timing[1] > timing[0]
+
+    time_edges = _time_bin_edges(timing)
+    time_widths = np.diff(time_edges)
+
+    d_energy = kinetic_energy_axis[1] - kinetic_energy_axis[0]
+    high_energy = kinetic_energy_axis + d_energy / 2
+    low_energy = kinetic_energy_axis - d_energy / 2
+
+    # higher energies arrive earlier
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_early = np.where(high_energy > 0, np.sqrt(conversion / high_energy), np.inf)
+        t_late = np.where(low_energy > 0, np.sqrt(conversion / low_energy), np.inf)
+
+    # the range of timing bins overlapping each energy bin
+    first = np.clip(np.searchsorted(time_edges, t_early, side="right") - 1, 0, len(timing))
+    last = np.clip(np.searchsorted(time_edges, t_late, side="left"), 0, len(timing))
+    counts = np.maximum(last - first, 0)
+
+    rows = np.repeat(np.arange(len(kinetic_energy_axis)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = first[rows] + offsets
+
+    overlap = np.minimum(time_edges[cols + 1], t_late[rows]) - np.maximum(
+        time_edges[cols], t_early[rows]
+    )
+    weights = np.clip(overlap, 0, None) / time_widths[cols]
+
+    return scipy.sparse.csr_matrix(
+        (weights, (rows, cols)), shape=(len(kinetic_energy_axis), len(timing))
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_kinetic_energy_rebinning(
+    timing: bytes, kinetic_energy_axis: bytes, conversion: float
+) -> scipy.sparse.csr_matrix:
+    return build_kinetic_energy_rebinning(
+        np.frombuffer(timing), np.frombuffer(kinetic_energy_axis), conversion
+    )
+
+
 @update_provenance("Convert ToF data from timing signal to kinetic energy")
-def convert_to_kinetic_energy(dataarray, kinetic_energy_axis):
+def convert_to_kinetic_energy(dataarray, kinetic_energy_axis, rebinning=None):
     """Convert the ToF timing information into an energy histogram.
 
     The core of these routines come from the Igor procedures in
@@ -31,6 +107,10 @@ def convert_to_kinetic_energy(dataarray, kinetic_energy_axis):
     3. Rebins a time spectrum into an energy spectrum, preserving the
        spectral weight, this requires a modicum of care around splitting
        counts at the edges of the new bins.
+
+    The rebinning is a sparse matrix product along the time axis applied to all
+    other axes at once, see `build_kinetic_energy_rebinning`. Matrices are cached
+    per timing axis, energy axis, and spectrometer, or can be passed as `rebinning`.
     """
     # This should be simplified
     # c = (0.5) * (9.11e-31) * self.mstar * (self.length ** 2) / (1.6e-19) * (1e18)
@@ -51,38 +131,18 @@ def convert_to_kinetic_energy(dataarray, kinetic_energy_axis):
 
     timing = dataarray.coords["time"].values
     assert timing[1] > timing[0]
-    t_min, t_max = np.min(timing), np.max(timing)
-
-    # Prep arrays
-    d_energy = kinetic_energy_axis[1] - kinetic_energy_axis[0]
-    time_index = 0  # after transpose
-    new_shape = list(dataarray.data.shape)
-    new_shape[time_index] = len(kinetic_energy_axis)
 
-    new_data = np.zeros(tuple(new_shape))
-
-    def energy_to_time(conv, energy):
-        return math.sqrt(conv / energy)
+    if rebinning is None:
+        rebinning = _cached_kinetic_energy_rebinning(
+            np.asarray(timing, dtype=np.float64).tobytes(),
+            np.asarray(kinetic_energy_axis, dtype=np.float64).tobytes(),
+            float(c),
+        )
 
     # Rebin data
     old_data = dataarray.data
-    for i, E in enumerate(kinetic_energy_axis):
-        t_L = energy_to_time(c, E + d_energy / 2)
-        t_S = energy_to_time(c, E - d_energy / 2)
-
-        # clamp
-        t_L = t_L if t_L <= t_max else t_max
-        t_S = t_S if t_S > t_min else t_min
-
-        # with some math we could back calculate the index, but we don't need to
-        t_L_idx = np.searchsorted(timing, t_L)
-        t_S_idx = np.searchsorted(timing, t_S)
-
-        new_data[i] = (
-            np.sum(old_data[t_L_idx:t_S_idx], axis=0)
-            + ((timing[t_L_idx] - t_L) * old_data[t_L_idx])
-            + ((t_S - timing[t_S_idx - 1]) * old_data[t_S_idx - 1]) / d_energy
-        )
+    new_data = rebinning @ old_data.reshape(len(timing), -1)
+    new_data = np.asarray(new_data).reshape((len(kinetic_energy_axis),) + old_data.shape[1:])
 
     new_coords = dict(dataarray.coords)
     del new_coords["time"]
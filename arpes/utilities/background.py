@@ -0,0 +1,184 @@
+"""Cancellable background computations with progressive results, for interactive tools.
+
+Interactive tools recompute views, such as a momentum conversion preview, whenever a control
+changes. On the UI thread this freezes the window until the computation finishes, and every
+intermediate value of a control queues another computation behind it.
+
+`BackgroundJobs` runs these computations on worker threads instead. Jobs are submitted to a named
+channel, typically one per view, and replace the job on their channel which was submitted before
+them: replaced jobs are skipped if they have not started, and stop after their current stage
+otherwise. A job consists of stages producing successively better results, for instance a coarse
+and then a full resolution conversion, each of which is shown as soon as it is ready. Final
+results are kept in a bounded cache, so that returning to earlier settings is immediate.
+
+Results are passed to the result callback through a `deliver` callable, which UI toolkits use to
+run the callback on their UI thread. Results of replaced jobs are never delivered.
+"""
+import collections
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence
+
+__all__ = ("BackgroundJobs", "Job")
+
+# The number of final results kept by default
+RESULT_CACHE_SIZE = 32
+
+_MISSING = object()
+
+
+class Job:
+    """A computation submitted to `BackgroundJobs`.
+
+    Attributes:
+        channel: The channel the job was submitted to.
+        key: The key of the result in the result cache, or None if it is not cached.
+        done: Set once the job has finished, was skipped, or failed.
+    """
+
+    def __init__(self, channel: str, key: Optional[Hashable] = None):
+        """Create a job which is neither cancelled nor done."""
+        self.channel = channel
+        self.key = key
+        self.done = threading.Event()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Skips the remaining stages of the job, and drops any results not yet delivered."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job was cancelled or replaced by a newer job on its channel."""
+        return self._cancelled.is_set()
+
+
+class BackgroundJobs:
+    """Runs jobs on worker threads, keeping only the most recent job on each channel.
+
+    Args:
+        deliver: Called from a worker thread with a function of no arguments which delivers a
+          result. By default the result is delivered on the worker thread.
+        max_workers: The number of worker threads. With the default of one, jobs for different
+          channels run one after another.
+        cache_size: The number of final results to keep.
+    """
+
+    def __init__(
+        self,
+        deliver: Optional[Callable[[Callable[[], None]], None]] = None,
+        max_workers: int = 1,
+        cache_size: int = RESULT_CACHE_SIZE,
+    ):
+        """Start the worker threads lazily, with no jobs and an empty result cache."""
+        self.deliver = deliver or (lambda fn: fn())
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="arpes-background"
+        )
+        self._jobs: Dict[str, Job] = {}
+        self._results: Dict[Hashable, Any] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        channel: str,
+        stages: Sequence[Callable[[], Any]],
+        on_result: Callable[[Any, bool], None],
+        key: Optional[Hashable] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> Job:
+        """Computes `stages` in the background, replacing the current job on `channel`.
+
+        If the final result for `key` is cached, it is passed to `on_result` immediately and
+        no stages are run.
+
+        Args:
+            channel: The name of the view or quantity which is computed.
+            stages: Functions of no arguments computing the result, from coarsest to finest.
+            on_result: Called with each result and whether it is the final one.
+            key: Identifies the final result in the cache, None to not cache it.
+            on_error: Called with any exception raised by a stage, by default it is warned.
+
+        Returns:
+            The submitted job.
+        """
+        job = Job(channel, key)
+        with self._lock:
+            previous = self._jobs.get(channel)
+            if previous is not None:
+                previous.cancel()
+            self._jobs[channel] = job
+            cached = self._lookup(key)
+
+        if cached is not _MISSING:
+            on_result(cached, True)
+            job.done.set()
+            return job
+
+        self._executor.submit(self._run, job, list(stages), on_result, on_error)
+        return job
+
+    def cancel(self, channel: Optional[str] = None):
+        """Cancels the job on `channel`, or on all channels."""
+        with self._lock:
+            for name, job in self._jobs.items():
+                if channel is None or name == channel:
+                    job.cancel()
+
+    def clear_cache(self):
+        """Drops all cached results, for instance when the data they were computed from changes."""
+        with self._lock:
+            self._results.clear()
+
+    def shutdown(self):
+        """Cancels all jobs and stops the worker threads once the running stages finish."""
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _lookup(self, key: Optional[Hashable]) -> Any:
+        if key is None or key not in self._results:
+            return _MISSING
+
+        self._results.move_to_end(key)
+        return self._results[key]
+
+    def _store(self, key: Optional[Hashable], result: Any):
+        if key is None:
+            return
+
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def _deliver(self, job: Job, callback: Callable, *args):
+        def deliver():
+            # checked where the result is delivered, so that replacing a job on the UI thread
+            # also drops its results which are already on their way
+            if not job.cancelled:
+                callback(*args)
+
+        self.deliver(deliver)
+
+    def _run(self, job: Job, stages: Sequence[Callable[[], Any]], on_result, on_error):
+        try:
+            for i, stage in enumerate(stages):
+                if job.cancelled:
+                    return
+
+                result = stage()
+                final = i == len(stages) - 1
+                if final:
+                    self._store(job.key, result)
+
+                self._deliver(job, on_result, result, final)
+        except Exception as e:  # pylint: disable=broad-except
+            self._deliver(job, on_error or _warn_failed, e)
+        finally:
+            job.done.set()
+
+
+def _warn_failed(error: Exception):
+    warnings.warn(f"Background computation failed: {error!r}")
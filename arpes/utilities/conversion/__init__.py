@@ -4,3 +4,4 @@ from .remap_manipulator import *
 from .forward import *
 from .calibration import *
 from .trapezoid import *
+from .pipeline import *
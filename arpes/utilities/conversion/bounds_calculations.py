@@ -3,6 +3,9 @@
 Mostly these are used as common helper routines to the coordinate conversion code,
 which is responsible for actually outputing the desired bounds.
 """
+import itertools
+from typing import Callable, Dict, List, Optional, Tuple
+
 import numpy as np
 
 import arpes.constants
@@ -12,6 +15,8 @@ __all__ = (
     "calculate_kp_kz_bounds",
     "calculate_kx_ky_bounds",
     "calculate_kp_bounds",
+    "calculate_momentum_bounds",
+    "calculate_momentum_resolution",
     "full_angles_to_k",
     "full_angles_to_k_approx",
 )
@@ -151,64 +156,260 @@ def spherical_to_kz(
     return arpes.constants.K_INV_ANGSTROM * np.sqrt(kinetic_energy * np.cos(theta) ** 2 + inner_V)
 
 
-def calculate_kp_kz_bounds(arr: xr.DataArray):
-    """Calculates kp and kz bounds for angle-hv Fermi surfaces."""
-    phi_offset = arr.S.phi_offset
-    phi_min = np.min(arr.coords["phi"].values) - phi_offset
-    phi_max = np.max(arr.coords["phi"].values) - phi_offset
+def _coordinate_step(arr: xr.DataArray, name: str) -> Optional[float]:
+    """The typical spacing of a coordinate, or None if it is not sampled."""
+    values = np.asarray(arr.coords[name].values) if name in arr.dims else np.zeros(1)
+    if len(values) < 2:
+        return None
+    return float(np.median(np.abs(np.diff(values))))
 
-    binding_energy_min, binding_energy_max = np.min(arr.coords["eV"].values), np.max(
-        arr.coords["eV"].values
-    )
-    hv_min, hv_max = np.min(arr.coords["hv"].values), np.max(arr.coords["hv"].values)
 
-    wf = arr.S.work_function
-    kx_min = min(
-        spherical_to_kx(hv_max - binding_energy_max - wf, phi_min, 0),
-        spherical_to_kx(hv_min - binding_energy_max - wf, phi_min, 0),
+def _coordinate_range(arr: xr.DataArray, name: str, offset: float = 0) -> Tuple[float, float]:
+    values = np.asarray(arr.S.lookup_coord(name), dtype=np.float64) - offset
+    return float(np.min(values)), float(np.max(values))
+
+
+def _edge_extrema(f: Callable[[np.ndarray], np.ndarray], low: float, high: float) -> np.ndarray:
+    """Extrema on [low, high] of f(t) = A sin(t) + B cos(t) + C.
+
+    Every component of the photoemission direction has this form as a function of any single angle
+    when the others are held fixed, because the angles enter only through rotations. A, B, and C
+    follow from three evaluations, after which the interior extrema are at tan(t) = A / B.
+    """
+    zero, quarter, half = f(np.array([0.0, np.pi / 2, np.pi]))
+    constant = (zero + half) / 2
+    critical = np.arctan2(quarter - constant, zero - constant) + np.pi * np.arange(-2, 3)
+    t = np.concatenate([[low, high], critical[(critical > low) & (critical < high)]])
+    values = f(t)
+    return np.array([np.min(values), np.max(values)])
+
+
+def _direction_extents(direction: Callable, ranges: List[Tuple[float, float]]) -> np.ndarray:
+    """The extents of each component of `direction` over a rectangular domain of angles.
+
+    Components have no interior extrema for physical angles (this would require emission along a
+    momentum axis), so it suffices to find the extrema along each edge of the domain.
+    """
+    n_components = len(direction(*[np.array([r[0]]) for r in ranges]))
+    extents = np.array([[np.inf, -np.inf]] * n_components)
+
+    for axis, (low, high) in enumerate(ranges):
+        others = [r for i, r in enumerate(ranges) if i != axis]
+        for fixed in itertools.product(*others):
+            for component in range(n_components):
+
+                def along_edge(t):
+                    angles = [np.full_like(t, value) for value in fixed]
+                    angles.insert(axis, t)
+                    return np.broadcast_to(direction(*angles)[component], t.shape)
+
+                lowest, highest = _edge_extrema(along_edge, low, high)
+                extents[component] = [
+                    min(extents[component][0], lowest),
+                    max(extents[component][1], highest),
+                ]
+
+    return extents
+
+
+def _momentum_geometry(arr: xr.DataArray):
+    """Describes the momenta reached by `arr` in the same conventions as the inverse conversions.
+
+    The momentum of every sample is ``k * direction(*angles)`` where ``k`` depends only on the
+    energy coordinates (binding and photon energy).
+
+    Returns:
+        The momentum dimension names, the direction as a function of the angles, the range and
+        sample spacing of each angle, the range of ``k``, and the change of ``k`` between
+        neighboring photon energies (or None).
+    """
+    binding_energy = _coordinate_range(arr, "eV") if "eV" in arr.coords else (0.0, 0.0)
+    hv = _coordinate_range(arr, "hv")
+    kinetic_energy = (
+        np.array([hv[0] + binding_energy[0], hv[1] + binding_energy[1]]) - arr.S.work_function
     )
-    kx_max = max(
-        spherical_to_kx(hv_max - binding_energy_max - wf, phi_max, 0),
-        spherical_to_kx(hv_min - binding_energy_max - wf, phi_max, 0),
+    phi_step = _coordinate_step(arr, "phi")
+    scan_angles = [d for d in ["psi", "beta", "theta"] if d in arr.indexes]
+
+    k_tot = tuple(arpes.constants.K_INV_ANGSTROM * np.sqrt(kinetic_energy))
+    k_step = None
+    if "hv" in arr.dims and _coordinate_step(arr, "hv") is not None:
+        k_step = arpes.constants.K_INV_ANGSTROM ** 2 * _coordinate_step(arr, "hv") / sum(k_tot)
+
+    if "hv" in arr.dims and not scan_angles:
+        # kz is treated separately by _kz_bounds_and_step, because it depends on the inner potential
+        def direction(phi):
+            return (np.sin(phi),)
+
+        ranges = [_coordinate_range(arr, "phi", arr.S.phi_offset)]
+        return ["kp"], direction, ranges, [phi_step], k_tot, k_step
+
+    is_slit_vertical = np.abs(arr.S.lookup_offset_coord("alpha") - np.pi / 2) < (np.pi / 180)
+
+    if not scan_angles:
+        if is_slit_vertical:
+            polar_angle = arr.S.lookup_offset_coord("theta") + arr.S.lookup_offset_coord("psi")
+            parallel_angle = arr.S.lookup_offset_coord("beta")
+        else:
+            polar_angle = arr.S.lookup_offset_coord("beta") + arr.S.lookup_offset_coord("psi")
+            parallel_angle = arr.S.lookup_offset_coord("theta")
+
+        def direction(phi):
+            return (np.cos(polar_angle) * np.sin(phi),)
+
+        ranges = [_coordinate_range(arr, "phi", arr.S.phi_offset + parallel_angle)]
+        return ["kp"], direction, ranges, [phi_step], k_tot, None
+
+    # kx-ky scans, mirroring the offsets and the arcsin inversions in ConvertKxKy
+    scan_angle = scan_angles[0]
+    parallel_angles = (
+        "beta" if is_slit_vertical else "theta",
+        "theta" if scan_angle == "psi" else "psi",
     )
+    phi_offset = arr.S.phi_offset + arr.S.lookup_offset_coord(parallel_angles[0])
+    parallel_offset = arr.S.lookup_offset_coord(parallel_angles[1])
+    scan_offset = {
+        "psi": arr.S.psi_offset + (-parallel_offset if is_slit_vertical else parallel_offset),
+        "beta": arr.S.beta_offset + parallel_offset,
+        "theta": arr.S.theta_offset - parallel_offset,
+    }[scan_angle]
+
+    chi = arr.S.lookup_offset_coord("chi")
+    if np.abs(chi) <= 0.5 * np.pi / 180:
+        # the conversion only rotates for larger chi
+        chi = 0
+
+    def direction(phi, perp):
+        if scan_angle == "psi" and is_slit_vertical:
+            rx, ry = -np.sin(perp), np.cos(perp) * np.sin(phi)
+        elif scan_angle == "psi":
+            rx, ry = np.cos(perp) * np.sin(phi), np.sin(perp)
+        elif scan_angle == "beta":
+            rx, ry = np.sin(phi), -np.cos(phi) * np.sin(perp)
+        else:
+            rx, ry = -np.cos(phi) * np.sin(perp), np.sin(phi)
+
+        # undo the rotation by chi applied before inverting
+        return rx * np.cos(chi) + ry * np.sin(chi), ry * np.cos(chi) - rx * np.sin(chi)
+
+    ranges = [
+        _coordinate_range(arr, "phi", phi_offset),
+        _coordinate_range(arr, scan_angle, scan_offset),
+    ]
+    steps = [phi_step, _coordinate_step(arr, scan_angle)]
+    return ["kx", "ky"], direction, ranges, steps, k_tot, k_step
+
+
+def _kz_bounds_and_step(
+    arr: xr.DataArray, ranges: List[Tuple[float, float]]
+) -> Tuple[Tuple[float, float], Optional[float]]:
+    """The kz extent and spacing of a photon energy scan over a rectangle of angles.
+
+    The emission direction makes an angle zeta with the normal where cos(zeta) is the product of
+    the cosines of the (offset) angles in each of the scan geometries, so that
+    ``kz = K sqrt(Ek cos^2(zeta) + V0)`` is extremal at the extremes of the kinetic energy and of
+    each cosine.
+    """
+
+    def cosine_range(low, high):
+        cosines = np.cos([low, high])
+        return np.min(cosines), (1.0 if low <= 0 <= high else np.max(cosines))
 
-    angle_max = max(abs(phi_min), abs(phi_max))
-    inner_V = arr.S.inner_potential
-    kz_min = spherical_to_kz(hv_min + binding_energy_min - wf, angle_max, 0, inner_V)
-    kz_max = spherical_to_kz(hv_max + binding_energy_max - wf, 0, 0, inner_V)
+    cosines = np.prod([cosine_range(*r) for r in ranges], axis=0)
+    binding_energy = _coordinate_range(arr, "eV") if "eV" in arr.coords else (0.0, 0.0)
+    hv = _coordinate_range(arr, "hv")
+    kinetic_energy = np.array([hv[0] + binding_energy[0], hv[1] + binding_energy[1]])
+    kinetic_energy -= arr.S.work_function
 
-    return (
-        (round(kx_min, 2), round(kx_max, 2)),  # kp
-        (round(kz_min, 2), round(kz_max, 2)),  # kz
+    kz_low, kz_high = arpes.constants.K_INV_ANGSTROM * np.sqrt(
+        kinetic_energy * cosines ** 2 + arr.S.inner_potential
     )
 
+    hv_step = _coordinate_step(arr, "hv")
+    kz_step = None
+    if hv_step is not None:
+        kz_step = arpes.constants.K_INV_ANGSTROM ** 2 * hv_step / (kz_low + kz_high)
 
-def calculate_kp_bounds(arr: xr.DataArray):
-    """Calculates kp bounds for a single ARPES cut."""
-    phi_coords = arr.coords["phi"].values - arr.S.phi_offset
-    beta = float(arr.coords["beta"]) - arr.S.beta_offset
+    return (float(kz_low), float(kz_high)), kz_step
 
-    phi_low, phi_high = np.min(phi_coords), np.max(phi_coords)
-    phi_mid = (phi_high + phi_low) / 2
 
-    sampled_phi_values = np.array([phi_low, phi_mid, phi_high])
+def calculate_momentum_bounds(arr: xr.DataArray) -> Dict[str, Tuple[float, float]]:
+    """Calculates the exact extent of the momenta sampled by the angle space data `arr`.
+
+    Rather than evaluating the angle to momentum transform over the data, the extrema are found
+    analytically along the edges of the angular domain, so this is exact and very cheap, even
+    in the presence of a sample rotation (chi) or a varying photon energy.
+    """
+    names, direction, ranges, _, (k_low, k_high), _ = _momentum_geometry(arr)
+    extents = _direction_extents(direction, ranges)
+
+    bounds = {}
+    for name, (low, high) in zip(names, extents):
+        candidates = [k_low * low, k_high * low, k_low * high, k_high * high]
+        bounds[name] = (float(min(candidates)), float(max(candidates)))
+
+    if "hv" in arr.dims:
+        bounds["kz"], _ = _kz_bounds_and_step(arr, ranges)
+
+    return bounds
 
-    kinetic_energy = arr.coords["eV"].values.max()
-    kps = (
-        arpes.constants.K_INV_ANGSTROM
-        * np.sqrt(kinetic_energy)
-        * np.sin(sampled_phi_values)
-        * np.cos(beta)
-    )
 
-    return round(np.min(kps), 2), round(np.max(kps), 2)
+def calculate_momentum_resolution(arr: xr.DataArray) -> Dict[str, float]:
+    """Calculates the momentum spacing which matches the angular sampling of `arr`.
+
+    This is the largest distance in momentum, along each momentum axis, between neighboring
+    samples at the center of the angular domain, so that a grid with this spacing has about
+    one point per measured point.
+    """
+    names, direction, ranges, steps, (k_low, k_high), k_step = _momentum_geometry(arr)
+    center = [np.array([(low + high) / 2]) for low, high in ranges]
+    at_center = np.array([c[0] for c in direction(*center)])
+    k_center = (k_low + k_high) / 2
+
+    spacings = []
+    for axis, step in enumerate(steps):
+        if step is None:
+            continue
+        shifted = list(center)
+        shifted[axis] = shifted[axis] + step
+        shifted_momenta = np.array([c[0] for c in direction(*shifted)])
+        spacings.append(k_center * np.abs(shifted_momenta - at_center))
+
+    if k_step is not None:
+        spacings.append(k_step * np.abs(at_center))
+
+    resolution = np.max(spacings, axis=0) if spacings else np.zeros(len(names))
+
+    if "hv" in arr.dims:
+        _, kz_step = _kz_bounds_and_step(arr, ranges)
+        names = names + ["kz"]
+        resolution = np.append(resolution, kz_step or 0)
+
+    # axes which do not change at the center of the domain, for instance kp for a single phi,
+    # get a spacing spanning their extent in as many points as the data has along phi
+    bounds = calculate_momentum_bounds(arr)
+    n_points = arr.sizes.get("phi", 1)
+    return {
+        name: float(r) if r > 0 else (bounds[name][1] - bounds[name][0]) / n_points or 0.01
+        for name, r in zip(names, resolution)
+    }
+
+
+def calculate_kp_kz_bounds(arr: xr.DataArray):
+    """Calculates kp and kz bounds for angle-hv Fermi surfaces."""
+    bounds = calculate_momentum_bounds(arr)
+    return bounds["kp"], bounds["kz"]
+
+
+def calculate_kp_bounds(arr: xr.DataArray):
+    """Calculates kp bounds for a single ARPES cut."""
+    return calculate_momentum_bounds(arr)["kp"]
 
 
 def calculate_kx_ky_bounds(arr: xr.DataArray):
     """Calculates the kx and ky range for a dataset with a fixed photon energy.
 
     This is used to infer the gridding that should be used for a k-space conversion.
-    Based on Jonathan Denlinger's old codes
 
     Args:
         arr: Dataset that includes a key indicating the photon energy of
@@ -217,44 +418,5 @@ def calculate_kx_ky_bounds(arr: xr.DataArray):
     Returns:
         ((kx_low, kx_high,), (ky_low, ky_high,))
     """
-    phi_coords, beta_coords = (
-        arr.coords["phi"] - arr.S.phi_offset,
-        arr.coords["beta"] - arr.S.beta_offset,
-    )
-
-    # Sample hopefully representatively along the edges
-    phi_low, phi_high = np.min(phi_coords), np.max(phi_coords)
-    beta_low, beta_high = np.min(beta_coords), np.max(beta_coords)
-    phi_mid = (phi_high + phi_low) / 2
-    beta_mid = (beta_high + beta_low) / 2
-
-    sampled_phi_values = np.array(
-        [phi_high, phi_high, phi_mid, phi_low, phi_low, phi_low, phi_mid, phi_high, phi_high]
-    )
-    sampled_beta_values = np.array(
-        [
-            beta_mid,
-            beta_high,
-            beta_high,
-            beta_high,
-            beta_mid,
-            beta_low,
-            beta_low,
-            beta_low,
-            beta_mid,
-        ]
-    )
-    kinetic_energy = arr.S.hv - arr.S.work_function + arr.coords["eV"].values.max()
-
-    kxs = arpes.constants.K_INV_ANGSTROM * np.sqrt(kinetic_energy) * np.sin(sampled_phi_values)
-    kys = (
-        arpes.constants.K_INV_ANGSTROM
-        * np.sqrt(kinetic_energy)
-        * np.cos(sampled_phi_values)
-        * np.sin(sampled_beta_values)
-    )
-
-    return (
-        (round(np.min(kxs), 2), round(np.max(kxs), 2)),
-        (round(np.min(kys), 2), round(np.max(kys), 2)),
-    )
+    bounds = calculate_momentum_bounds(arr)
+    return bounds["kx"], bounds["ky"]
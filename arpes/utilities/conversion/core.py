@@ -28,6 +28,7 @@ from .fast_interp import Interpolator
 
 from arpes.trace import traceable
 import collections
+import functools
 import warnings
 
 import numpy as np
@@ -36,12 +37,72 @@ import scipy.interpolate
 import xarray as xr
 from arpes.provenance import provenance, update_provenance
 from arpes.utilities import normalize_to_spectrum
-from typing import Callable, Optional, Union
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from .kx_ky_conversion import ConvertKxKy, ConvertKp
-from .kz_conversion import ConvertKpKz
+from .kz_conversion import ConvertKpKz, ConvertKxKyKz
 
-__all__ = ["convert_to_kspace", "slice_along_path"]
+__all__ = ["convert_to_kspace", "plan_kspace_conversion", "ConversionPlan", "slice_along_path"]
+
+# Warn when the output of a momentum conversion is this many times larger than its input
+OVERSIZED_CONVERSION_RATIO = 4
+
+# Conversions producing more points than this are evaluated in tiles along the binding energy,
+# which bounds the memory used by the intermediate coordinate arrays
+CONVERSION_TILE_POINTS = 2 ** 22
+
+
+@dataclass
+class ConversionPlan:
+    """The momentum grid a conversion will produce, available before any data is interpolated.
+
+    Attributes:
+        dims: The dimensions of the converted data.
+        coordinates: The coordinates of the converted data, including those of unconverted axes.
+        input_shape: The shape of the angle space data.
+        dtype: The type of the converted data.
+    """
+
+    dims: List[str]
+    coordinates: Dict[str, np.ndarray]
+    input_shape: Tuple[int, ...]
+    dtype: np.dtype = np.dtype(np.float64)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """The shape of the converted data."""
+        return tuple(len(np.atleast_1d(self.coordinates[d])) for d in self.dims)
+
+    @property
+    def nbytes(self) -> int:
+        """The size in bytes of the converted data."""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def resolution(self) -> Dict[str, float]:
+        """The grid spacing along each converted dimension."""
+        return {
+            d: float(np.abs(self.coordinates[d][1] - self.coordinates[d][0]))
+            for d in self.dims
+            if len(np.atleast_1d(self.coordinates[d])) > 1
+        }
+
+    @property
+    def growth(self) -> float:
+        """The ratio of the number of converted points to the number of measured points."""
+        return np.prod(self.shape) / max(np.prod(self.input_shape), 1)
+
+    def __str__(self) -> str:
+        """A one line summary of the output grid and its size."""
+        axes = ", ".join(
+            f"{d}: {n}" + (f" @ {self.resolution[d]:.4g}" if d in self.resolution else "")
+            for d, n in zip(self.dims, self.shape)
+        )
+        return (
+            f"ConversionPlan({axes}; {self.nbytes / 2 ** 20:.1f} MiB, "
+            f"{self.growth:.2f}x the input points)"
+        )
 
 
 @traceable
@@ -318,6 +379,80 @@ def slice_along_path(
     return converted_ds
 
 
+def _kspace_converter(arr: xr.DataArray, calibration=None):
+    """Picks the coordinate converter and the converted dimensions for angle space data.
+
+    Returns:
+        The converter and the dimensions after conversion, or (None, None) if there is nothing to
+        convert.
+    """
+    removed = [d for d in arr.dims if is_dimension_unconvertible(d)]
+    old_dims = [d for d in arr.dims if not is_dimension_unconvertible(d)]
+
+    # Energy gets put at the front as a standardization
+    if "eV" in removed:
+        removed.remove("eV")
+
+    old_dims.sort()
+
+    if not old_dims:
+        return None, None
+
+    converted_dims = (
+        (["eV"] if "eV" in arr.dims else [])
+        + determine_momentum_axes_from_measurement_axes(old_dims)
+        + removed
+    )
+
+    convert_cls = {
+        ("phi",): ConvertKp,
+        ("beta", "phi"): ConvertKxKy,
+        ("phi", "theta"): ConvertKxKy,
+        ("phi", "psi"): ConvertKxKy,
+        # ('chi', 'phi',): ConvertKxKy,
+        ("hv", "phi"): ConvertKpKz,
+        ("beta", "hv", "phi"): ConvertKxKyKz,
+        ("hv", "phi", "theta"): ConvertKxKyKz,
+        ("hv", "phi", "psi"): ConvertKxKyKz,
+    }.get(tuple(old_dims))
+    return convert_cls(arr, converted_dims, calibration=calibration), converted_dims
+
+
+def plan_kspace_conversion(
+    arr: xr.DataArray, bounds=None, resolution=None, coords=None, **kwargs
+) -> Optional[ConversionPlan]:
+    """Reports the grid that `convert_to_kspace` will produce with the same arguments.
+
+    Bounds are computed analytically from the angular domain and the inferred resolution matches
+    the angular sampling of the data, so this is cheap enough to run before every conversion in
+    order to check the size of the output.
+
+    Example:
+        >>> plan = plan_kspace_conversion(cut)  # doctest: +SKIP
+        >>> print(plan)  # doctest: +SKIP
+        ConversionPlan(eV: 240, kp: 512 @ 0.0012; 0.9 MiB, 1.07x the input points)
+
+    Args:
+        arr: The angle space data.
+        bounds: Momentum bounds, as for `convert_to_kspace`.
+        resolution: Momentum resolutions, as for `convert_to_kspace`.
+        coords: Explicit output coordinates, as for `convert_to_kspace`.
+        kwargs: Explicit output coordinates.
+
+    Returns:
+        The plan for the conversion, or None if `arr` has no dimensions to convert.
+    """
+    coords = dict(coords or {}, **kwargs)
+    arr = normalize_to_spectrum(arr)
+    converter, converted_dims = _kspace_converter(arr)
+    if converter is None:
+        return None
+
+    converted_coordinates = converter.get_coordinates(resolution=resolution, bounds=bounds)
+    converted_coordinates.update(coords)
+    return ConversionPlan(converted_dims, converted_coordinates, arr.shape)
+
+
 @update_provenance("Automatically k-space converted")
 @traceable
 def convert_to_kspace(
@@ -327,6 +462,7 @@ def convert_to_kspace(
     calibration=None,
     coords=None,
     allow_chunks: bool = False,
+    corrections=None,
     trace: Callable = None,
     **kwargs,
 ):
@@ -373,6 +509,9 @@ def convert_to_kspace(
         calibration ([type], optional): [description]. Defaults to None.
         coords ([type], optional): [description]. Defaults to None.
         allow_chunks (bool, optional): [description]. Defaults to False.
+        corrections (optional): Corrections of the measured coordinates, like a
+          `ConversionPipeline`, which are applied in the same interpolation as the momentum
+          conversion. Defaults to None.
         trace (Callable, optional): Controls whether to use execution tracing. Defaults to None.
           Pass `True` to enable.
 
@@ -428,6 +567,7 @@ def convert_to_kspace(
                 calibration=calibration,
                 coords=coords,
                 allow_chunks=False,
+                corrections=corrections,
                 trace=trace,
                 **kwargs,
             )
@@ -444,17 +584,13 @@ def convert_to_kspace(
 
     # Chunking is finished here
 
-    # TODO be smarter about the resolution inference
     trace("Determining dimensions and resolution")
     removed = [d for d in arr.dims if is_dimension_unconvertible(d)]
-    old_dims = [d for d in arr.dims if not is_dimension_unconvertible(d)]
 
     # Energy gets put at the front as a standardization
     if "eV" in removed:
         removed.remove("eV")
 
-    old_dims.sort()
-
     trace("Replacing dummy coordinates with index-like ones.")
     # temporarily reassign coordinates for dimensions we will not
     # convert to "index-like" dimensions
@@ -462,25 +598,10 @@ def convert_to_kspace(
     new_index_like_coordinates = {r: np.arange(len(arr.coords[r].values)) for r in removed}
     arr = arr.assign_coords(**new_index_like_coordinates)
 
-    if not old_dims:
+    converter, converted_dims = _kspace_converter(arr, calibration)
+    if converter is None:
         return arr  # no need to convert, might be XPS or similar
 
-    converted_dims = (
-        (["eV"] if has_eV else [])
-        + determine_momentum_axes_from_measurement_axes(old_dims)
-        + removed
-    )
-
-    convert_cls = {
-        ("phi",): ConvertKp,
-        ("beta", "phi"): ConvertKxKy,
-        ("phi", "theta"): ConvertKxKy,
-        ("phi", "psi"): ConvertKxKy,
-        # ('chi', 'phi',): ConvertKxKy,
-        ("hv", "phi"): ConvertKpKz,
-    }.get(tuple(old_dims))
-    converter = convert_cls(arr, converted_dims, calibration=calibration)
-
     trace("Converting coordinates")
     converted_coordinates = converter.get_coordinates(resolution=resolution, bounds=bounds)
 
@@ -490,22 +611,111 @@ def convert_to_kspace(
 
     converted_coordinates.update(coords)
 
-    trace("Calling convert_coordinates")
-    result = convert_coordinates(
-        arr,
-        converted_coordinates,
-        {
-            "dims": converted_dims,
-            "transforms": dict(zip(arr.dims, [converter.conversion_for(d) for d in arr.dims])),
-        },
-        trace=trace,
-    )
+    plan = ConversionPlan(converted_dims, converted_coordinates, arr.shape)
+    trace(str(plan))
+    if plan.growth > OVERSIZED_CONVERSION_RATIO:
+        warnings.warn(
+            f"Momentum conversion will produce {plan.growth:.1f}x as many points as the input "
+            f"({plan}). Consider passing a coarser resolution=."
+        )
+
+    if "eV" in arr.dims and np.prod(plan.shape) > CONVERSION_TILE_POINTS:
+        trace("Calling convert_coordinates in tiles")
+        result = _convert_in_tiles(
+            arr, converter, converted_coordinates, plan, corrections=corrections, trace=trace
+        )
+    else:
+        trace("Calling convert_coordinates")
+        result = convert_coordinates(
+            arr,
+            converted_coordinates,
+            {
+                "dims": converted_dims,
+                "transforms": _source_transforms(converter, arr.dims, corrections),
+            },
+            trace=trace,
+        )
     trace("Reassigning index-like coordinates.")
     result = result.assign_coords(**restore_index_like_coordinates)
     trace("Finished.")
     return result
 
 
+def _source_transforms(converter, dims, corrections=None) -> Dict[str, Callable]:
+    """The transforms from momentum to each measured coordinate, including any corrections.
+
+    Corrections map all of the coordinates at once, so their result is shared between the
+    transforms for each measured dimension.
+    """
+    transforms = {d: converter.conversion_for(d) for d in dims}
+    if corrections is None:
+        return transforms
+
+    source = {}
+
+    def corrected(dim, *args, **kwargs):
+        if not source:
+            coords = {d: transform(*args, **kwargs) for d, transform in transforms.items()}
+            source.update(corrections.source_coordinates(coords))
+        return source[dim]
+
+    return {d: functools.partial(corrected, d) for d in dims}
+
+
+def _convert_in_tiles(
+    arr: xr.DataArray,
+    converter,
+    converted_coordinates: Dict[str, np.ndarray],
+    plan: ConversionPlan,
+    corrections=None,
+    trace: Callable = None,
+) -> xr.DataArray:
+    """Converts `arr` in slabs of the output binding energy, all on the same momentum grid.
+
+    The binding energy is unchanged by the conversion, so each slab only needs the input data at
+    nearby energies. This keeps both the interpolator and the coordinate arrays small, so that
+    large volumes (such as photon energy scans of kx-ky maps) stream through the conversion.
+    """
+    energies = np.asarray(converted_coordinates["eV"])
+    tile_length = max(CONVERSION_TILE_POINTS * len(energies) // int(np.prod(plan.shape)), 1)
+    source_energies = arr.coords["eV"].values
+
+    converted = None
+    for start in range(0, len(energies), tile_length):
+        tile_energies = energies[start : start + tile_length]
+
+        # the source energies covering the tile, with a neighbor on each side for interpolation
+        first, last = sorted(
+            np.abs(source_energies - e).argmin() for e in (tile_energies.min(), tile_energies.max())
+        )
+        source = arr.isel(eV=slice(max(first - 1, 0), last + 2))
+        if corrections is not None:
+            # corrections can move energies arbitrarily far, but the interpolator does not copy data
+            source = arr
+
+        tile_converter = type(converter)(source, plan.dims, calibration=converter.calibration)
+        tile_coordinates = dict(converted_coordinates, eV=tile_energies)
+        trace(f"Converting tile {start // tile_length + 1}: {len(tile_energies)} energies")
+        tile = convert_coordinates(
+            source,
+            tile_coordinates,
+            {
+                "dims": plan.dims,
+                "transforms": _source_transforms(tile_converter, source.dims, corrections),
+            },
+            trace=trace,
+        )
+
+        if converted is None:
+            converted = np.empty(plan.shape, dtype=tile.dtype)
+            template = tile
+        converted[start : start + tile_length] = tile.values
+
+    coords = dict(template.coords)
+    coords["eV"] = energies
+    return xr.DataArray(converted, coords=coords, dims=template.dims, attrs=template.attrs)
+
+
 @traceable
 def convert_coordinates(
     arr: xr.DataArray,
@@ -1,4 +1,4 @@
-"""Provides extremely fast 2D and 3D linear interpolation.
+"""Provides extremely fast 2D, 3D, and 4D linear interpolation.
 
 This is used for momentum conversion in place of the scipy
 GridInterpolator where it is possible to do so. It is many many 
@@ -12,27 +12,51 @@ from typing import List, Union
 import math
 import numpy as np
 
+from arpes.utilities.jit import kernel
+
 __all__ = [
     "Interpolator",
 ]
 
 
-@numba.njit
+def _interpolate_examples(ndim):
+    """Example arguments for the ``ndim`` dimensional interpolation kernels."""
+
+    def examples(dtype):
+        # coordinates are always double precision, see ``Interpolator.__call__``
+        data = np.zeros((2,) * ndim, dtype=dtype)
+        coords = [np.zeros(4) for _ in range(ndim)]
+        return [
+            (
+                data,
+                np.zeros(4, dtype=dtype),
+                *([np.float64(0)] * ndim),
+                *([np.float64(1)] * ndim),
+                *([2] * ndim),
+                *coords,
+                np.nan,
+            )
+        ]
+
+    return examples
+
+
+@kernel()
 def to_fractional_coordinate(coord, initial, delta):
     return (coord - initial) / delta
 
 
-@numba.njit
+@kernel()
 def _i1d(xd, c0, c1):
     return c0 * (1 - xd) + c1 * xd
 
 
-@numba.njit
+@kernel()
 def raw_lin_interpolate_1d(xd, c0, c1):
     return _i1d(xd, c0, c1)
 
 
-@numba.njit
+@kernel()
 def raw_lin_interpolate_2d(xd, yd, c00, c01, c10, c11):
     # project to 1D
     c0 = _i1d(xd, c00, c10)
@@ -41,7 +65,7 @@ def raw_lin_interpolate_2d(xd, yd, c00, c01, c10, c11):
     return _i1d(yd, c0, c1)
 
 
-@numba.njit
+@kernel()
 def raw_lin_interpolate_3d(xd, yd, zd, c000, c001, c010, c100, c011, c101, c110, c111):
     # project to 2D
     c00 = _i1d(xd, c000, c100)
@@ -56,7 +80,7 @@ def raw_lin_interpolate_3d(xd, yd, zd, c000, c001, c010, c100, c011, c101, c110,
     return _i1d(zd, c0, c1)
 
 
-@numba.njit
+@kernel()
 def lin_interpolate_3d(data, ix, iy, iz, ixp, iyp, izp, xd, yd, zd):
     return raw_lin_interpolate_3d(
         xd,
@@ -73,7 +97,16 @@ def lin_interpolate_3d(data, ix, iy, iz, ixp, iyp, izp, xd, yd, zd):
     )
 
 
-@numba.njit
+@kernel()
+def lin_interpolate_4d(data, iw, ix, iy, iz, iwp, ixp, iyp, izp, wd, xd, yd, zd):
+    # project to 3D
+    c0 = lin_interpolate_3d(data[iw], ix, iy, iz, ixp, iyp, izp, xd, yd, zd)
+    c1 = lin_interpolate_3d(data[iwp], ix, iy, iz, ixp, iyp, izp, xd, yd, zd)
+
+    return _i1d(wd, c0, c1)
+
+
+@kernel()
 def lin_interpolate_2d(data, ix, iy, ixp, iyp, xd, yd):
     return raw_lin_interpolate_2d(
         xd,
@@ -85,7 +118,66 @@ def lin_interpolate_2d(data, ix, iy, ixp, iyp, xd, yd):
     )
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_interpolate_examples(4))
+def interpolate_4d(
+    data,
+    output,
+    lower_corner_w,
+    lower_corner_x,
+    lower_corner_y,
+    lower_corner_z,
+    delta_w,
+    delta_x,
+    delta_y,
+    delta_z,
+    shape_w,
+    shape_x,
+    shape_y,
+    shape_z,
+    w,
+    x,
+    y,
+    z,
+    fill_value=np.nan,
+):
+    for i in numba.prange(len(x)):
+        if np.isnan(w[i]) or np.isnan(x[i]) or np.isnan(y[i]) or np.isnan(z[i]):
+            output[i] = fill_value
+            continue
+
+        iw = to_fractional_coordinate(w[i], lower_corner_w, delta_w)
+        ix = to_fractional_coordinate(x[i], lower_corner_x, delta_x)
+        iy = to_fractional_coordinate(y[i], lower_corner_y, delta_y)
+        iz = to_fractional_coordinate(z[i], lower_corner_z, delta_z)
+
+        if (
+            iw < 0
+            or ix < 0
+            or iy < 0
+            or iz < 0
+            or iw >= shape_w
+            or ix >= shape_x
+            or iy >= shape_y
+            or iz >= shape_z
+        ):
+            output[i] = fill_value
+            continue
+
+        iiw, iix, iiy, iiz = math.floor(iw), math.floor(ix), math.floor(iy), math.floor(iz)
+        iiwp, iixp, iiyp, iizp = (
+            min(iiw + 1, shape_w - 1),
+            min(iix + 1, shape_x - 1),
+            min(iiy + 1, shape_y - 1),
+            min(iiz + 1, shape_z - 1),
+        )
+        wd, xd, yd, zd = iw - iiw, ix - iix, iy - iiy, iz - iiz
+
+        output[i] = lin_interpolate_4d(
+            data, iiw, iix, iiy, iiz, iiwp, iixp, iiyp, iizp, wd, xd, yd, zd
+        )
+
+
+@kernel(parallel=True, nogil=True, examples=_interpolate_examples(3))
 def interpolate_3d(
     data,
     output,
@@ -127,7 +219,7 @@ def interpolate_3d(
         output[i] = lin_interpolate_3d(data, iix, iiy, iiz, iixp, iiyp, iizp, xd, yd, zd)
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_interpolate_examples(2))
 def interpolate_2d(
     data,
     output,
@@ -180,17 +272,18 @@ class Interpolator:
         """Convert data to floating point representation.
 
         Because we do linear not nearest neighbor interpolation this should be safe
-        always.
+        always. Single precision data is interpolated as is to avoid a copy.
         """
-        self.data = self.data.astype(np.float64, copy=False)
+        if self.data.dtype != np.float32:
+            self.data = self.data.astype(np.float64, copy=False)
 
     @classmethod
     def from_arrays(cls, xyz: List[np.ndarray], data: np.ndarray):
         """Initializes the interpreter from a coordinate and data array.
 
         Args:
-            xyz: A list of the coordinate arrays. Should be length 2 or 3
-              because we provide 2D and 3D coordinate interpolation.
+            xyz: A list of the coordinate arrays. Should be length 2, 3, or 4
+              because we provide 2D, 3D, and 4D coordinate interpolation.
             data: The value of the interpolated function at the coordinate in `xyz`
         """
         lower_corner = [xi[0] for xi in xyz]
@@ -201,7 +294,7 @@ class Interpolator:
     def __call__(self, xi: Union[np.ndarray, List[np.ndarray]]) -> np.ndarray:
         """Performs linear interpolation at the coordinates given by `xi`.
 
-        Whether 2D or 3D interpolation is used depends on the dimensionality of `xi` and
+        Whether 2D, 3D, or 4D interpolation is used depends on the dimensionality of `xi` and
         `self.data` but of course they must match one another.
 
         Args:
@@ -209,7 +302,8 @@ class Interpolator:
               of k points each with d dimensions/indices.
 
         Returns:
-            The interpolated values f(x_i) at each point x_i, as a length k scalar array.
+            The interpolated values f(x_i) at each point x_i, as a length k scalar array with
+            the dtype of the data.
         """
         if isinstance(xi, np.ndarray):
             xi = xi.astype(np.float64, copy=False)
@@ -217,9 +311,10 @@ class Interpolator:
         else:
             xi = [xii.astype(np.float64, copy=False) for xii in xi]
 
-        output = np.zeros_like(xi[0])
+        output = np.zeros(len(xi[0]), dtype=self.data.dtype)
 
         interpolator = {
+            4: interpolate_4d,
             3: interpolate_3d,
             2: interpolate_2d,
         }[self.data.ndim]
@@ -231,6 +326,8 @@ class Interpolator:
             *self.delta,
             *self.shape,
             *xi,
+            # passed explicitly, an omitted NaN default never matches the on disk cache index
+            np.nan,
         )
 
         return output
@@ -10,19 +10,21 @@ useful for aligning cuts which use those transforms.
 See `convert_coordinate_forward`.
 """
 from arpes.utilities.conversion.core import convert_to_kspace
-from typing import Callable, Dict
+from typing import Callable, Dict, List
 from arpes.trace import traceable
+import math
+import numba
 import numpy as np
 import warnings
 import xarray as xr
 
+import arpes.constants
+from arpes.utilities.jit import kernel
+
 from arpes.utilities import normalize_to_spectrum
 from arpes.provenance import update_provenance
 from arpes.analysis.filters import gaussian_filter_arr
 from arpes.utilities.conversion.bounds_calculations import (
-    euler_to_kx,
-    euler_to_ky,
-    euler_to_kz,
     full_angles_to_k,
 )
 from arpes.typing import DataType
@@ -350,96 +352,191 @@ def convert_coordinates(arr: DataType, collapse_parallel=False, **kwargs):
     return xr.Dataset(data_vars, coords=arr.indexes)
 
 
+# Destination coordinates of the forward conversion, keyed by the sorted angle and photon energy
+# dimensions
+FORWARD_DESTINATION_COORDS = {
+    ("phi",): ["kp", "kz"],
+    ("theta",): ["kp", "kz"],
+    ("beta",): ["kp", "kz"],
+    ("phi", "theta"): ["kx", "ky", "kz"],
+    ("beta", "phi"): ["kx", "ky", "kz"],
+    ("hv", "phi"): ["kx", "ky", "kz"],
+    ("hv",): ["kp", "kz"],
+    ("beta", "hv", "phi"): ["kx", "ky", "kz"],
+    ("hv", "phi", "theta"): ["kx", "ky", "kz"],
+    ("hv", "phi", "psi"): ["kx", "ky", "kz"],
+    ("chi", "hv", "phi"): ["kx", "ky", "kz"],
+}
+
+
+def _forward_examples(dtype):
+    values, out = np.zeros(4, dtype=dtype), np.zeros((1, 4), dtype=dtype)
+    layout = np.ones((4, 3), dtype=np.int64)
+    return [
+        (values, values, values, values, values, values, layout, 4.0, 10.0, False, out, out, out)
+    ]
+
+
+def _signed_kp_examples(dtype):
+    k = np.zeros(4, dtype=dtype)
+    return [(k, k, True, np.zeros_like(k))]
+
+
+@kernel(parallel=True, examples=_forward_examples)
+def _euler_to_k(
+    energy,
+    hv,
+    sin_phi,
+    cos_phi,
+    sin_beta,
+    cos_beta,
+    layout,
+    work_function,
+    inner_potential,
+    slit_is_vertical,
+    kx,
+    ky,
+    kz,
+):
+    """Fused `euler_to_kx`, `euler_to_ky`, and `euler_to_kz` (at zero theta) over a coordinate grid.
+
+    Outputs are flattened to rows along the last dimension of the grid. Each coordinate (energy,
+    photon energy, phi, and beta in order) is stored only along its own dimension: it is indexed
+    by the column if ``layout[c, 2]`` is set, and otherwise at row ``i`` by
+    ``(i // layout[c, 0]) % layout[c, 1]``. This way broadcast coordinates are never materialized.
+    """
+    k_inv_angstrom = arpes.constants.K_INV_ANGSTROM
+    for row in numba.prange(kx.shape[0]):
+        i_energy = (row // layout[0, 0]) % layout[0, 1]
+        i_hv = (row // layout[1, 0]) % layout[1, 1]
+        i_phi = (row // layout[2, 0]) % layout[2, 1]
+        i_beta = (row // layout[3, 0]) % layout[3, 1]
+
+        for j in range(kx.shape[1]):
+            if layout[0, 2]:
+                i_energy = j
+            if layout[1, 2]:
+                i_hv = j
+            if layout[2, 2]:
+                i_phi = j
+            if layout[3, 2]:
+                i_beta = j
+
+            kinetic_energy = energy[i_energy] + hv[i_hv] - work_function
+            k = k_inv_angstrom * math.sqrt(kinetic_energy)
+            beta_term = cos_beta[i_beta] * cos_phi[i_phi]
+            if slit_is_vertical:
+                kx[row, j] = k * sin_beta[i_beta] * cos_phi[i_phi]
+                ky[row, j] = k * sin_phi[i_phi]
+            else:
+                kx[row, j] = k * sin_phi[i_phi]
+                ky[row, j] = k * cos_phi[i_phi] * sin_beta[i_beta]
+
+            kz_energy = kinetic_energy * beta_term ** 2 + inner_potential
+            kz[row, j] = k_inv_angstrom * math.sqrt(kz_energy)
+
+
+@kernel(parallel=True, examples=_signed_kp_examples)
+def _signed_kp(kx, ky, sign_from_kx, kp):
+    """The in plane momentum magnitude, signed by whichever of kx and ky varies more.
+
+    `kp` may alias `kx`.
+    """
+    for i in numba.prange(len(kx)):
+        signed = kx[i] if sign_from_kx else ky[i]
+        kp[i] = math.sqrt(kx[i] ** 2 + ky[i] ** 2) * signed / math.sqrt(signed ** 2 + 1e-8)
+
+
+def _forward_coordinate(arr: xr.DataArray, name: str, offset: float = 0) -> np.ndarray:
+    """A coordinate as a 1D array along its dimension, or a length one array if it is constant."""
+    if name in arr.dims:
+        return np.asarray(arr.coords[name].values, dtype=np.float64) - offset
+
+    try:
+        value = arr.S.lookup_coord(name)
+    except ValueError:
+        value = 0
+    return np.atleast_1d(np.asarray(value, dtype=np.float64)) - offset
+
+
+def _forward_momenta(
+    arr: xr.DataArray, dims: List[str], dest_coords: List[str], selection: Dict[str, slice] = None
+) -> Dict[str, np.ndarray]:
+    """Evaluates the forward transform over the grid of `dims`, or its block in `selection`."""
+    selection = selection or {}
+    shape = tuple(len(range(*selection.get(d, slice(None)).indices(arr.sizes[d]))) for d in dims)
+
+    # for now we are setting the theta angle to zero, this only has an effect for vertical slit
+    # analyzers, and then only when the tilt angle is very large
+    coordinates = {
+        "eV": _forward_coordinate(arr, "eV"),
+        "hv": _forward_coordinate(arr, "hv"),
+        "phi": _forward_coordinate(arr, "phi", arr.S.phi_offset),
+        "beta": _forward_coordinate(arr, "beta", arr.S.beta_offset),
+    }
+
+    n_rows = int(np.prod(shape[:-1]))
+    layout = np.ones((4, 3), dtype=np.int64)
+    layout[:, 2] = 0
+    for i, (name, values) in enumerate(coordinates.items()):
+        if name in dims:
+            axis = dims.index(name)
+            coordinates[name] = values[selection.get(name, slice(None))]
+            layout[i] = [int(np.prod(shape[axis + 1 : -1])), shape[axis], axis == len(dims) - 1]
+
+    kx, ky, kz = (np.empty((n_rows, shape[-1])) for _ in range(3))
+    _euler_to_k(
+        coordinates["eV"],
+        coordinates["hv"],
+        np.sin(coordinates["phi"]),
+        np.cos(coordinates["phi"]),
+        np.sin(coordinates["beta"]),
+        np.cos(coordinates["beta"]),
+        layout,
+        float(arr.S.work_function),
+        float(arr.S.inner_potential),
+        bool(arr.S.is_slit_vertical),
+        kx,
+        ky,
+        kz,
+    )
+
+    momenta = {"kx": kx, "ky": ky, "kz": kz}
+    if "kp" in dest_coords:
+        # reuses the storage of kx
+        _signed_kp(kx.ravel(), ky.ravel(), bool(np.vdot(kx, kx) > np.vdot(ky, ky)), kx.ravel())
+        momenta = {"kp": kx, "kz": kz}
+
+    return {k: momenta[k].reshape(shape) for k in dest_coords}
+
+
 @update_provenance("Forward convert coordinates to momentum")
 def convert_coordinates_to_kspace_forward(arr: DataType, **kwargs):
-    """Forward converts all the individual coordinates of the data array."""
-    arr = arr.copy(deep=True)
+    """Forward converts all the individual coordinates of the data array.
 
+    Momenta are evaluated by a single fused kernel which reads each coordinate along its own
+    dimension, so neither the data nor any broadcast copies of the coordinates are allocated, only
+    the momenta themselves. For data backed by dask the momenta are computed lazily, one block of
+    the data at a time.
+    """
     skip = {"eV", "cycle", "delay", "T"}
     keep = {
         "eV",
     }
 
-    all = {k: v for k, v in arr.indexes.items() if k not in skip}
-    kept = {k: v for k, v in arr.indexes.items() if k in keep}
-
-    old_dims = list(all.keys())
-    old_dims.sort()
+    old_dims = sorted(k for k in arr.indexes if k not in skip)
+    kept = [k for k in arr.indexes if k in keep]
 
     if not old_dims:
         return None
 
-    dest_coords = {
-        ("phi",): ["kp", "kz"],
-        ("theta",): ["kp", "kz"],
-        ("beta",): ["kp", "kz"],
-        ("phi", "theta"): ["kx", "ky", "kz"],
-        ("beta", "phi"): ["kx", "ky", "kz"],
-        ("hv", "phi"): ["kx", "ky", "kz"],
-        ("hv",): ["kp", "kz"],
-        ("beta", "hv", "phi"): ["kx", "ky", "kz"],
-        ("hv", "phi", "theta"): ["kx", "ky", "kz"],
-        ("hv", "phi", "psi"): ["kx", "ky", "kz"],
-        ("chi", "hv", "phi"): ["kx", "ky", "kz"],
-    }.get(tuple(old_dims))
-
-    full_old_dims = old_dims + list(kept.keys())
-    projection_vectors = np.ndarray(
-        shape=tuple(len(arr.coords[d]) for d in full_old_dims), dtype=object
-    )
-
-    # these are a little special, depending on the scan type we might not have a phi coordinate
-    # that aspect of this is broken for now, but we need not worry
-    def broadcast_by_dim_location(data, target_shape, dim_location=None):
-        if isinstance(data, xr.DataArray):
-            if not data.dims:
-                data = data.item()
-
-        if isinstance(
-            data,
-            (
-                int,
-                float,
-            ),
-        ):
-            return np.ones(target_shape) * data
-
-        # else we are dealing with an actual array
-        the_slice = [None] * len(target_shape)
-        the_slice[dim_location] = slice(None, None, None)
-
-        return np.asarray(data)[the_slice]
-
-    raw_coords = {
-        "phi": arr.coords["phi"].values - arr.S.phi_offset,
-        "beta": (0 if arr.coords["beta"] is None else arr.coords["beta"].values)
-        - arr.S.beta_offset,
-        "theta": (0 if arr.coords["theta"] is None else arr.coords["theta"].values)
-        - arr.S.theta_offset,
-        "hv": arr.coords["hv"],
-    }
-
-    raw_coords = {
-        k: broadcast_by_dim_location(
-            v, projection_vectors.shape, full_old_dims.index(k) if k in full_old_dims else None
+    dest_coords = FORWARD_DESTINATION_COORDS.get(tuple(old_dims))
+    if dest_coords is None:
+        raise ValueError(
+            f"Forward conversion is not supported for data with dimensions {old_dims}."
         )
-        for k, v in raw_coords.items()
-    }
 
-    # fill in the vectors
-    binding_energy = broadcast_by_dim_location(
-        arr.coords["eV"] - arr.S.work_function,
-        projection_vectors.shape,
-        full_old_dims.index("eV") if "eV" in full_old_dims else None,
-    )
-    photon_energy = broadcast_by_dim_location(
-        arr.coords["hv"],
-        projection_vectors.shape,
-        full_old_dims.index("hv") if "hv" in full_old_dims else None,
-    )
-    kinetic_energy = binding_energy + photon_energy
-
-    inner_potential = arr.S.inner_potential
+    full_old_dims = old_dims + kept
 
     # some notes on angle conversion:
     # BL4 conventions
@@ -480,45 +577,22 @@ def convert_coordinates_to_kspace_forward(arr: DataType, **kwargs):
     # k (sin(phi + theta), cos(phi + theta) * sin(polar), cos(phi + theta) cos(polar), )
     #
 
-    # for now we are setting the theta angle to zero, this only has an effect for vertical slit analyzers,
-    # and then only when the tilt angle is very large
-
-    # TODO check me
-    raw_translated = {
-        "kx": euler_to_kx(
-            kinetic_energy,
-            raw_coords["phi"],
-            raw_coords["beta"],
-            theta=0,
-            slit_is_vertical=arr.S.is_slit_vertical,
-        ),
-        "ky": euler_to_ky(
-            kinetic_energy,
-            raw_coords["phi"],
-            raw_coords["beta"],
-            theta=0,
-            slit_is_vertical=arr.S.is_slit_vertical,
-        ),
-        "kz": euler_to_kz(
-            kinetic_energy,
-            raw_coords["phi"],
-            raw_coords["beta"],
-            theta=0,
-            slit_is_vertical=arr.S.is_slit_vertical,
-            inner_potential=inner_potential,
-        ),
-    }
+    if arr.chunks is None:
+        momenta = _forward_momenta(arr, full_old_dims, dest_coords)
+        data_vars = {k: (full_old_dims, v) for k, v in momenta.items()}
+        return xr.Dataset(data_vars, coords=arr.indexes)
 
-    if "kp" in dest_coords:
-        if np.sum(raw_translated["kx"] ** 2) > np.sum(raw_translated["ky"] ** 2):
-            sign = raw_translated["kx"] / np.sqrt(raw_translated["kx"] ** 2 + 1e-8)
-        else:
-            sign = raw_translated["ky"] / np.sqrt(raw_translated["ky"] ** 2 + 1e-8)
+    import dask.array
 
-        raw_translated["kp"] = np.sqrt(raw_translated["kx"] ** 2 + raw_translated["ky"] ** 2) * sign
+    chunks = tuple(arr.chunks[arr.dims.index(d)] for d in full_old_dims)
 
-    data_vars = {}
-    for dest_coord in dest_coords:
-        data_vars[dest_coord] = (full_old_dims, np.squeeze(raw_translated[dest_coord]))
+    def block(dest_coord, block_info=None):
+        location = block_info[None]["array-location"]
+        selection = {d: slice(*bounds) for d, bounds in zip(full_old_dims, location)}
+        return _forward_momenta(arr, full_old_dims, dest_coords, selection)[dest_coord]
 
+    data_vars = {
+        k: (full_old_dims, dask.array.map_blocks(block, k, chunks=chunks, dtype=np.float64))
+        for k in dest_coords
+    }
     return xr.Dataset(data_vars, coords=arr.indexes)
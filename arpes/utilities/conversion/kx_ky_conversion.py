@@ -11,13 +11,37 @@ import pint
 import xarray as xr
 
 import arpes.constants
-from .base import K_SPACE_BORDER, MOMENTUM_BREAKPOINTS, CoordinateConverter
-from .bounds_calculations import calculate_kp_bounds, calculate_kx_ky_bounds
+from arpes.utilities.jit import kernel
+from .base import K_SPACE_BORDER, CoordinateConverter
+from .bounds_calculations import (
+    calculate_kp_bounds,
+    calculate_kx_ky_bounds,
+    calculate_momentum_resolution,
+)
 
 __all__ = ["ConvertKp", "ConvertKxKy"]
 
 
-@numba.njit(parallel=True)
+def _arcsin_examples(dtype):
+    k, out = np.zeros(4, dtype=dtype), np.zeros(4, dtype=dtype)
+    return [(k, k, np.ones(4, dtype=dtype), out, 0.0, True, False)]
+
+
+def _small_angle_arcsin_examples(dtype):
+    k, out = np.zeros(4, dtype=dtype), np.zeros(4, dtype=dtype)
+    return [(k, np.ones(4, dtype=dtype), out, 0.0, True, False)]
+
+
+def _rotate_kx_ky_examples(dtype):
+    k = np.zeros(4, dtype=dtype)
+    return [(k, k, np.zeros_like(k), np.zeros_like(k), 0.0)]
+
+
+def _compute_ktot_examples(dtype):
+    return [(10.0, 4.0, np.zeros(4, dtype=dtype), np.zeros(4, dtype=dtype))]
+
+
+@kernel(parallel=True, nogil=True, examples=_arcsin_examples)
 def _exact_arcsin(k_par, k_perp, k_tot, phi, offset, par_tot, negate):
     """A efficient arcsin with total momentum scaling."""
     mul_idx = 1 if par_tot else 0
@@ -29,7 +53,7 @@ def _exact_arcsin(k_par, k_perp, k_tot, phi, offset, par_tot, negate):
         phi[i] = result + offset
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_small_angle_arcsin_examples)
 def _small_angle_arcsin(k_par, k_tot, phi, offset, par_tot, negate):
     """A efficient small angle arcsin with total momentum scaling.
 
@@ -47,7 +71,7 @@ def _small_angle_arcsin(k_par, k_tot, phi, offset, par_tot, negate):
         phi[i] = result + offset
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_rotate_kx_ky_examples)
 def _rotate_kx_ky(kx, ky, kxout, kyout, chi):
     cos_chi = np.cos(chi)
     sin_chi = np.sin(chi)
@@ -56,7 +80,7 @@ def _rotate_kx_ky(kx, ky, kxout, kyout, chi):
         kyout[i] = ky[i] * cos_chi + kx[i] * sin_chi
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_compute_ktot_examples)
 def _compute_ktot(hv, work_function, binding_energy, k_tot):
     for i in numba.prange(len(binding_energy)):
         k_tot[i] = arpes.constants.K_INV_ANGSTROM * math.sqrt(
@@ -104,14 +128,8 @@ class ConvertKp(CoordinateConverter):
         if "kp" in bounds:
             kp_low, kp_high = bounds["kp"]
 
-        inferred_kp_res = (kp_high - kp_low + 2 * K_SPACE_BORDER) / len(self.arr.coords["phi"])
-
-        try:
-            inferred_kp_res = [b for b in MOMENTUM_BREAKPOINTS if b < inferred_kp_res][
-                -2 if (len(self.arr.coords["phi"]) < 80) else -1
-            ]
-        except IndexError:
-            inferred_kp_res = MOMENTUM_BREAKPOINTS[-2]
+        # match the sampling of the data, rather than rounding to a fixed table of resolutions
+        inferred_kp_res = calculate_momentum_resolution(self.arr)["kp"]
 
         coordinates["kp"] = np.arange(
             kp_low - K_SPACE_BORDER, kp_high + K_SPACE_BORDER, resolution.get("kp", inferred_kp_res)
@@ -248,31 +266,9 @@ class ConvertKxKy(CoordinateConverter):
         if "ky" in bounds:
             ky_low, ky_high = bounds["ky"]
 
-        kx_angle, ky_angle = self.direct_angles
-        if self.is_slit_vertical:
-            # phi actually measures along ky
-            ky_angle, kx_angle = kx_angle, ky_angle
-            ((ky_low, ky_high), (kx_low, kx_high)) = ((kx_low, kx_high), (ky_low, ky_high))
-
-        len_ky_angle = len(self.arr.coords[ky_angle])
-        len_kx_angle = len(self.arr.coords[kx_angle])
-
-        inferred_kx_res = (kx_high - kx_low + 2 * K_SPACE_BORDER) / len(self.arr.coords[kx_angle])
-        inferred_ky_res = (ky_high - ky_low + 2 * K_SPACE_BORDER) / len(self.arr.coords[ky_angle])
-
-        # upsample a bit if there aren't that many points along a certain axis
-        try:
-            inferred_kx_res = [b for b in MOMENTUM_BREAKPOINTS if b < inferred_kx_res][
-                -2 if (len_kx_angle < 80) else -1
-            ]
-        except IndexError:
-            inferred_kx_res = MOMENTUM_BREAKPOINTS[-2]
-        try:
-            inferred_ky_res = [b for b in MOMENTUM_BREAKPOINTS if b < inferred_ky_res][
-                -2 if (len_ky_angle < 80) else -1
-            ]
-        except IndexError:
-            inferred_ky_res = MOMENTUM_BREAKPOINTS[-2]
+        # the bounds are already oriented, phi measures along ky for a vertical slit
+        inferred_res = calculate_momentum_resolution(self.arr)
+        inferred_kx_res, inferred_ky_res = inferred_res["kx"], inferred_res["ky"]
 
         coordinates["kx"] = np.arange(
             kx_low - K_SPACE_BORDER, kx_high + K_SPACE_BORDER, resolution.get("kx", inferred_kx_res)
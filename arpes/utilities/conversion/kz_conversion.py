@@ -5,13 +5,35 @@ import numba
 import arpes.constants
 from typing import Any, Callable, Dict
 
-from .base import CoordinateConverter, K_SPACE_BORDER, MOMENTUM_BREAKPOINTS
-from .bounds_calculations import calculate_kp_kz_bounds
+from arpes.utilities.jit import kernel
+
+from .base import CoordinateConverter, K_SPACE_BORDER
+from .bounds_calculations import (
+    calculate_kp_kz_bounds,
+    calculate_momentum_bounds,
+    calculate_momentum_resolution,
+)
+from .kx_ky_conversion import ConvertKxKy
 
 __all__ = ["ConvertKpKzV0", "ConvertKxKyKz", "ConvertKpKz"]
 
 
-@numba.njit(parallel=True, cache=True)
+def _kspace_to_hv_examples(dtype):
+    k = np.zeros(4, dtype=dtype)
+    return [(k, k, np.zeros_like(k), np.zeros(1, dtype=dtype), True)]
+
+
+def _kspace_to_hv_k_tot_examples(dtype):
+    k = np.zeros(4, dtype=dtype)
+    return [(k, k, k, np.zeros(1, dtype=dtype), 4.0, 10.0, np.zeros_like(k), np.zeros_like(k))]
+
+
+def _kp_to_polar_examples(dtype):
+    k = np.zeros(4, dtype=dtype)
+    return [(np.ones(4, dtype=dtype), k, np.zeros_like(k), 10.0, 0.0)]
+
+
+@kernel(parallel=True, nogil=True, examples=_kspace_to_hv_examples)
 def _kspace_to_hv(kp, kz, hv, energy_shift, is_constant_shift):
     """Efficiently perform the inverse coordinate transform to photon energy."""
     shift_ratio = 0 if is_constant_shift else 1
@@ -23,7 +45,19 @@ def _kspace_to_hv(kp, kz, hv, energy_shift, is_constant_shift):
         )
 
 
-@numba.njit(parallel=True, cache=True)
+@kernel(parallel=True, nogil=True, examples=_kspace_to_hv_k_tot_examples)
+def _kspace_to_hv_k_tot(kx, ky, kz, binding_energy, work_function, inner_potential, hv, k_tot):
+    """Efficiently performs the inverse transform to photon energy and the total vacuum momentum."""
+    energy_ratio = 1 if len(binding_energy) == len(kx) else 0
+
+    for i in numba.prange(len(kx)):
+        kinetic_energy = arpes.constants.HV_CONVERSION * (kx[i] ** 2 + ky[i] ** 2 + kz[i] ** 2)
+        kinetic_energy -= inner_potential
+        hv[i] = kinetic_energy - binding_energy[i * energy_ratio] + work_function
+        k_tot[i] = arpes.constants.K_INV_ANGSTROM * np.sqrt(kinetic_energy)
+
+
+@kernel(parallel=True, nogil=True, examples=_kp_to_polar_examples)
 def _kp_to_polar(kinetic_energy, kp, phi, inner_potential, angle_offset):
     """Efficiently performs the inverse coordinate transform phi(hv, kp)."""
     for i in numba.prange(len(kp)):
@@ -46,13 +80,98 @@ class ConvertKpKzV0(CoordinateConverter):
         raise NotImplementedError
 
 
-class ConvertKxKyKz(CoordinateConverter):
-    """Implements 4D data volume conversion."""
+class ConvertKxKyKz(ConvertKxKy):
+    """Implements photon energy scans of kx-ky maps, converting to a full momentum volume.
 
-    def __init__(self, *args, **kwargs):
-        """TODO, implement this."""
+    At each point the photon energy follows from the total momentum inside the sample, after which
+    the angles are recovered exactly as for a kx-ky map measured at that photon energy.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Cache the photon energy coordinate we calculate backwards from kx, ky, and kz."""
         super(ConvertKxKyKz, self).__init__(*args, **kwargs)
-        raise NotImplementedError
+        self.hv = None
+
+    def get_coordinates(
+        self, resolution: dict = None, bounds: dict = None
+    ) -> Dict[str, np.ndarray]:
+        """Calculates appropriate coordinate bounds."""
+        if resolution is None:
+            resolution = {}
+        if bounds is None:
+            bounds = {}
+
+        coordinates = super(ConvertKxKyKz, self).get_coordinates(
+            resolution=resolution, bounds=bounds
+        )
+        coordinates.pop("hv", None)
+
+        kz_low, kz_high = bounds.get("kz", calculate_momentum_bounds(self.arr)["kz"])
+        inferred_kz_res = calculate_momentum_resolution(self.arr)["kz"]
+        coordinates["kz"] = np.arange(
+            kz_low - K_SPACE_BORDER, kz_high + K_SPACE_BORDER, resolution.get("kz", inferred_kz_res)
+        )
+
+        return coordinates
+
+    def kspace_to_hv(
+        self,
+        binding_energy: np.ndarray,
+        kx: np.ndarray,
+        ky: np.ndarray,
+        kz: np.ndarray,
+        *args: Any,
+        **kwargs: Any
+    ) -> np.ndarray:
+        """Converts from momentum back to the raw photon energy."""
+        if self.hv is None:
+            self.hv = np.zeros_like(kx)
+            self.k_tot = np.zeros_like(kx)
+            _kspace_to_hv_k_tot(
+                kx,
+                ky,
+                kz,
+                np.atleast_1d(binding_energy).astype(kx.dtype, copy=False),
+                self.arr.S.work_function,
+                self.arr.S.inner_potential,
+                self.hv,
+                self.k_tot,
+            )
+
+        return self.hv
+
+    def kspace_to_phi(
+        self,
+        binding_energy: np.ndarray,
+        kx: np.ndarray,
+        ky: np.ndarray,
+        kz: np.ndarray,
+        *args: Any,
+        **kwargs: Any
+    ) -> np.ndarray:
+        """Converts from momentum back to the analyzer angular axis."""
+        self.kspace_to_hv(binding_energy, kx, ky, kz)
+        return super(ConvertKxKyKz, self).kspace_to_phi(binding_energy, kx, ky)
+
+    def kspace_to_perp_angle(
+        self,
+        binding_energy: np.ndarray,
+        kx: np.ndarray,
+        ky: np.ndarray,
+        kz: np.ndarray,
+        *args: Any,
+        **kwargs: Any
+    ) -> np.ndarray:
+        """Converts from momentum back to the scan angle perpendicular to the analyzer."""
+        self.kspace_to_hv(binding_energy, kx, ky, kz)
+        return super(ConvertKxKyKz, self).kspace_to_perp_angle(binding_energy, kx, ky)
+
+    def conversion_for(self, dim: str) -> Callable:
+        """Looks up the appropriate momentum-to-angle conversion routine by dimension name."""
+        if dim == "hv":
+            return self.kspace_to_hv
+
+        return super(ConvertKxKyKz, self).conversion_for(dim)
 
 
 class ConvertKpKz(CoordinateConverter):
@@ -82,12 +201,8 @@ class ConvertKpKz(CoordinateConverter):
         if "kz" in bounds:
             kz_low, kz_high = bounds["kz"]
 
-        inferred_kp_res = (kp_high - kp_low + 2 * K_SPACE_BORDER) / len(self.arr.coords["phi"])
-        inferred_kp_res = [b for b in MOMENTUM_BREAKPOINTS if b < inferred_kp_res][-1]
-
-        # go a bit finer here because it would otherwise be very coarse
-        inferred_kz_res = (kz_high - kz_low + 2 * K_SPACE_BORDER) / len(self.arr.coords["hv"])
-        inferred_kz_res = [b for b in MOMENTUM_BREAKPOINTS if b < inferred_kz_res][-1]
+        inferred_res = calculate_momentum_resolution(self.arr)
+        inferred_kp_res, inferred_kz_res = inferred_res["kp"], inferred_res["kz"]
 
         coordinates["kp"] = np.arange(
             kp_low - K_SPACE_BORDER, kp_high + K_SPACE_BORDER, resolution.get("kp", inferred_kp_res)
@@ -110,7 +225,7 @@ class ConvertKpKz(CoordinateConverter):
             inner_v = self.arr.S.inner_potential
             wf = self.arr.S.work_function
 
-            is_constant_shift = True
+            is_constant_shift = False
             if not isinstance(binding_energy, np.ndarray):
                 is_constant_shift = True
                 binding_energy = np.array([binding_energy])
@@ -134,11 +249,13 @@ class ConvertKpKz(CoordinateConverter):
 
         self.phi = np.zeros_like(self.hv)
 
+        # the parallel momentum is conserved across the surface, so phi is determined by the
+        # momentum in vacuum and not by the momentum inside the sample
         _kp_to_polar(
             kinetic_energy,
             kp,
             self.phi,
-            self.arr.S.inner_potential,
+            0.0,
             self.arr.S.phi_offset,
         )
 
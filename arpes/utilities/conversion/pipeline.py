@@ -0,0 +1,117 @@
+"""Chains corrections of the measured coordinates into a single momentum conversion.
+
+A standard reduction corrects the Fermi edge, then the detector trapezoid, and finally converts
+to momentum. Each of these is a resampling of the data, so applying them one after another
+interpolates (and smears) the data several times and allocates a full copy of it at each step.
+
+Each of these corrections can instead be expressed as a map from coordinates after the correction
+to the coordinates which were measured. Composing these maps with the inverse momentum transform
+gives the measured coordinates of every point on the final momentum grid, so that the raw data
+is interpolated exactly once.
+
+Example:
+    >>> pipeline = ConversionPipeline([  # doctest: +SKIP
+    ...     FermiEdgeShift.from_quadratic_correction(edge_correction),
+    ...     trapezoidal_calibration(corners),
+    ... ])
+    >>> kdata = pipeline.convert(raw_cut)  # doctest: +SKIP
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import xarray as xr
+
+from .core import convert_to_kspace
+
+__all__ = ("ConversionPipeline", "FermiEdgeShift")
+
+
+class FermiEdgeShift:
+    """A Fermi edge correction, shifting energies by an amount depending on another coordinate.
+
+    This is the source coordinate map of the ``apply_*_fermi_edge_correction`` functions, which
+    move the edge measured at ``edge(along)`` to ``offset``.
+
+    Args:
+        along: The coordinate on which the edge position depends, such as "phi" or "hv".
+        edge: The edge position, either as a function of `along` or as a one dimensional DataArray
+          which is linearly interpolated.
+        offset: The energy to which the edge is moved.
+    """
+
+    def __init__(
+        self, along: str, edge: Union[Callable[[np.ndarray], np.ndarray], xr.DataArray], offset=0
+    ):
+        """Record the coordinate the shift depends on, the edge position, and its target."""
+        self.along = along
+        self.edge = edge
+        self.offset = offset
+
+    @classmethod
+    def from_quadratic_correction(cls, correction, offset=None) -> "FermiEdgeShift":
+        """The shift of ``apply_quadratic_fermi_edge_correction`` for a fitted correction."""
+        return cls("phi", lambda phi: correction.eval(x=phi), offset=offset or 0)
+
+    @classmethod
+    def from_photon_energy_correction(cls, correction: xr.DataArray) -> "FermiEdgeShift":
+        """The shift of ``apply_photon_energy_fermi_edge_correction`` for the fits along hv."""
+        return cls("hv", correction.G.map(lambda x: x.params["center"].value))
+
+    @classmethod
+    def from_direct_correction(cls, correction: xr.DataArray) -> "FermiEdgeShift":
+        """The shift of ``apply_direct_fermi_edge_correction`` for a correction stencil."""
+        return cls(correction.dims[0], correction)
+
+    def shift(self, along: np.ndarray) -> np.ndarray:
+        """The energy of the measured edge relative to its corrected position at `along`."""
+        if isinstance(self.edge, xr.DataArray):
+            coordinate = self.edge.coords[self.edge.dims[0]].values
+            order = np.argsort(coordinate)
+            edge = np.interp(along, coordinate[order], self.edge.values[order])
+        else:
+            edge = self.edge(along)
+
+        return edge - self.offset
+
+    def source_coordinates(self, coords: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Maps corrected coordinates to the coordinates they are measured at."""
+        if "eV" not in coords or self.along not in coords:
+            return coords
+
+        return dict(coords, eV=coords["eV"] + self.shift(coords[self.along]))
+
+
+class ConversionPipeline:
+    """A sequence of coordinate corrections executed together with the momentum conversion.
+
+    Steps are given in the order they would be applied to the data, and can be anything with a
+    ``source_coordinates`` method mapping a dict of corrected coordinates to measured coordinates,
+    such as a `FermiEdgeShift` or a `trapezoidal_calibration`.
+    """
+
+    def __init__(self, steps: Optional[Sequence] = None):
+        """Start the pipeline with `steps`, if any are provided."""
+        self.steps: List = list(steps or [])
+
+    def then(self, step) -> "ConversionPipeline":
+        """A pipeline which additionally applies `step` after the current steps."""
+        return ConversionPipeline(self.steps + [step])
+
+    def source_coordinates(self, coords: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Maps coordinates after all corrections to the measured coordinates."""
+        for step in reversed(self.steps):
+            coords = step.source_coordinates(coords)
+
+        return coords
+
+    def convert(self, arr: xr.DataArray, **kwargs) -> xr.DataArray:
+        """Corrects and converts the raw data `arr` to momentum with a single interpolation.
+
+        Args:
+            arr: The raw, uncorrected angle space data.
+            kwargs: Passed to `convert_to_kspace`, for instance to set the resolution or bounds.
+
+        Returns:
+            The corrected data in momentum space.
+        """
+        return convert_to_kspace(arr, corrections=self, **kwargs)
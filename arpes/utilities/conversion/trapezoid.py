@@ -1,22 +1,36 @@
-"""Implements forward and reverse trapezoidal corrections."""
+"""Implements forward and reverse trapezoidal corrections.
+
+The correction only resamples along the detector angle at each energy, so it is applied as a
+gather from precomputed indices and weights. These only depend on the corners and the energy and
+angle axes, and are cached, so correcting many scans on the same axes costs one pass over the data.
+
+The correction can also be folded into a momentum conversion by passing
+``trapezoidal_calibration(corners)`` as its ``calibration``, so that data is interpolated once.
+"""
+import functools
 import warnings
 import numpy as np
 import xarray as xr
 
 import numba
 
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Tuple
 
 from arpes.trace import Trace, traceable
 from arpes.utilities import normalize_to_spectrum
+from arpes.utilities.jit import kernel
 
 from .base import CoordinateConverter
-from .core import convert_coordinates
 
-__all__ = ["apply_trapezoidal_correction"]
+__all__ = ["apply_trapezoidal_correction", "trapezoidal_calibration"]
+
+
+def _phi_to_phi_examples(dtype):
+    energy, phi = np.zeros(4, dtype=dtype), np.zeros(4, dtype=dtype)
+    return [(energy, phi, np.zeros_like(phi), -0.2, -0.25, 0.2, 0.25)]
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_phi_to_phi_examples)
 def _phi_to_phi(energy, phi, phi_out, l_fermi, l_volt, r_fermi, r_volt):
     """Performs reverse coordinate interpolation using four angular waypoints.
 
@@ -45,7 +59,7 @@ def _phi_to_phi(energy, phi, phi_out, l_fermi, l_volt, r_fermi, r_volt):
         phi_out[i] = (phi[i] - l_fermi) * dac_da + l
 
 
-@numba.njit(parallel=True)
+@kernel(parallel=True, nogil=True, examples=_phi_to_phi_examples)
 def _phi_to_phi_forward(energy, phi, phi_out, l_fermi, l_volt, r_fermi, r_volt):
     """The inverse transform to ``_phi_to_phi``. See that function for details."""
     for i in numba.prange(len(phi)):
@@ -57,6 +71,66 @@ def _phi_to_phi_forward(energy, phi, phi_out, l_fermi, l_volt, r_fermi, r_volt):
         phi_out[i] = l_fermi + c * (r_fermi - l_fermi)
 
 
+def _gather_examples(dtype):
+    data = np.zeros((2, 3, 2), dtype=dtype)
+    index = np.zeros((2, 3), dtype=np.int64)
+    return [(data, index, np.zeros((2, 3)), np.zeros_like(data))]
+
+
+@kernel(parallel=True, nogil=True, examples=_gather_examples)
+def _gather_along_phi(data, index, weight, out):
+    """Linearly resamples each energy of [eV, phi, rest] shaped data at precomputed phi positions.
+
+    Args:
+        data: The measured data, with shape [eV, phi, rest].
+        index: For each output [eV, phi], the lower neighboring measured phi index, or -1 where the
+          corrected angle falls outside of the measured range.
+        weight: The linear weight of the upper neighbor.
+        out: The array to populate, with shape [eV, phi, rest].
+    """
+    n_energy, n_phi, n_rest = out.shape
+    for i in numba.prange(n_energy):
+        for j in range(n_phi):
+            k = index[i, j]
+            if k < 0:
+                for r in range(n_rest):
+                    out[i, j, r] = np.nan
+                continue
+
+            w = weight[i, j]
+            for r in range(n_rest):
+                out[i, j, r] = data[i, k, r] * (1 - w) + data[i, k + 1, r] * w
+
+
+@functools.lru_cache(maxsize=16)
+def _correction_map(
+    corner_angles: Tuple[float, float, float, float],
+    energies: Tuple[float, ...],
+    phis: Tuple[float, ...],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The measured phi index and weight to gather from for each corrected (eV, phi)."""
+    energy, phi = np.meshgrid(np.asarray(energies), np.asarray(phis), indexing="ij")
+    measured = np.zeros(phi.size)
+    _phi_to_phi(energy.ravel(), phi.ravel(), measured, *corner_angles)
+
+    phis = np.asarray(phis)
+    is_decreasing = len(phis) > 1 and phis[1] < phis[0]
+    indices = np.arange(len(phis))
+    if is_decreasing:
+        position = indices[-1] - np.interp(measured, phis[::-1], indices, left=np.nan, right=np.nan)
+    else:
+        position = np.interp(measured, phis, indices, left=np.nan, right=np.nan)
+
+    position = position.reshape(phi.shape)
+    index = np.clip(np.floor(np.nan_to_num(position, nan=0)), 0, max(len(phis) - 2, 0))
+    weight = np.nan_to_num(position - index)
+    index = np.where(np.isnan(position), -1, index).astype(np.int64)
+
+    index.flags.writeable = False
+    weight.flags.writeable = False
+    return index, weight
+
+
 class ConvertTrapezoidalCorrection(CoordinateConverter):
     """A converter for applying the trapezoidal correction to ARPES data."""
 
@@ -78,7 +152,7 @@ class ConvertTrapezoidalCorrection(CoordinateConverter):
         left_phi_one_volt = left_phi_fermi - left_per_volt
 
         right_per_volt = (c3["phi"] - c4["phi"]) / (c3["eV"] - c4["eV"])
-        right_phi_fermi = c3["phi"] - c4["eV"] * right_per_volt
+        right_phi_fermi = c4["phi"] - c4["eV"] * right_per_volt
         right_phi_one_volt = right_phi_fermi - right_per_volt
 
         self.corner_angles = (
@@ -113,6 +187,41 @@ class ConvertTrapezoidalCorrection(CoordinateConverter):
         _phi_to_phi_forward(binding_energy, phi, phi_out, *self.corner_angles)
         return phi_out
 
+    def correct_detector_angle(self, eV: np.ndarray, phi: np.ndarray) -> np.ndarray:
+        """The measured phi for corrected angles, so this can act as a conversion calibration."""
+        eV, phi = np.broadcast_arrays(np.asarray(eV, dtype=np.float64), phi)
+        phi_out = np.zeros(phi.shape)
+        _phi_to_phi(eV.ravel(), phi.ravel(), phi_out.ravel(), *self.corner_angles)
+        return phi_out
+
+    def source_coordinates(self, coords: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Maps corrected coordinates to measured coordinates, as a step of a ConversionPipeline."""
+        if "eV" not in coords or "phi" not in coords:
+            return coords
+
+        return dict(coords, phi=self.correct_detector_angle(coords["eV"], coords["phi"]))
+
+
+def trapezoidal_calibration(corners: List[Dict[str, float]]) -> ConvertTrapezoidalCorrection:
+    """A trapezoidal correction which can be passed as the `calibration` of `convert_to_kspace`.
+
+    This can also be used as a step of a `ConversionPipeline`.
+
+    Folding the correction into the momentum conversion this way means that data is only
+    interpolated once, rather than once to correct the detector angle and again into momentum.
+
+    Example:
+        >>> calibration = trapezoidal_calibration(corners)  # doctest: +SKIP
+        >>> kdata = convert_to_kspace(cut, calibration=calibration)  # doctest: +SKIP
+
+    Args:
+        corners: The waypoints of the correction, as for `apply_trapezoidal_correction`.
+
+    Returns:
+        The correction, usable as a calibration.
+    """
+    return ConvertTrapezoidalCorrection(None, [], corners=corners)
+
 
 @traceable
 def apply_trapezoidal_correction(
@@ -120,9 +229,10 @@ def apply_trapezoidal_correction(
 ) -> xr.DataArray:
     """Applies the trapezoidal correction to data in angular units by linearly interpolating slices.
 
-    Shares some code with standard coordinate conversion, i.e. to momentum, because you can think of
-    this as performing a coordinate conversion between two angular coordinate sets, the measured angles
-    and the true angles.
+    You can think of this as performing a coordinate conversion between two angular coordinate sets,
+    the measured angles and the true angles. Because only phi is resampled, and only as a function
+    of the energy, this is done as a gather over any additional dimensions from a cached correction
+    map.
 
     Args:
         data: The xarray instances to perform correction on
@@ -155,38 +265,27 @@ def apply_trapezoidal_correction(
         data = normalize_to_spectrum(data)
         data.attrs.update(attrs)
 
-    original_coords = data.coords
-
     trace("Determining dimensions.")
-    if "phi" not in data.dims:
-        raise ValueError("The data must have a phi coordinate.")
-    trace("Replacing dummy coordinates with index-like ones.")
+    if "phi" not in data.dims or "eV" not in data.dims:
+        raise ValueError("The data must have eV and phi coordinates.")
+
     removed = [d for d in data.dims if d not in ["eV", "phi"]]
     data = data.transpose(*(["eV", "phi"] + removed))
-    converted_dims = data.dims
-
-    restore_index_like_coordinates = {r: data.coords[r].values for r in removed}
-    new_index_like_coordinates = {r: np.arange(len(data.coords[r].values)) for r in removed}
-    data = data.assign_coords(**new_index_like_coordinates)
-
-    converter = ConvertTrapezoidalCorrection(data, converted_dims, corners=corners)
-    converted_coordinates = converter.get_coordinates()
-
-    trace("Calling convert_coordinates")
-    result = convert_coordinates(
-        data,
-        converted_coordinates,
-        {
-            "dims": data.dims,
-            "transforms": dict(zip(data.dims, [converter.conversion_for(d) for d in data.dims])),
-        },
-        trace=trace,
-    )
 
-    trace("Reassigning index-like coordinates.")
-    result = result.assign_coords(**restore_index_like_coordinates)
-    result = result.assign_coords(
-        **{c: v for c, v in original_coords.items() if c not in result.coords}
+    converter = ConvertTrapezoidalCorrection(data, data.dims, corners=corners)
+
+    trace("Building correction map")
+    index, weight = _correction_map(
+        tuple(float(c) for c in converter.corner_angles),
+        tuple(data.coords["eV"].values.tolist()),
+        tuple(data.coords["phi"].values.tolist()),
     )
-    result = result.assign_attrs(data.attrs)
-    return result
+
+    trace("Resampling along phi")
+    values = data.values
+    dtype = np.float32 if values.dtype == np.float32 else np.float64
+    values = np.ascontiguousarray(values, dtype=dtype).reshape(len(data.eV), len(data.phi), -1)
+    corrected = np.empty_like(values)
+    _gather_along_phi(values, index, weight, corrected)
+
+    return data.copy(data=corrected.reshape(data.shape))
@@ -0,0 +1,139 @@
+"""A registry of the numba kernels used throughout PyARPES.
+
+Kernels are compiled lazily by numba on first use, which means that each fresh process
+pays the JIT cost the first time it converts data to momentum. This is especially
+painful for short lived batch jobs and process pool workers.
+
+Every kernel defined through ``kernel`` is compiled with ``cache=True``, so compiled
+machine code is persisted to disk next to the defining module (or to ``NUMBA_CACHE_DIR``)
+and reused across processes. Kernels can also provide example arguments, which allows
+``warmup`` to compile all of the commonly used signatures ahead of time.
+"""
+import importlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numba
+import numpy as np
+
+from arpes.trace import Trace, traceable
+
+__all__ = [
+    "kernel",
+    "warmup",
+    "registered_kernels",
+]
+
+# Modules which define registered kernels, imported by ``warmup`` so that
+# the registry is fully populated before we compile.
+KERNEL_MODULES = [
+    "arpes.utilities.conversion.fast_interp",
+    "arpes.utilities.conversion.forward",
+    "arpes.utilities.conversion.kx_ky_conversion",
+    "arpes.utilities.conversion.kz_conversion",
+    "arpes.utilities.conversion.trapezoid",
+    "arpes.utilities.math",
+    "arpes.analysis.mask",
+    "arpes.analysis.derivative",
+    "arpes.analysis.filters",
+    "arpes.plotting.movie",
+]
+
+WARMUP_DTYPES = (np.float32, np.float64)
+
+
+@dataclass
+class Kernel:
+    """Bookkeeping for a registered numba kernel.
+
+    Attributes:
+        name: The qualified name of the kernel, ``module.function``.
+        dispatcher: The numba dispatcher which is called by client code.
+        examples: Produces a list of example argument tuples for a given floating point dtype.
+          These are used to compile the kernel ahead of time. Helper kernels which are only
+          called from other kernels do not need examples, they are compiled with their callers.
+          Kernels whose signature does not depend on the dtype of the data produce examples
+          for float64 only, and an empty list otherwise.
+    """
+
+    name: str
+    dispatcher: Any
+    examples: Optional[Callable[[np.dtype], List[Tuple]]] = None
+    compile_times: Dict[str, float] = field(default_factory=dict)
+
+
+_KERNELS: Dict[str, Kernel] = {}
+
+
+def kernel(
+    parallel: bool = False,
+    examples: Optional[Callable[[np.dtype], List[Tuple]]] = None,
+    nogil: bool = False,
+) -> Callable:
+    """Compiles a function with numba and registers it for on disk caching and warmup.
+
+    Args:
+        parallel: Whether to compile with ``parallel=True``, which enables ``numba.prange``.
+        examples: An optional callable producing example arguments for a given dtype.
+        nogil: Whether to release the GIL, so that the kernel can run concurrently on threads.
+
+    Returns:
+        A decorator producing the numba dispatcher for the decorated function.
+    """
+
+    def decorator(fn: Callable) -> Any:
+        dispatcher = numba.njit(parallel=parallel, nogil=nogil, cache=True)(fn)
+        name = f"{fn.__module__}.{fn.__name__}"
+        _KERNELS[name] = Kernel(name=name, dispatcher=dispatcher, examples=examples)
+        return dispatcher
+
+    return decorator
+
+
+def registered_kernels() -> Dict[str, Kernel]:
+    """Returns the kernels registered so far, keyed by their qualified name."""
+    return dict(_KERNELS)
+
+
+@traceable
+def warmup(dtypes: Sequence[type] = WARMUP_DTYPES, trace: Trace = None) -> Dict[str, float]:
+    """Compiles all registered kernels ahead of time.
+
+    Because kernels are cached on disk, this is very fast after the first invocation
+    on a given installation, at which point it mostly serves to load cached machine code.
+    Calling this at the start of a batch job or in a process pool initializer moves
+    compilation out of the first momentum conversion.
+
+    Args:
+        dtypes: The floating point types to compile kernels for.
+        trace: A trace instance, pass ``True`` to report the compile time of each kernel.
+
+    Returns:
+        The time in ms spent compiling (or loading) each kernel, keyed by ``name[dtype]``.
+    """
+    for module_name in KERNEL_MODULES:
+        importlib.import_module(module_name)
+
+    timings = {}
+    for name, registered in _KERNELS.items():
+        if registered.examples is None:
+            continue
+
+        for dtype in dtypes:
+            examples = registered.examples(np.dtype(dtype))
+            if not examples:
+                continue
+
+            dtype_name = np.dtype(dtype).name
+            start = time.perf_counter()
+            for args in examples:
+                registered.dispatcher(*args)
+
+            elapsed = (time.perf_counter() - start) * 1000
+            registered.compile_times[dtype_name] = elapsed
+            timings[f"{name}[{dtype_name}]"] = elapsed
+            trace(f"Compiled {name} [{dtype_name}] in {elapsed:.1f} ms")
+
+    trace(f"Finished warmup: {sum(timings.values()):.1f} ms total.")
+    return timings
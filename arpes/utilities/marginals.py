@@ -0,0 +1,147 @@
+"""Cached binned marginals of a volume, for interactive tools which redraw them on cursor moves.
+
+Interactive tools draw marginals of a volume: the data averaged over a window of a few pixels
+along one or two dimensions around the cursor. Averaging the window directly reduces a slab of
+the data on every cursor move, which is slow for large maps.
+
+A `MarginalCache` instead keeps prefix sums (summed area tables) of the data along the
+dimensions which are averaged over. The sum over any window is then a signed sum of 2^k corner
+slices of the prefix sum, for k averaged dimensions, so that the cost of a marginal depends only
+on its size and not on the binning.
+"""
+import collections
+import itertools
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+import xarray as xr
+
+__all__ = ("MarginalCache",)
+
+# Upper bound in bytes on the memory held by the prefix sums of a cache
+MARGINAL_CACHE_SIZE = 2 ** 31
+
+# Prefix sums of the data, and of the number of finite values if the data has NaNs
+_PrefixSums = Tuple[np.ndarray, Optional[np.ndarray]]
+
+
+class MarginalCache:
+    """Binned marginals of a DataArray from lazily built, cached prefix sums.
+
+    Prefix sums are built the first time a marginal over a given set of dimensions is binned,
+    and evicted least recently used first when they exceed `max_bytes`. Prefix sums which were
+    evicted before are only built again if they fit without evicting others: when the marginals
+    drawn together do not fit at once, the ones which do not fit are computed directly rather
+    than rebuilding prefix sums on every redraw. Marginals without binning are plain selections
+    and are never cached.
+
+    Prefix sums have the precision of the data, single precision data is summed in single
+    precision. NaN values are skipped, as by ``DataArray.mean``.
+
+    Args:
+        data: The volume to take marginals of.
+        max_bytes: The memory available for prefix sums. Marginals which would not fit are
+          computed directly.
+    """
+
+    def __init__(self, data: xr.DataArray, max_bytes: int = MARGINAL_CACHE_SIZE):
+        """Start without prefix sums, which are built as marginals are requested."""
+        self.data = data
+        self.max_bytes = max_bytes
+        self._has_nan = None
+        self._prefix_sums: Dict[Tuple[str, ...], _PrefixSums] = collections.OrderedDict()
+        self._evicted: Set[Tuple[str, ...]] = set()
+
+    @property
+    def nbytes(self) -> int:
+        """The memory held by cached prefix sums."""
+        return sum(
+            total.nbytes + (0 if count is None else count.nbytes)
+            for total, count in self._prefix_sums.values()
+        )
+
+    def _prefix_sum(self, dims: Tuple[str, ...]):
+        """Prefix sums of the data and of the number of finite values, along `dims`."""
+        if dims in self._prefix_sums:
+            self._prefix_sums.move_to_end(dims)
+            return self._prefix_sums[dims]
+
+        values = self.data.values
+        if self._has_nan is None:
+            self._has_nan = bool(np.isnan(values).any())
+
+        dtype = np.result_type(values.dtype, np.float32)
+        shape = [n + (d in dims) for d, n in zip(self.data.dims, values.shape)]
+        size = (dtype.itemsize + (4 if self._has_nan else 0)) * int(np.prod(shape))
+
+        free = self.max_bytes - self.nbytes
+        if size > self.max_bytes or (dims in self._evicted and size > free):
+            return None
+
+        while self._prefix_sums and self.nbytes + size > self.max_bytes:
+            evicted, _ = self._prefix_sums.popitem(last=False)
+            self._evicted.add(evicted)
+
+        def accumulate(values, dtype):
+            # a leading zero along each of dims, so that window sums are differences of entries
+            out = np.zeros(shape, dtype=dtype)
+            out[tuple(slice(int(d in dims), None) for d in self.data.dims)] = values
+            for d in dims:
+                np.cumsum(out, axis=self.data.dims.index(d), out=out)
+            return out
+
+        if self._has_nan:
+            finite = np.isfinite(values)
+            entry = accumulate(np.where(finite, values, 0), dtype), accumulate(finite, np.int32)
+        else:
+            entry = accumulate(values, dtype), None
+
+        self._prefix_sums[dims] = entry
+        return entry
+
+    def marginal(self, windows: Dict[str, slice]) -> xr.DataArray:
+        """The data averaged over `windows`, equivalent to ``data.isel(windows).mean(windows)``.
+
+        Args:
+            windows: Index slices with unit step along the dimensions to average over.
+
+        Returns:
+            The marginal, with the remaining dimensions in the order of the data.
+        """
+        remaining = [d for d in self.data.dims if d not in windows]
+        coords = {d: self.data.coords[d] for d in remaining if d in self.data.coords}
+        binned = tuple(d for d in self.data.dims if d in windows and _width(windows[d]) > 1)
+
+        cached = self._prefix_sum(binned) if binned else None
+        if cached is None:
+            selected = self.data.isel(windows)
+            return selected.mean(list(windows)) if windows else selected
+
+        total, count = cached
+        unbinned = {self.data.dims.index(d): windows[d].start for d in windows if d not in binned}
+        axes = [self.data.dims.index(d) for d in binned]
+
+        summed, counted = 0, 0
+        for corner in itertools.product((0, 1), repeat=len(binned)):
+            index = [slice(None)] * len(self.data.dims)
+            for axis, start in unbinned.items():
+                index[axis] = start
+            for axis, d, high in zip(axes, binned, corner):
+                index[axis] = windows[d].stop if high else windows[d].start
+
+            sign = (-1) ** (len(binned) - sum(corner))
+            summed = summed + sign * total[tuple(index)]
+            if count is not None:
+                counted = counted + sign * count[tuple(index)]
+
+        if count is None:
+            counted = np.prod([_width(windows[d]) for d in binned])
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.where(counted > 0, summed / np.maximum(counted, 1), np.nan)
+
+        return xr.DataArray(values, coords=coords, dims=remaining)
+
+
+def _width(window: slice) -> int:
+    return window.stop - window.start
@@ -1,12 +1,17 @@
 """Math snippets used elsewhere in PyARPES."""
 import collections
+import collections.abc
 import itertools
+import math
 
+import numba
 import numpy as np
+import scipy.ndimage
 import scipy.ndimage.interpolation
 
 import arpes.constants
 import xarray as xr
+from arpes.utilities.jit import kernel
 
 
 def derivative(f, arg_idx=0):
@@ -46,17 +51,77 @@ def propagate_statistical_error(f):
     return compute_propagated_error
 
 
-def shift_by(arr, value, axis=0, by_axis=0, **kwargs):
-    """Shifts slices of `arr` perpendicular to `by_axis` by `value`."""
-    assert axis != by_axis
+def _shift_rows_examples(dtype):
+    return [(np.zeros((2, 4), dtype=dtype), np.zeros(2), np.zeros((2, 4), dtype=dtype), 0.0)]
+
+
+@kernel(parallel=True, examples=_shift_rows_examples)
+def _shift_rows_linear(data, shifts, output, cval):
+    """Linearly interpolated subpixel shift of each row of `data` by the matching entry of `shifts`.
+
+    Matches ``scipy.ndimage.shift(..., order=1, mode="constant")`` row by row. Each row is
+    copied before it is written, so `output` may be the same array as `data`.
+    """
+    n = data.shape[1]
+    for row in numba.prange(data.shape[0]):
+        values = data[row].copy()
+        for i in range(n):
+            x = i - shifts[row]
+            if not (x >= 0 and x <= n - 1):
+                output[row, i] = cval
+                continue
+
+            i0 = min(int(math.floor(x)), n - 1)
+            i1 = min(i0 + 1, n - 1)
+            xd = x - i0
+            output[row, i] = values[i0] * (1 - xd) + values[i1] * xd
+
+
+@kernel()
+def _mirror_index(k, n):
+    if n == 1:
+        return 0
+    period = 2 * (n - 1)
+    k = abs(k) % period
+    return k if k < n else period - k
+
+
+@kernel()
+def _cubic_bspline(t):
+    t = abs(t)
+    if t < 1:
+        return 2 / 3 - t * t + t * t * t / 2
+    if t < 2:
+        return (2 - t) ** 3 / 6
+    return 0.0
+
+
+@kernel(parallel=True, examples=_shift_rows_examples)
+def _shift_rows_cubic(coefficients, shifts, output, cval):
+    """Cubic spline subpixel shift of each row, given spline `coefficients` along the rows.
+
+    Matches ``scipy.ndimage.shift(..., order=3, mode="constant")`` row by row when the
+    coefficients are computed with ``spline_filter1d(..., mode="mirror")``.
+    """
+    n = coefficients.shape[1]
+    for row in numba.prange(coefficients.shape[0]):
+        for i in range(n):
+            x = i - shifts[row]
+            if not (x >= 0 and x <= n - 1):
+                output[row, i] = cval
+                continue
+
+            i0 = int(math.floor(x))
+            value = 0.0
+            for k in range(i0 - 1, i0 + 3):
+                value += coefficients[row, _mirror_index(k, n)] * _cubic_bspline(x - k)
+            output[row, i] = value
+
+
+def _shift_by_slices(arr, value, axis, by_axis, **kwargs):
+    """Shifts slices one at a time with scipy, supports any options of ``scipy.ndimage.shift``."""
     arr_copy = arr.copy()
 
-    if isinstance(value, xr.DataArray):
-        value = value.values
-
-    if not isinstance(value, collections.Iterable):
-        value = list(itertools.repeat(value, times=arr.shape[by_axis]))
-
     for axis_idx in range(arr.shape[by_axis]):
         slc = (slice(None),) * by_axis + (axis_idx,) + (slice(None),) * (arr.ndim - by_axis - 1)
         shift_amount = (0,) * axis + (value[axis_idx],) + (0,) * (arr.ndim - axis - 1)
@@ -71,6 +136,86 @@ def shift_by(arr, value, axis=0, by_axis=0, **kwargs):
     return arr_copy
 
 
+def shift_by(arr, value, axis=0, by_axis=0, order=3, cval=0.0, out=None, **kwargs):
+    """Shifts slices of `arr` perpendicular to `by_axis` by `value`.
+
+    Shifts are in pixels along `axis` and can be fractional. `value` can be a scalar, an array with
+    one shift per index along `by_axis`, or, when `by_axis` is a tuple of axes, an array with one
+    shift for every combination of indices along those axes, so that the shift can depend on
+    several axes at once.
+
+    Linear and cubic spline interpolation (`order` 1 and 3) of floating point data with the default
+    constant boundary are performed for all slices in a single pass and agree with applying
+    ``scipy.ndimage.shift`` to each slice. Other options are forwarded to ``scipy.ndimage.shift``
+    slice by slice.
+
+    If `out` is provided, the result is written into it and returned. `out` may be `arr` itself,
+    which shifts the data in place.
+    """
+    by_axes = (by_axis,) if isinstance(by_axis, int) else tuple(by_axis)
+    assert axis not in by_axes
+
+    if isinstance(value, xr.DataArray):
+        value = value.values
+
+    fast = (
+        order in {1, 3}
+        and kwargs.get("mode", "constant") == "constant"
+        and kwargs.get("prefilter", True)
+        and set(kwargs).issubset({"mode", "prefilter"})
+        and np.issubdtype(arr.dtype, np.floating)
+    )
+
+    if not fast:
+        assert len(by_axes) == 1, "Only linear and cubic interpolation shift several axes."
+        if not isinstance(value, collections.abc.Iterable):
+            value = list(itertools.repeat(value, times=arr.shape[by_axes[0]]))
+        shifted = _shift_by_slices(arr, value, axis, by_axes[0], order=order, cval=cval, **kwargs)
+        if out is None:
+            return shifted
+        out[...] = shifted
+        return out
+
+    # produce one shift for every 1D slice along `axis`
+    field_shape = [1] * arr.ndim
+    for b in by_axes:
+        field_shape[b] = arr.shape[b]
+
+    value = np.asarray(value, dtype=np.float64)
+    if value.ndim:
+        value = np.transpose(value, np.argsort(by_axes)).reshape(field_shape)
+
+    slice_shape = list(arr.shape)
+    slice_shape[axis] = 1
+    shifts = np.moveaxis(np.broadcast_to(value, slice_shape), axis, -1).ravel()
+
+    data = np.moveaxis(arr, axis, -1).reshape(-1, arr.shape[axis])
+
+    # write directly into `out` when its rows along `axis` can be viewed without a copy
+    rows = None if out is None else np.moveaxis(out, axis, -1)
+    if rows is not None and rows.flags.c_contiguous and rows.dtype == arr.dtype:
+        output = rows.reshape(data.shape)
+    else:
+        output = np.empty(data.shape, dtype=arr.dtype)
+
+    if order == 1:
+        _shift_rows_linear(data, shifts, output, cval)
+    else:
+        coefficients = scipy.ndimage.spline_filter1d(
+            data, order=3, axis=-1, mode="mirror", output=np.float64
+        )
+        _shift_rows_cubic(coefficients, shifts, output, cval)
+
+    moved_shape = [n for i, n in enumerate(arr.shape) if i != axis] + [arr.shape[axis]]
+    shifted = np.moveaxis(output.reshape(moved_shape), -1, axis)
+    if out is None:
+        return shifted
+
+    if not np.shares_memory(shifted, out):
+        out[...] = shifted
+    return out
+
+
 def inv_fermi_distribution(energy, temperature, mu=0):
     """Expects energy in eV and temperature in Kelvin."""
     return np.exp((energy - mu) / (arpes.constants.K_BOLTZMANN_EV_KELVIN * temperature)) + 1
@@ -8,9 +8,10 @@ import weakref
 
 from collections import defaultdict
 
+from arpes.utilities.background import BackgroundJobs
 from arpes.utilities.ui import CursorRegion
 from .data_array_image_view import DataArrayImageView, DataArrayPlot
-from .utils import PlotOrientation, ReactivePlotRecord
+from .utils import PlotOrientation, ReactivePlotRecord, UIThreadDispatcher
 
 import arpes.config
 
@@ -33,6 +34,7 @@ class SimpleApp:
         self.settings = None
         self._window = None
         self._layout = None
+        self._background = None
 
         self.context = {}
 
@@ -56,6 +58,18 @@ class SimpleApp:
 
             print(pprint.pformat(value))
 
+    @property
+    def background(self) -> BackgroundJobs:
+        """Runs expensive computations off the UI thread, delivering results back to it.
+
+        Results are delivered through the Qt event loop, so the result callbacks of jobs can
+        update widgets directly. Started on first use, from the UI thread.
+        """
+        if self._background is None:
+            self._background = BackgroundJobs(deliver=UIThreadDispatcher())
+
+        return self._background
+
     @property
     def data(self) -> xr.DataArray:
         """Read data from the cached attribute.
@@ -72,6 +86,10 @@ class SimpleApp:
 
     def close(self):
         """Graceful shutdown. Tell each view to close and drop references so GC happens."""
+        if self._background is not None:
+            self._background.shutdown()
+            self._background = None
+
         for v in self.views.values():
             v.close()
 
@@ -2,10 +2,10 @@
 
 import enum
 from dataclasses import dataclass
-from typing import List
-from PyQt5 import QtWidgets
+from typing import Callable, List
+from PyQt5 import QtCore, QtWidgets
 
-__all__ = ["PlotOrientation", "ReactivePlotRecord"]
+__all__ = ["PlotOrientation", "ReactivePlotRecord", "UIThreadDispatcher"]
 
 
 class PlotOrientation(str, enum.Enum):
@@ -25,3 +25,26 @@ class ReactivePlotRecord:
     dims: List[str]
     view: QtWidgets.QWidget
     orientation: PlotOrientation
+
+
+class UIThreadDispatcher(QtCore.QObject):
+    """Runs functions on the thread which created the dispatcher, normally the UI thread.
+
+    Signals emitted from worker threads are queued onto the event loop of the receiving thread,
+    so calling the dispatcher from a background job safely hands its result to the UI.
+    """
+
+    dispatched = QtCore.pyqtSignal(object)
+
+    def __init__(self):
+        """Connect the signal with a queued connection, so that it is handled on this thread."""
+        super().__init__()
+        self.dispatched.connect(self.run, QtCore.Qt.QueuedConnection)
+
+    def __call__(self, fn: Callable[[], None]):
+        """Queues `fn` to run on the thread of the dispatcher, may be called from any thread."""
+        self.dispatched.emit(fn)
+
+    def run(self, fn: Callable[[], None]):
+        """Runs a queued function, called on the thread of the dispatcher."""
+        fn()
@@ -1,18 +1,34 @@
 """This package contains utilities related to taking more complicated shaped selections around data.
 
-Currently it houses just utilities for forming disk and annular selections out of data.
+It houses utilities for forming disk and annular selections out of data, a spatial index
+over the coordinates of data which accelerates these, and utilities for reducing data in
+windows around many points at once.
 """
 
-from typing import Dict, Optional, Tuple, Union
+import functools
+import itertools
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import xarray as xr
+from scipy.spatial import cKDTree
 
 from arpes.typing import DataType
 from arpes.utilities import normalize_to_spectrum
 from arpes.utilities.xarray import unwrap_xarray_dict
 
-__all__ = ("select_disk", "select_disk_mask", "unravel_from_mask", "ravel_from_mask")
+__all__ = (
+    "select_disk",
+    "select_disk_mask",
+    "unravel_from_mask",
+    "ravel_from_mask",
+    "select_around_points",
+    "CoordinateIndex",
+    "coordinate_index",
+)
+
+# Upper bound on the number of gathered elements per block for elliptical selections
+ELLIPTICAL_BLOCK_SIZE = 2 ** 24
 
 
 def ravel_from_mask(data, mask):
@@ -60,6 +76,217 @@ def unravel_from_mask(template, mask, values, default=np.nan):
     return dest.unstack("stacked")
 
 
+class CoordinateIndex:
+    """A spatial index over some of the coordinates of an array.
+
+    The index answers disk, annulus and nearest neighbor queries in coordinate space, and
+    reports its results as indices into the dimensions of the array, so that selections never
+    need to materialize full coordinate meshes.
+
+    When all of the indexed coordinates are regular dimension coordinates, queries are answered
+    by bounding box arithmetic on the grid: only the box circumscribing the query disk is ever
+    touched. Otherwise, for instance for forward converted momentum coordinates which depend on
+    several dimensions, queries go through a KD-tree over all points.
+
+    You should generally not construct these directly, instead use `coordinate_index` (or
+    `data.G.coordinate_index`) which caches indices across calls on the same coordinates.
+
+    Attributes:
+        names: The names of the indexed coordinates, i.e. the keys for points.
+        dims: The dimensions of the data spanned by the indexed coordinates.
+        shape: The sizes of `dims`.
+        is_grid: Whether queries use grid arithmetic rather than a KD-tree.
+    """
+
+    def __init__(self, coords: Dict[str, Tuple[Tuple[str, ...], np.ndarray]], dims: Sequence[str]):
+        """Builds the index from coordinates given as (dims, values) pairs.
+
+        Args:
+            coords: The coordinates to index, as pairs of their dimensions and values.
+            dims: The dimensions spanned by the coordinates, in the order of the data.
+        """
+        self.dims = tuple(dims)
+
+        sizes = {}
+        for coord_dims, values in coords.values():
+            sizes.update(zip(coord_dims, values.shape))
+        self.shape = tuple(sizes[d] for d in self.dims)
+
+        self.is_grid = all(coord_dims == (name,) for name, (coord_dims, _) in coords.items())
+
+        if self.is_grid:
+            self.names = self.dims
+            self._coords = {name: values for name, (_, values) in coords.items()}
+            self._tree = None
+        else:
+            self.names = tuple(coords.keys())
+            self._points = np.stack(
+                [
+                    xr.DataArray(values, dims=coord_dims)
+                    .broadcast_like(xr.DataArray(np.empty(self.shape), dims=self.dims))
+                    .transpose(*self.dims)
+                    .values.ravel()
+                    for coord_dims, values in coords.values()
+                ],
+                axis=-1,
+            )
+            self._tree = cKDTree(self._points)
+
+    def _center(self, around: Dict[str, float]) -> np.ndarray:
+        return np.asarray([around[name] for name in self.names], dtype=np.float64)
+
+    def _unravel(self, flat: np.ndarray) -> Dict[str, np.ndarray]:
+        return dict(zip(self.dims, np.unravel_index(flat, self.shape)))
+
+    def bounding_box(self, around: Dict[str, float], radius: float) -> Dict[str, slice]:
+        """The smallest index box containing every point within `radius` of `around`."""
+        if not self.is_grid:
+            indices, _ = self.query_radius(around, radius)
+            return {
+                d: slice(int(i.min()), int(i.max()) + 1) if len(i) else slice(0, 0)
+                for d, i in indices.items()
+            }
+
+        box = {}
+        for d in self.dims:
+            low, high = _window_bounds(self._coords[d], np.asarray([around[d]]), radius)
+            box[d] = slice(int(low[0]), max(int(high[0]), int(low[0])))
+
+        return box
+
+    def _box_distances(self, around: Dict[str, float], box: Dict[str, slice]) -> np.ndarray:
+        offsets = np.ix_(*[self._coords[d][box[d]] - around[d] for d in self.dims])
+        return np.sqrt(sum(offset ** 2 for offset in offsets))
+
+    def query_radius(
+        self, around: Dict[str, float], radius: float, outer_radius: Optional[float] = None
+    ) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """Finds the points in a disk, or in an annulus if `outer_radius` is provided.
+
+        Args:
+            around: The center of the query.
+            radius: The radius of the disk, or the inner radius of the annulus.
+            outer_radius: The outer radius of the annulus.
+
+        Returns:
+            The indices of the points along each of `dims`, and their distances to `around`.
+        """
+        inner_radius, radius = (None, radius) if outer_radius is None else (radius, outer_radius)
+
+        if self.is_grid:
+            box = self.bounding_box(around, radius)
+            distances = self._box_distances(around, box)
+            selected = distances <= radius
+            if inner_radius is not None:
+                selected &= distances > inner_radius
+
+            local = np.nonzero(selected)
+            indices = {d: i + box[d].start for d, i in zip(self.dims, local)}
+            return indices, distances[selected]
+
+        center = self._center(around)
+        flat = np.sort(np.asarray(self._tree.query_ball_point(center, radius), dtype=int))
+        distances = np.linalg.norm(self._points[flat] - center, axis=-1)
+        if inner_radius is not None:
+            outside = distances > inner_radius
+            flat, distances = flat[outside], distances[outside]
+
+        return self._unravel(flat), distances
+
+    def query_nearest(
+        self, around: Dict[str, float], k: int = 1
+    ) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """Finds the `k` points nearest to `around`, closest first.
+
+        Returns:
+            The indices of the points along each of `dims`, and their distances to `around`.
+        """
+        k = min(k, int(np.prod(self.shape)))
+
+        if not self.is_grid:
+            distances, flat = self._tree.query(self._center(around), k=k)
+            return self._unravel(np.atleast_1d(flat)), np.atleast_1d(distances)
+
+        # grow a disk until it holds at least k points, the k closest of which are then exact
+        stride = max(np.abs(np.diff(self._coords[d])).max(initial=0) for d in self.dims)
+        radius = max(stride, 1e-12) * k ** (1 / len(self.dims))
+        indices, distances = self.query_radius(around, radius)
+        while len(distances) < k:
+            radius *= 2
+            indices, distances = self.query_radius(around, radius)
+
+        closest = np.argsort(distances, kind="stable")[:k]
+        return {d: i[closest] for d, i in indices.items()}, distances[closest]
+
+    def mask(
+        self, around: Dict[str, float], radius: float, outer_radius: Optional[float] = None
+    ) -> np.ndarray:
+        """A boolean mask with shape `shape` of the points in a disk or annulus.
+
+        See `query_radius` for the meaning of the arguments.
+        """
+        mask = np.zeros(self.shape, dtype=bool)
+
+        if self.is_grid:
+            box = self.bounding_box(around, radius if outer_radius is None else outer_radius)
+            distances = self._box_distances(around, box)
+            selected = distances <= (radius if outer_radius is None else outer_radius)
+            if outer_radius is not None:
+                selected &= distances > radius
+
+            mask[tuple(box[d] for d in self.dims)] = selected
+            return mask
+
+        indices, _ = self.query_radius(around, radius, outer_radius)
+        mask[tuple(indices[d] for d in self.dims)] = True
+        return mask
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_coordinate_index(
+    coords: Tuple[Tuple[str, Tuple[str, ...], Tuple[int, ...], str, bytes], ...],
+    dims: Tuple[str, ...],
+) -> CoordinateIndex:
+    return CoordinateIndex(
+        {
+            name: (coord_dims, np.frombuffer(values, dtype=dtype).reshape(shape))
+            for name, coord_dims, shape, dtype, values in coords
+        },
+        dims,
+    )
+
+
+def coordinate_index(data: DataType, names: Optional[Sequence[str]] = None) -> CoordinateIndex:
+    """Returns a (cached) `CoordinateIndex` over the coordinates `names` of `data`.
+
+    Indices are cached on the values of the coordinates, so that repeated queries against the
+    same data, or against other data on the same coordinates, reuse the same index.
+
+    Args:
+        data: The data whose coordinates should be indexed.
+        names: The coordinates to index, by default the dimensions of `data`.
+
+    Returns:
+        The spatial index.
+    """
+    data = normalize_to_spectrum(data)
+    if names is None:
+        names = data.dims
+
+    dims = tuple(d for d in data.dims if any(d in data.coords[name].dims for name in names))
+    key = tuple(
+        (
+            name,
+            coord.dims,
+            coord.shape,
+            coord.dtype.str,
+            np.ascontiguousarray(coord.values).tobytes(),
+        )
+        for name, coord in ((name, data.coords[name]) for name in names)
+    )
+    return _cached_coordinate_index(key, dims)
+
+
 def _normalize_point(data, around, **kwargs):
     collected_kwargs = {k: kwargs[k] for k in data.dims if k in kwargs}
 
@@ -110,21 +337,15 @@ def select_disk_mask(
     data = normalize_to_spectrum(data)
     around = _normalize_point(data, around, **kwargs)
 
-    raveled = data.G.ravel()
-
-    dim_order = list(around.keys())
-    dist = np.sqrt(
-        np.sum(np.stack([(raveled[d] - around[d]) ** 2 for d in dim_order], axis=1), axis=1)
-    )
-
-    mask = dist <= radius
+    index = coordinate_index(data, list(around.keys()))
+    mask = index.mask(around, radius, outer_radius)
     if outer_radius is not None:
-        mask = np.logical_or(mask, dist > outer_radius)
+        mask = np.logical_not(mask)
 
     if flat:
-        return mask
+        return mask.ravel()
 
-    return mask.reshape(data.shape[::-1])
+    return mask
 
 
 def select_disk(
@@ -156,19 +377,221 @@ def select_disk(
     """
     data = normalize_to_spectrum(data)
     around = _normalize_point(data, around, **kwargs)
-    mask = select_disk_mask(data, radius, outer_radius=outer_radius, around=around, flat=True)
 
-    if invert:
-        mask = np.logical_not(mask)
+    if outer_radius is None and not invert:
+        indices, dist = coordinate_index(data, list(around.keys())).query_radius(around, radius)
+    else:
+        mask = select_disk_mask(data, radius, outer_radius=outer_radius, around=around)
+        if invert:
+            mask = np.logical_not(mask)
+
+        indices = dict(zip(data.dims, np.nonzero(mask)))
+        dist = np.sqrt(sum((data.coords[d].values[indices[d]] - around[d]) ** 2 for d in data.dims))
+
+    masked_coords = {d: data.coords[d].values[indices[d]] for d in data.dims}
+    masked_coords["data"] = data.values[tuple(indices[d] for d in data.dims)]
+    return masked_coords, masked_coords["data"], dist
 
-    # at this point, around is now a dictionary specifying a point to do the selection around
-    raveled = data.G.ravel()
-    data_arr = raveled["data"]
 
-    dim_order = list(around.keys())
-    dist = np.sqrt(
-        np.sum(np.stack([(raveled[d] - around[d]) ** 2 for d in dim_order], axis=1), axis=1)
+def _window_bounds(
+    coord: np.ndarray, centers: np.ndarray, radius: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Index ranges [low, high) of the coordinates within `radius` of each of `centers`.
+
+    Endpoints are inclusive, as for ``.sel`` with a slice. Decreasing coordinates are supported.
+    """
+    if len(coord) > 1 and coord[0] > coord[-1]:
+        low, high = _window_bounds(coord[::-1], centers, radius)
+        return len(coord) - high, len(coord) - low
+
+    return (
+        np.searchsorted(coord, centers - radius, side="left"),
+        np.searchsorted(coord, centers + radius, side="right"),
+    )
+
+
+def _nearest_index(coord: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    return np.argmin(np.abs(coord[np.newaxis, :] - centers[:, np.newaxis]), axis=1)
+
+
+def _rectangular_window_sums(
+    values: np.ndarray, slab: np.ndarray, lows: List[np.ndarray], highs: List[np.ndarray]
+) -> np.ndarray:
+    """Sums `values` over boxes using a summed-area table.
+
+    `values` has shape [n_slabs, *window_dims, *other_dims]. The box for point k lies in slab
+    `slab[k]` and spans [lows[i][k], highs[i][k]) along window dimension i.
+    """
+    n_window = len(lows)
+    table = np.zeros(
+        (values.shape[0],)
+        + tuple(n + 1 for n in values.shape[1 : n_window + 1])
+        + values.shape[n_window + 1 :]
     )
+    table[(slice(None),) + (slice(1, None),) * n_window] = values
+    for axis in range(1, n_window + 1):
+        np.cumsum(table, axis=axis, out=table)
+
+    result = np.zeros((len(slab),) + values.shape[n_window + 1 :])
+    for corner in itertools.product([False, True], repeat=n_window):
+        sign = (-1) ** (n_window - sum(corner))
+        indices = tuple(
+            high if take_high else low for take_high, low, high in zip(corner, lows, highs)
+        )
+        result += sign * table[(slab,) + indices]
+
+    return result
+
+
+def _elliptical_window_sums(
+    values: np.ndarray,
+    valid: Optional[np.ndarray],
+    slab: np.ndarray,
+    coords: List[np.ndarray],
+    centers: List[np.ndarray],
+    radii: List[Optional[float]],
+    lows: List[np.ndarray],
+    highs: List[np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sums `values` (and counts valid entries) over ellipsoids inscribed in each point's box.
+
+    Windows with a radius of `None` are a single index wide and do not contribute to the distance.
+    Points are processed in blocks to bound the size of the gathered windows.
+    """
+    n_window = len(lows)
+    other_shape = values.shape[n_window + 1 :]
+    widths = [max(int(np.max(high - low, initial=0)), 1) for low, high in zip(lows, highs)]
+    offsets = np.meshgrid(*[np.arange(w) for w in widths], indexing="ij")
+
+    per_point = int(np.prod(widths)) * max(int(np.prod(other_shape)), 1)
+    block = max(ELLIPTICAL_BLOCK_SIZE // per_point, 1)
+
+    sums = np.zeros((len(slab),) + other_shape)
+    counts = np.zeros((len(slab),) + other_shape)
+    for start in range(0, len(slab), block):
+        points = slice(start, start + block)
+        expand = (slice(None),) + (np.newaxis,) * n_window
+
+        inside = np.ones((len(slab[points]),) + tuple(widths), dtype=bool)
+        distance = np.zeros(inside.shape)
+        indices = []
+        for i in range(n_window):
+            index = lows[i][points][expand] + offsets[i]
+            inside &= index < highs[i][points][expand]
+            index = np.minimum(index, len(coords[i]) - 1)
+            indices.append(index)
+
+            if radii[i] is not None:
+                distance += ((coords[i][index] - centers[i][points][expand]) / radii[i]) ** 2
+
+        inside &= distance <= 1
+        inside = inside.reshape(inside.shape + (1,) * len(other_shape))
+        gathered = (slab[points][expand],) + tuple(indices)
+        window_axes = tuple(range(1, n_window + 1))
+
+        sums[points] = np.sum(np.where(inside, values[gathered], 0), axis=window_axes)
+        counts[points] = np.sum(
+            inside if valid is None else inside & valid[gathered], axis=window_axes
+        ) * np.ones(other_shape)
+
+    return sums, counts
+
+
+def select_around_points(
+    data: xr.DataArray,
+    points: Dict[str, np.ndarray],
+    radius: Dict[str, float],
+    along: Sequence[str] = (),
+    fast: bool = True,
+    mode: str = "sum",
+    nearest: Sequence[str] = (),
+) -> Tuple[np.ndarray, List[str]]:
+    """Reduces `data` in a window around each of many points at once.
+
+    This is the vectorized engine behind `S.select_around`, `S.select_around_data` and
+    `select_along_path`. Rather than selecting and reducing point by point, window bounds for
+    all points are computed at once. Rectangular windows (`fast=True`) are then evaluated from a
+    summed-area table of the data, so each window costs a constant number of lookups independent of
+    its size. Elliptical windows gather every point's bounding box at once and apply a mask. Only
+    the region of the data spanned by the windows is read, so a single small window is cheap.
+
+    As with ``.sum`` and ``.mean`` on DataArrays, NaN values are skipped.
+
+    Args:
+        data: The data to select from.
+        points: The window centers for each selected dimension, as arrays of equal length K.
+        radius: The half width of the window along each selected dimension not in `nearest`.
+        along: Dimensions of `data` which index the points, instead of being kept in the output.
+          In this case, the K points correspond to the raveled (C ordered) indices along these
+          dimensions, and each point only selects from its own slab of the data.
+        fast: Whether to use rectangular (True) or elliptical (False) windows.
+        mode: One of "sum" or "mean".
+        nearest: Selected dimensions along which only the nearest coordinate is taken.
+
+    Returns:
+        An array of shape [K, *other_dims] of the reduced windows, together with the names of the
+        other (neither selected nor `along`) dimensions in order.
+    """
+    if mode not in {"sum", "mean"}:
+        raise ValueError("mode parameter should be either sum or mean.")
+
+    window_dims = list(points.keys())
+    along = list(along)
+    other_dims = [d for d in data.dims if d not in window_dims and d not in along]
+
+    centers = [np.atleast_1d(np.asarray(points[d], dtype=np.float64)) for d in window_dims]
+    n_points = len(centers[0])
+    slab = np.arange(n_points) if along else np.zeros(n_points, dtype=int)
+
+    coords = [data.coords[d].values for d in window_dims]
+    lows, highs, radii = [], [], []
+    for d, coord, center in zip(window_dims, coords, centers):
+        if d in nearest:
+            low = _nearest_index(coord, center)
+            lows.append(low)
+            highs.append(low + 1)
+            radii.append(None)
+        else:
+            low, high = _window_bounds(coord, center, radius[d])
+            lows.append(low)
+            highs.append(np.maximum(high, low))
+            radii.append(radius[d])
+
+    # only the bounding box of the windows is read, so that a few small windows in a large
+    # array do not cost a pass over all of it
+    box = {}
+    for i, d in enumerate(window_dims):
+        start = min(int(np.min(lows[i])), len(coords[i]) - 1)
+        stop = max(int(np.max(highs[i])), start + 1)
+        box[d] = slice(start, stop)
+        lows[i], highs[i] = lows[i] - start, highs[i] - start
+        coords[i] = coords[i][start:stop]
+
+    arr = data.isel(box).transpose(*(along + window_dims + other_dims))
+    values = arr.values.reshape((-1,) + arr.shape[len(along) :])
+    assert not along or n_points == values.shape[0]
+
+    valid = None
+    if np.issubdtype(values.dtype, np.floating) and np.isnan(values).any():
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0)
+
+    if fast:
+        sums = _rectangular_window_sums(values, slab, lows, highs)
+        if valid is not None:
+            counts = _rectangular_window_sums(valid, slab, lows, highs)
+        else:
+            counts = np.prod([high - low for low, high in zip(lows, highs)], axis=0)
+            counts = counts.reshape(counts.shape + (1,) * len(other_dims))
+    else:
+        sums, counts = _elliptical_window_sums(
+            values, valid, slab, coords, centers, radii, lows, highs
+        )
+
+    if mode == "sum":
+        if np.issubdtype(data.dtype, np.floating):
+            sums = sums.astype(data.dtype, copy=False)
+        return sums, other_dims
 
-    masked_coords = {d: cs[mask] for d, cs in raveled.items()}
-    return masked_coords, masked_coords["data"], dist[mask]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sums / counts, other_dims
@@ -403,50 +403,65 @@ class ARPESAccessorBase:
         assert isinstance(radius, dict)
         radius = {d: radius.get(d, default_radii.get(d, unspecified)) for d in points.keys()}
 
-        along_dims = list(points.values())[0].dims
+        along_dims = list(list(points.values())[0].dims)
         selected_dims = list(points.keys())
+        along_coords = {d: self._obj.coords[d] for d in along_dims}
+        point_values = {
+            d: points[d].sel(**along_coords).transpose(*along_dims).values.ravel()
+            for d in selected_dims
+        }
 
-        stride = self._obj.G.stride(generic_dim_names=False)
-
-        new_dim_order = [d for d in self._obj.dims if d not in along_dims] + list(along_dims)
-
-        data_for = self._obj.transpose(*new_dim_order)
-        new_data = data_for.sum(selected_dims, keep_attrs=True)
-        for coord, value in data_for.G.iterate_axis(along_dims):
-            nearest_sel_params = {}
-            if safe:
-                for d, v in radius.items():
-                    if v < stride[d]:
-                        nearest_sel_params[d] = points[d].sel(**coord)
-
-                radius = {d: v for d, v in radius.items() if d not in nearest_sel_params}
+        values, other_dims = self._select_around_points(
+            point_values, radius, fast=fast, safe=safe, mode=mode, along=along_dims
+        )
+        along_shape = [len(self._obj.coords[d]) for d in along_dims]
+        values = values.reshape(along_shape + list(values.shape[1:]))
+        values = np.moveaxis(values, list(range(len(along_dims))), list(range(-len(along_dims), 0)))
 
-            if fast:
-                selection_slices = {
-                    d: slice(
-                        points[d].sel(**coord) - radius[d],
-                        points[d].sel(**coord) + radius[d],
-                    )
-                    for d in points.keys()
-                    if d in radius
-                }
-                selected = value.sel(**selection_slices)
-            else:
-                raise NotImplementedError
+        return xr.DataArray(
+            values,
+            coords=self._coords_without(selected_dims),
+            dims=other_dims + along_dims,
+            attrs=self._obj.attrs,
+        )
 
-            if nearest_sel_params:
-                selected = selected.sel(**nearest_sel_params, method="nearest")
+    def _coords_without(self, dims: List[str]) -> Dict[str, xr.DataArray]:
+        return {
+            k: v
+            for k, v in self._obj.coords.items()
+            if k not in dims and not set(v.dims).intersection(dims)
+        }
 
-            for d in nearest_sel_params:
-                # need to remove the extra dims from coords
-                del selected.coords[d]
+    def _select_around_points(
+        self,
+        points: Dict[str, np.ndarray],
+        radius: Dict[str, float],
+        fast: bool,
+        safe: bool,
+        mode: str,
+        along: List[str] = None,
+    ) -> Tuple[np.ndarray, List[str]]:
+        """Shared implementation of `select_around` and `select_around_data`.
+
+        Makes sure we take at least one pixel along each dimension when `safe` is set, and
+        otherwise defers to `arpes.utilities.selections.select_around_points`.
+        """
+        from arpes.utilities.selections import select_around_points
 
-            if mode == "sum":
-                new_data.loc[coord] = selected.sum(list(radius.keys())).values
-            elif mode == "mean":
-                new_data.loc[coord] = selected.mean(list(radius.keys())).values
+        nearest = []
+        if safe:
+            stride = self._obj.G.stride(generic_dim_names=False)
+            nearest = [d for d, v in radius.items() if v < stride[d]]
 
-        return new_data
+        return select_around_points(
+            self._obj,
+            points,
+            radius,
+            along=along or (),
+            fast=fast,
+            mode=mode,
+            nearest=nearest,
+        )
 
     def select_around(
         self,
@@ -468,6 +483,10 @@ class ARPESAccessorBase:
         If radii are not set, or provided through kwargs as 'eV_r' or 'phi_r' for instance,
         then we will try to use reasonable default values; buyer beware.
 
+        `point` can also be a Dataset of many points sharing a single dimension, such as
+        the output of `discretize_path`. In this case all the points are selected at once
+        and the result is stacked along that dimension.
+
         Args:
             point: The points where the selection should be performed.
             radius: The radius of the selection in each coordinate. If dimensions are omitted, a standard sized
@@ -496,7 +515,7 @@ class ARPESAccessorBase:
         ):
             warnings.warn("Dangerous iterable point argument to `select_around`")
             point = dict(zip(point, self._obj.dims))
-        if isinstance(point, xr.Dataset):
+        if isinstance(point, xr.Dataset) and not point[list(point.data_vars)[0]].dims:
             point = {k: point[k].item() for k in point.data_vars}
 
         default_radii = {
@@ -529,38 +548,26 @@ class ARPESAccessorBase:
         assert isinstance(radius, dict)
         radius = {d: radius.get(d, default_radii.get(d, unspecified)) for d in point.keys()}
 
-        # make sure we are taking at least one pixel along each
-        nearest_sel_params = {}
-        if safe:
-            stride = self._obj.G.stride(generic_dim_names=False)
-            for d, v in radius.items():
-                if v < stride[d]:
-                    nearest_sel_params[d] = point[d]
-
-            radius = {d: v for d, v in radius.items() if d not in nearest_sel_params}
-
-        if fast:
-            selection_slices = {
-                d: slice(point[d] - radius[d], point[d] + radius[d])
-                for d in point.keys()
-                if d in radius
-            }
-            selected = self._obj.sel(**selection_slices)
-        else:
-            # selected = self._obj
-            raise NotImplementedError
-
-        if nearest_sel_params:
-            selected = selected.sel(**nearest_sel_params, method="nearest")
-
-        for d in nearest_sel_params:
-            # need to remove the extra dims from coords
-            del selected.coords[d]
+        if isinstance(point, xr.Dataset) and point[list(point.data_vars)[0]].dims:
+            # a whole set of points sharing one dimension, as produced by `discretize_path`
+            index_dim = point[list(point.data_vars)[0]].dims[0]
+            values, other_dims = self._select_around_points(
+                {d: point[d].values for d in point.data_vars},
+                radius,
+                fast=fast,
+                safe=safe,
+                mode=mode,
+            )
+            coords = self._coords_without(list(point.data_vars))
+            coords[index_dim] = point.coords[index_dim]
+            return xr.DataArray(values, coords=coords, dims=[index_dim] + other_dims)
 
-        if mode == "sum":
-            return selected.sum(list(radius.keys()))
-        elif mode == "mean":
-            return selected.mean(list(radius.keys()))
+        values, other_dims = self._select_around_points(
+            {d: np.asarray([v]) for d, v in point.items()}, radius, fast=fast, safe=safe, mode=mode
+        )
+        return xr.DataArray(
+            values[0], coords=self._coords_without(list(point.keys())), dims=other_dims
+        )
 
     def short_history(self, key="by"):
         return [h["record"][key] if isinstance(h, dict) else h for h in self.history]
@@ -2094,6 +2101,15 @@ class GenericAccessorTools:
 
         return raveled_coordinates
 
+    def coordinate_index(self, names: Optional[List[str]] = None):
+        """A cached spatial index over the coordinates `names`, by default the dimensions.
+
+        See `arpes.utilities.selections.CoordinateIndex` for the supported queries.
+        """
+        from arpes.utilities.selections import coordinate_index
+
+        return coordinate_index(self._obj, names)
+
     def meshgrid(self, as_dataset=False):
         assert isinstance(self._obj, xr.DataArray)
 
@@ -2351,21 +2367,23 @@ class GenericAccessorTools:
         return result
 
     def shift_by(self, other: xr.DataArray, shift_axis=None, zero_nans=True, shift_coords=False):
-        # for now we only support shifting by a one dimensional array
+        """Shifts the data along `shift_axis` by the (coordinate valued) amounts in `other`.
 
-        data = self._obj.copy(deep=True)
+        `other` may depend on one or several of the other dimensions of the data, in which case
+        every slice along `shift_axis` is shifted by the corresponding value of `other`.
+        """
+        data = self._obj
 
-        by_axis = other.dims[0]
-        assert len(other.dims) == 1
-        assert len(other.coords[by_axis]) == len(data.coords[by_axis])
+        by_axes = list(other.dims)
+        for by_axis in by_axes:
+            assert len(other.coords[by_axis]) == len(data.coords[by_axis])
 
         if shift_coords:
             mean_shift = np.mean(other.values)
-            other -= mean_shift
+            other = other - mean_shift
 
         if shift_axis is None:
-            option_dims = list(data.dims)
-            option_dims.remove(by_axis)
+            option_dims = [d for d in data.dims if d not in by_axes]
             assert len(option_dims) == 1
             shift_axis = option_dims[0]
 
@@ -2375,7 +2393,7 @@ class GenericAccessorTools:
             data.values,
             shift_amount,
             axis=list(data.dims).index(shift_axis),
-            by_axis=list(data.dims).index(by_axis),
+            by_axis=tuple(list(data.dims).index(d) for d in by_axes),
             order=1,
         )
 
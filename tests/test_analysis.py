@@ -0,0 +1,266 @@
+import numpy as np
+import pytest
+import scipy.ndimage
+import xarray as xr
+
+
+def _xps_map():
+    eV = np.linspace(-10, 0, 200)
+    x = np.arange(6)
+    rng = np.random.default_rng(0)
+
+    # a peak on a step, with a different step height and peak position in each spectrum
+    centers = -5 + 0.3 * x[:, None]
+    steps = 1 + 0.2 * x[:, None]
+    values = (
+        np.exp(-((eV - centers) ** 2)) * 10
+        + steps / (1 + np.exp((eV - centers) / 0.5))
+        + 0.2
+        + 0.01 * rng.random((len(x), len(eV)))
+    )
+    return xr.DataArray(values, coords={"x": x, "eV": eV}, dims=["x", "eV"])
+
+
+def test_shirley_background_of_stack_matches_single_spectra():
+    from arpes.analysis.shirley import calculate_shirley_background
+
+    data = _xps_map()
+    energy_range = slice(-8, -1)
+
+    background = calculate_shirley_background(data.transpose("eV", "x"), energy_range)
+    assert background.dims == ("eV", "x")
+
+    for x in data.coords["x"].values:
+        single = calculate_shirley_background(data.sel(x=x), energy_range)
+        np.testing.assert_allclose(background.sel(x=x).values, single.values, rtol=1e-10)
+
+
+def test_shirley_background_with_energy_last():
+    from arpes.analysis.shirley import calculate_shirley_background
+
+    # (x, eV) ordered input used to fail when extending the background outside the range
+    data = _xps_map()
+    background = calculate_shirley_background(data, slice(-8, -1))
+
+    assert background.dims == data.dims
+    expected = calculate_shirley_background(data.transpose("eV", "x"), slice(-8, -1))
+    np.testing.assert_allclose(background.values, expected.transpose("x", "eV").values)
+
+    # constant outside of the energy range
+    outside = background.sel(eV=slice(-10, -8.05)).values
+    np.testing.assert_allclose(outside, outside[:, -1:].repeat(outside.shape[1], axis=1))
+
+
+@pytest.mark.parametrize("mode", ["reflect", "mirror", "nearest", "wrap", "constant"])
+@pytest.mark.parametrize("kernel_shape", [(5, 1), (1, 4), (3, 6), (6, 6)])
+def test_fft_convolution_matches_ndimage(mode, kernel_shape):
+    from arpes.analysis.deconvolution import _fft_convolve
+
+    rng = np.random.default_rng(0)
+    arr = rng.random((30, 25))
+    kernel = rng.random(kernel_shape)
+
+    np.testing.assert_allclose(
+        _fft_convolve(arr, kernel, mode),
+        scipy.ndimage.convolve(arr, kernel, mode=mode),
+        atol=1e-12,
+    )
+
+
+def test_kinetic_energy_rebinning_conserves_counts():
+    from arpes.preparation.tof_preparation import build_kinetic_energy_rebinning
+
+    conversion = 4.0
+    timing = np.linspace(1, 2, 20)
+    counts = np.random.default_rng(0).integers(0, 100, len(timing)).astype(float)
+
+    # the energy bins cover all of the flight times, from c / 2.03^2 to c / 0.97^2
+    energy = np.linspace(0.9, 4.3, 60)
+    rebinned = build_kinetic_energy_rebinning(timing, energy, conversion) @ counts
+    assert rebinned.sum() == pytest.approx(counts.sum())
+
+    # histogram counts spread uniformly over each timing bin
+    dt = timing[1] - timing[0]
+    n_samples = 10000
+    offsets = (np.arange(n_samples) + 0.5) / n_samples - 0.5
+    times = (timing[:, None] + dt * offsets).ravel()
+    dE = energy[1] - energy[0]
+    histogram, _ = np.histogram(
+        conversion / times ** 2,
+        bins=np.append(energy - dE / 2, energy[-1] + dE / 2),
+        weights=np.repeat(counts / n_samples, n_samples),
+    )
+    np.testing.assert_allclose(rebinned, histogram, atol=0.05)
+
+
+def test_online_statistics_match_numpy():
+    from arpes.bootstrap import OnlineStatistics
+
+    samples = np.random.default_rng(0).normal(3, 2, size=(1000, 4, 5))
+    statistics = OnlineStatistics()
+    for start in range(0, len(samples), 137):
+        statistics.update(samples[start : start + 137])
+
+    assert statistics.count == len(samples)
+    np.testing.assert_allclose(statistics.mean, samples.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(statistics.variance(ddof=1), samples.var(axis=0, ddof=1), rtol=1e-10)
+
+
+def test_streaming_quantiles_approximate_numpy():
+    from arpes.bootstrap import StreamingQuantile
+
+    samples = np.random.default_rng(0).normal(0, 1, size=(5000, 3))
+    for q in (0.05, 0.5, 0.95):
+        estimator = StreamingQuantile(q)
+        estimator.update(samples)
+
+        # P-squared estimates are approximate, within a few percent of the spread here
+        np.testing.assert_allclose(estimator.value, np.quantile(samples, q, axis=0), atol=0.05)
+
+
+def _total_counts(data):
+    return data.sum()
+
+
+def test_seeded_bootstrap_is_reproducible():
+    from arpes.bootstrap import bootstrap
+
+    data = xr.DataArray(np.arange(1.0, 13.0).reshape(3, 4) * 10, dims=["x", "y"], name="counts")
+    serial = bootstrap(_total_counts, streaming=True, quantiles=[0.5])
+    parallel = bootstrap(_total_counts, streaming=True, quantiles=[0.5], parallelize=True)
+
+    first = parallel(data, N=30, seed=1)
+    xr.testing.assert_identical(first, parallel(data, N=30, seed=1))
+    assert not first.equals(parallel(data, N=30, seed=2))
+
+    # batches draw from their own streams, so the result does not depend on where they are run
+    xr.testing.assert_identical(first, serial(data, N=30, seed=1))
+
+
+@pytest.mark.parametrize("sigma,tolerance", [(1, 0.06), (3, 0.015), (10, 0.005)])
+def test_recursive_gaussian_approximates_direct(sigma, tolerance):
+    from arpes.analysis.filters import gaussian_filter_values
+
+    values = np.random.default_rng(0).random((3, 400))
+    recursive = gaussian_filter_values(values, (0, sigma), method="recursive")
+    direct = gaussian_filter_values(values, (0, sigma), method="direct")
+
+    # the recursive filter is approximate, least so for narrow kernels, see arpes.analysis.filters
+    interior = slice(int(8 * sigma), -int(8 * sigma))
+    np.testing.assert_allclose(recursive[:, interior], direct[:, interior], atol=tolerance)
+
+    with pytest.raises(ValueError):
+        gaussian_filter_values(values, (0, 0.3), method="recursive")
+
+
+@pytest.mark.parametrize("solver", ["auto", "randomized"])
+def test_pca_along_in_batches(solver):
+    from arpes.analysis.decomposition import pca_along
+
+    rng = np.random.default_rng(0)
+    weights = rng.random((20 * 15, 3)) * [10, 3, 1]
+    values = weights @ rng.random((3, 12 * 10)) + 0.01 * rng.random((20 * 15, 12 * 10))
+    data = xr.DataArray(
+        values.reshape(20, 15, 12, 10),
+        coords={"x": np.arange(20), "y": np.arange(15), "eV": np.arange(12), "phi": np.arange(10)},
+        dims=["x", "y", "eV", "phi"],
+    )
+
+    expected, _ = pca_along(data.stack(spectral=["eV", "phi"]), ["x", "y"], n_components=3)
+    transformed, _ = pca_along(data, ["x", "y"], n_components=3, batch_size=37, svd_solver=solver)
+
+    assert transformed.dims == ("components", "x", "y")
+    np.testing.assert_allclose(np.abs(transformed.values), np.abs(expected.values), atol=1e-8)
+
+
+def _richardson_lucy_reference(values, kernel, n_iterations):
+    estimate = values
+    for _ in range(n_iterations):
+        ratio = values / scipy.ndimage.convolve(estimate, kernel, mode="reflect")
+        estimate = estimate * scipy.ndimage.convolve(ratio, np.flip(kernel), mode="reflect")
+
+    return estimate
+
+
+@pytest.mark.parametrize("separable", [False, True])
+@pytest.mark.parametrize("method", ["direct", "fft"])
+@pytest.mark.parametrize("parallelize", [False, True])
+def test_deconvolve_rl_matches_serial_reference(separable, method, parallelize, monkeypatch):
+    from arpes.analysis import deconvolution
+    from arpes.analysis.deconvolution import deconvolve_rl, make_psf, make_psf1d
+
+    # split the data into several blocks even on machines with a single core
+    monkeypatch.setattr(deconvolution.os, "cpu_count", lambda: 3)
+
+    values = np.random.default_rng(0).random((5, 21, 15)) + 0.5
+    data = xr.DataArray(
+        values,
+        coords={"x": np.arange(5), "eV": np.linspace(-1, 0, 21), "phi": np.linspace(-0.2, 0.2, 15)},
+        dims=["x", "eV", "phi"],
+    )
+
+    sigmas = {"eV": 0.08, "phi": 0.04}
+    psf_eV, psf_phi = make_psf1d(data, "eV", sigmas["eV"]), make_psf1d(data, "phi", sigmas["phi"])
+    kernel = np.outer(psf_eV.values, psf_phi.values)[None]
+    psf = {"eV": psf_eV, "phi": psf_phi} if separable else make_psf(data, sigmas)
+
+    result = deconvolve_rl(
+        data, psf, n_iterations=5, progress=False, method=method, parallelize=parallelize
+    )
+    assert result.dims == data.dims
+    np.testing.assert_allclose(
+        result.values, _richardson_lucy_reference(values, kernel, 5), rtol=1e-8
+    )
+
+
+def _nonnegative_map():
+    rng = np.random.default_rng(0)
+    weights = rng.random((20 * 15, 3))
+    values = weights @ rng.random((3, 12 * 10)) + 0.01 * rng.random((20 * 15, 12 * 10))
+    return xr.DataArray(
+        values.reshape(20, 15, 12, 10),
+        coords={"x": np.arange(20), "y": np.arange(15), "eV": np.arange(12), "phi": np.arange(10)},
+        dims=["x", "y", "eV", "phi"],
+    )
+
+
+@pytest.mark.parametrize(
+    "name,streaming_name",
+    [("NMF", "MiniBatchNMF"), ("DictionaryLearning", "MiniBatchDictionaryLearning")],
+)
+def test_decomposition_in_batches_uses_streaming_equivalent(name, streaming_name):
+    import sklearn.decomposition
+
+    from arpes.analysis.decomposition import decomposition_along
+
+    if not hasattr(sklearn.decomposition, streaming_name):
+        pytest.skip(f"{streaming_name} is not available in this version of scikit-learn")
+
+    data = _nonnegative_map()
+    transformed, decomp = decomposition_along(
+        data,
+        ["x", "y"],
+        getattr(sklearn.decomposition, name),
+        batch_size=64,
+        n_components=3,
+        random_state=0,
+    )
+
+    assert type(decomp).__name__ == streaming_name
+    assert transformed.dims == ("components", "x", "y")
+    assert transformed.shape == (3, 20, 15)
+
+    # three components describe the data, approximately after a single pass of mini-batch NMF
+    stacked = data.values.reshape(20 * 15, -1)
+    reconstructed = transformed.values.reshape(3, -1).T @ decomp.components_
+    assert np.abs(reconstructed - stacked).mean() < 0.15 * stacked.mean()
+
+
+def test_nmf_in_batches_without_streaming_equivalent(monkeypatch):
+    import sklearn.decomposition
+
+    from arpes.analysis.decomposition import nmf_along
+
+    monkeypatch.delattr(sklearn.decomposition, "MiniBatchNMF", raising=False)
+    with pytest.raises(ImportError, match="MiniBatchNMF"):
+        nmf_along(_nonnegative_map(), ["x", "y"], n_components=3, batch_size=64)
@@ -15,3 +15,33 @@ def test_broadcast_fitting():
     fit_results = broadcast_model([AffineBroadenedFD], near_ef, "phi")
 
     assert np.abs(fit_results.F.p("a_fd_center").values.mean() + 0.00287) < 1e-4
+
+
+def test_batched_fermi_edge_calibration(tmp_path):
+    import xarray as xr
+    from scipy.special import erfc
+    from arpes.corrections import FermiEdgeCalibration, correction_from_reference_set, reference_key
+
+    rng = np.random.default_rng(0)
+    phi, eV = np.linspace(-0.25, 0.25, 60), np.linspace(-0.3, 0.1, 200)
+    edge = 0.02 + 0.3 * phi ** 2
+    counts = 1000 * 0.5 * erfc(1.66511 * (eV[None] - edge[:, None]) / 0.015) + 50
+    reference = xr.DataArray(
+        rng.poisson(counts).astype(float),
+        coords={"phi": phi, "eV": eV},
+        dims=["phi", "eV"],
+        attrs={"hv": 21.2},
+    )
+
+    calibration = FermiEdgeCalibration(tmp_path, kind="quadratic")
+    calibration.fit([reference])
+    coefficients = calibration.correction_for(reference).values
+    np.testing.assert_allclose(coefficients, [0.3, 0, 0.02], atol=3e-3)
+
+    # corrections are persisted, and are resolved by the reference settings of a scan
+    scan = reference.copy(data=counts)
+    correction = FermiEdgeCalibration(tmp_path, kind="quadratic").correction_for(scan)
+    assert np.abs(correction.edge(phi) - edge).max() < 1e-3
+    assert FermiEdgeCalibration(tmp_path, kind="direct").correction_for(scan) is None
+
+    assert correction_from_reference_set(scan, {reference_key(reference): correction}) is correction
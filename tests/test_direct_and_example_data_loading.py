@@ -35,3 +35,19 @@ def test_load_example_data(sandbox_configuration):
 
     assert isinstance(data, xr.Dataset)
     assert data.spectrum.shape == (240, 240)
+
+
+def test_load_data_with_rebinning(sandbox_configuration):
+    from arpes.analysis.general import rebin
+
+    test_data_location = (
+        Path(__file__).parent / "resources" / "datasets" / "basic" / "main_chamber_cut_0.fits"
+    )
+
+    data = load_data(file=test_data_location, location="ALG-MC")
+    rebinned = load_data(file=test_data_location, location="ALG-MC", rebin={"eV": 2, "phi": 3})
+
+    assert dict(rebinned.spectrum.sizes) == {"eV": 120, "phi": 80}
+    np.testing.assert_allclose(
+        rebinned.spectrum.values, rebin(data.spectrum, reduction={"eV": 2, "phi": 3}).values
+    )
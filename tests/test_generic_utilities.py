@@ -1,6 +1,11 @@
+import numpy as np
 import pytest
+import scipy.ndimage
+import xarray as xr
 
 from arpes.utilities import deep_equals, deep_update
+from arpes.utilities.math import shift_by
+from arpes.utilities.selections import coordinate_index, select_disk_mask
 
 
 @pytest.mark.parametrize(
@@ -30,3 +35,286 @@ def test_deep_equals(destination, source, expected_equal):
 )
 def test_deep_update(destination, source, expected):
     assert deep_equals(deep_update(destination, source), expected)
+
+
+@pytest.mark.parametrize("order", [1, 3])
+@pytest.mark.parametrize("axis,by_axis", [(0, 1), (2, 1), (1, 0)])
+def test_shift_by_matches_per_slice_shift(order, axis, by_axis):
+    rng = np.random.default_rng(0)
+    arr = rng.random((12, 9, 7))
+    shifts = rng.uniform(-3, 3, arr.shape[by_axis])
+
+    shifted = shift_by(arr, shifts, axis=axis, by_axis=by_axis, order=order)
+
+    for i, shift in enumerate(shifts):
+        slc = np.take(arr, i, axis=by_axis)
+        slice_axis = axis if axis < by_axis else axis - 1
+        shift_amount = [shift if d == slice_axis else 0 for d in range(slc.ndim)]
+        expected = scipy.ndimage.shift(slc, shift_amount, order=order)
+        np.testing.assert_allclose(np.take(shifted, i, axis=by_axis), expected, atol=1e-12)
+
+
+def test_shift_by_along_several_axes():
+    rng = np.random.default_rng(0)
+    arr = rng.random((12, 9, 7))
+    shifts = rng.uniform(-3, 3, (7, 9))
+
+    shifted = shift_by(arr, shifts, axis=0, by_axis=(2, 1), order=1)
+
+    for j in range(9):
+        for k in range(7):
+            expected = scipy.ndimage.shift(arr[:, j, k], shifts[k, j], order=1)
+            np.testing.assert_allclose(shifted[:, j, k], expected, atol=1e-12)
+
+
+def test_coordinate_index():
+    data = xr.DataArray(
+        np.zeros((30, 20)),
+        coords={"eV": np.linspace(-1, 0, 30), "kp": np.linspace(0.5, -0.5, 20)},
+        dims=["eV", "kp"],
+    )
+    eV, kp = np.meshgrid(data.eV.values, data.kp.values, indexing="ij")
+    distances = np.sqrt((eV + 0.4) ** 2 + (kp - 0.1) ** 2)
+    around = {"eV": -0.4, "kp": 0.1}
+
+    np.testing.assert_array_equal(select_disk_mask(data, 0.2, around=around), distances <= 0.2)
+
+    # irregular coordinates go through a KD-tree instead
+    irregular = data.assign_coords(x=(("eV", "kp"), eV), y=(("eV", "kp"), kp))
+    for index in [coordinate_index(data), coordinate_index(irregular, ["x", "y"])]:
+        point = dict(zip(index.names, around.values()))
+        assert index is coordinate_index(data if index.is_grid else irregular, index.names)
+
+        np.testing.assert_array_equal(
+            index.mask(point, 0.1, outer_radius=0.2), (distances > 0.1) & (distances <= 0.2)
+        )
+
+        _, nearest = index.query_nearest(point, k=5)
+        np.testing.assert_allclose(nearest, np.sort(distances.ravel())[:5])
+
+
+def test_polys_to_mask():
+    from matplotlib.path import Path
+
+    from arpes.analysis.mask import apply_mask, polys_to_mask
+
+    coords = {"kx": np.arange(20.0), "ky": np.arange(15.0)}
+    poly = [[2, 3], [17, 1], [12, 9], [4, 14], [9, 6]]
+    mask_dict = {"dims": ["kx", "ky"], "polys": [poly]}
+
+    kx, ky = np.meshgrid(coords["kx"], coords["ky"], indexing="ij")
+    expected = Path(poly).contains_points(np.stack([kx.ravel(), ky.ravel()], axis=-1))
+    mask = polys_to_mask(mask_dict, coords, (20, 15))
+    np.testing.assert_array_equal(mask, expected.reshape(20, 15))
+
+    # masks broadcast along extra dimensions in any position
+    data = xr.DataArray(
+        np.ones((20, 4, 15)), coords={**coords, "eV": np.arange(4.0)}, dims=["kx", "eV", "ky"]
+    )
+    masked = apply_mask(data, mask_dict)
+    np.testing.assert_array_equal(np.isnan(masked.values), np.repeat(mask[:, None, :], 4, axis=1))
+
+
+def test_rebin():
+    from arpes.analysis.general import rebin
+
+    data = xr.DataArray(
+        np.random.default_rng(0).random((41, 30)),
+        coords={"eV": np.linspace(-1, 0, 41), "phi": np.linspace(-0.2, 0.2, 30)},
+        dims=["eV", "phi"],
+    )
+
+    rebinned = rebin(data, reduction={"eV": 4, "phi": 3})
+    np.testing.assert_allclose(
+        rebinned.values, data.values[:40].reshape(10, 4, 10, 3).mean(axis=(1, 3))
+    )
+    np.testing.assert_allclose(rebinned.coords["eV"].values, data.coords["eV"].values[:40:4])
+
+    # fractional bins split pixels between neighbors, conserving flux
+    rebinned = rebin(data, reduction={"phi": 2.5})
+    assert rebinned.shape == (41, 12)
+    np.testing.assert_allclose(rebinned.values.sum(axis=1) * 2.5, data.values.sum(axis=1))
+
+
+def test_align_stack():
+    from arpes.analysis.align import align1d, align_stack
+
+    x, y = np.arange(100.0), np.arange(80.0)
+    shifts = np.linspace(0, 6, 25)
+    frames = np.exp(
+        -((x[None, :, None] - 40 - shifts[:, None, None]) ** 2) / 20
+        - (y[None, None, :] - 40 + shifts[:, None, None] / 2) ** 2 / 30
+    )
+    stack = xr.DataArray(
+        frames, coords={"T": np.arange(25), "x": x * 0.1, "y": y}, dims=["T", "x", "y"]
+    )
+
+    # offsets are unitful, compare in pixels
+    expected = np.stack([-shifts, shifts / 2], axis=-1)
+    for reference in [0, None]:
+        offsets = align_stack(stack, "T", reference=reference)
+        assert list(offsets.coords["dim"].values) == ["x", "y"]
+        np.testing.assert_allclose(offsets.values / [0.1, 1], expected, atol=0.1)
+
+    cut = stack.isel(T=0, y=40)
+    assert align1d(cut, cut.shift(x=3, fill_value=0), subpixel=False) == pytest.approx(-0.3)
+
+
+def test_align_stack_of_fermi_edges():
+    from arpes.analysis.align import align_stack
+
+    # Fermi edges with a band below them, which do not vanish at the boundaries of the frames
+    shifts = np.array([0, 1.98, 2.48, 3.97])
+    eV, k = np.arange(120) * 0.005 - 0.45, np.linspace(-1, 1, 60)
+    energy = eV[None, :, None] - shifts[:, None, None] * 0.005
+    band = 1 + 0.5 * np.exp(-((energy + 0.3 - 0.2 * k ** 2) ** 2) / 0.002)
+    frames = band * (1 + 0.3 * k) / (1 + np.exp(energy / 0.01)) + 0.05
+    stack = xr.DataArray(
+        frames, coords={"T": np.arange(4), "eV": eV, "k": k}, dims=["T", "eV", "k"]
+    )
+
+    noisy = stack + 0.02 * np.random.default_rng(0).standard_normal(stack.shape)
+    for reference in [0, None]:
+        offsets = align_stack(noisy, "T", reference=reference).sel(dim="eV").values / 0.005
+        np.testing.assert_allclose(offsets, -shifts, atol=0.05)
+
+    offsets = align_stack(stack, "T", subpixel=False).sel(dim="eV").values / 0.005
+    np.testing.assert_allclose(offsets, -np.round(shifts))
+
+    # apodization biases phase correlations somewhat
+    offsets = align_stack(stack, "T", method="phase").sel(dim="eV").values / 0.005
+    np.testing.assert_allclose(offsets, -shifts, atol=0.25)
+
+
+def test_symmetrize_with_per_trace_shifts():
+    from arpes.analysis.gap import shift_energy, symmetrize
+
+    energy = np.linspace(-0.3, 0.1, 401) + 0.00037
+    mu = xr.DataArray(np.linspace(-0.01, 0.01, 5), coords={"T": np.arange(5.0)}, dims=["T"])
+    edcs = np.exp(-((energy[None, :, None] - mu.values[:, None, None]) ** 2) / 0.002)
+    data = xr.DataArray(
+        edcs * np.ones((1, 1, 3)),
+        coords={"T": mu.coords["T"].values, "eV": energy, "phi": np.arange(3.0)},
+        dims=["T", "eV", "phi"],
+    )
+
+    shifted = shift_energy(data, -mu).sel(eV=slice(-0.2, 0.05))
+    expected = np.exp(-shifted.eV.values ** 2 / 0.002)[None, :, None]
+    np.testing.assert_allclose(shifted.values, np.broadcast_to(expected, shifted.shape), atol=1e-3)
+
+    symmetrized = symmetrize(data, subpixel=True, shift=-mu)
+    assert symmetrized.dims[0] == "eV"
+    assert symmetrized.eV.values[-1] == 0
+    near_edge = symmetrized.sel(eV=slice(-0.08, None))
+    expected = 2 * np.exp(-near_edge.eV.values ** 2 / 0.002)[:, None, None]
+    np.testing.assert_allclose(
+        near_edge.values, np.broadcast_to(expected, near_edge.shape), atol=1e-3
+    )
+
+
+def test_cached_binned_marginals():
+    from arpes.utilities.marginals import MarginalCache
+
+    rng = np.random.default_rng(0)
+    shape = (12, 10, 8, 6)
+    data = xr.DataArray(
+        rng.random(shape),
+        coords={d: np.arange(n) for d, n in zip("abcd", shape)},
+        dims=list("abcd"),
+    )
+    data[3, 4, 5, 2] = np.nan
+
+    cache = MarginalCache(data)
+    for windows in [
+        {"b": slice(3, 9), "d": slice(2, 5)},
+        {"a": slice(0, 12), "b": slice(7, 8)},
+        {"c": slice(4, 5)},
+        {"a": slice(1, 4), "b": slice(2, 6), "c": slice(3, 8)},
+    ]:
+        marginal = cache.marginal(windows)
+        expected = data.isel(windows).mean(list(windows))
+        assert marginal.dims == expected.dims
+        np.testing.assert_allclose(marginal.values, expected.values)
+
+    # prefix sums are evicted to stay within the memory limit, 8 bytes for the sum of each entry
+    # and 4 for the count of finite values, as the data has NaNs
+    small = MarginalCache(data, max_bytes=12 * 12 * 11 * 8 * 6)
+    small.marginal({"a": slice(0, 4)})
+    small.marginal({"b": slice(0, 4)})
+    assert list(small._prefix_sums) == [("b",)]
+
+    # marginals drawn together which do not fit are computed directly instead of thrashing
+    kept = small._prefix_sums[("b",)]
+    for _ in range(3):
+        for windows in [{"a": slice(0, 4)}, {"b": slice(2, 7)}]:
+            expected = data.isel(windows).mean(list(windows))
+            np.testing.assert_allclose(small.marginal(windows).values, expected.values)
+    assert list(small._prefix_sums) == [("b",)]
+    assert small._prefix_sums[("b",)] is kept
+
+    # single precision data is summed in single precision
+    single = MarginalCache(data.astype(np.float32))
+    windows = {"a": slice(1, 4), "b": slice(2, 6)}
+    marginal = single.marginal(windows)
+    assert single._prefix_sums[("a", "b")][0].dtype == np.float32
+    expected = data.isel(windows).mean(list(windows))
+    np.testing.assert_allclose(marginal.values, expected.values, rtol=1e-5)
+
+
+def test_background_jobs():
+    import threading
+
+    from arpes.utilities.background import BackgroundJobs
+
+    jobs = BackgroundJobs()
+    results = []
+    release = threading.Event()
+
+    # a running job is replaced after its current stage, and queued jobs are skipped
+    first = jobs.submit("view", [release.wait, lambda: "first"], lambda r, final: results.append(r))
+    second = jobs.submit("view", [lambda: "never"], lambda r, final: results.append(r))
+    third = jobs.submit(
+        "view",
+        [lambda: "coarse", lambda: "fine"],
+        lambda r, final: results.append((r, final)),
+        key="third",
+    )
+    release.set()
+    for job in (first, second, third):
+        assert job.done.wait(5)
+
+    assert results == [("coarse", False), ("fine", True)]
+
+    # final results are cached by key
+    cached = jobs.submit("view", [lambda: 1 / 0], lambda r, final: results.append(r), key="third")
+    assert cached.done.is_set() and results[-1] == "fine"
+
+    errors = []
+    jobs.submit("view", [lambda: 1 / 0], None, on_error=errors.append).done.wait(5)
+    assert isinstance(errors[0], ZeroDivisionError)
+
+    # a cleared cache computes the result again
+    jobs.clear_cache()
+    again = jobs.submit("view", [lambda: "again"], lambda r, final: results.append(r), key="third")
+    assert again.done.wait(5) and results[-1] == "again"
+    jobs.shutdown()
+
+
+def test_warmup_compiles_single_precision_kernels():
+    from arpes.utilities.jit import registered_kernels, warmup
+
+    timings = warmup(dtypes=(np.float32,))
+
+    dtype_independent = set()
+    for name, registered in registered_kernels().items():
+        if registered.examples is None:
+            continue
+
+        if not registered.examples(np.dtype(np.float32)):
+            dtype_independent.add(name)
+            continue
+
+        assert f"{name}[float32]" in timings
+        assert any("float32" in str(signature) for signature in registered.dispatcher.signatures)
+
+    assert dtype_independent == {"arpes.analysis.mask._rasterize_polygons"}
@@ -1,12 +1,29 @@
 import numpy as np
 import pytest
+import xarray as xr
 from numpy.testing import assert_array_almost_equal
 
 from arpes.fits.fit_models import AffineBroadenedFD, QuadraticModel
 from arpes.fits.utilities import broadcast_model
 from arpes.io import example_data
-from arpes.utilities.conversion import convert_to_kspace
-from arpes.utilities.conversion.forward import convert_through_angular_point
+from arpes.corrections import apply_direct_fermi_edge_correction
+from arpes.utilities.conversion import (
+    ConversionPipeline,
+    FermiEdgeShift,
+    apply_trapezoidal_correction,
+    convert_to_kspace,
+    plan_kspace_conversion,
+    trapezoidal_calibration,
+)
+from arpes.utilities.conversion.bounds_calculations import (
+    calculate_kx_ky_bounds,
+    euler_to_kx,
+    euler_to_kz,
+)
+from arpes.utilities.conversion.forward import (
+    convert_coordinates_to_kspace_forward,
+    convert_through_angular_point,
+)
 
 
 def load_energy_corrected():
@@ -18,6 +35,130 @@ def load_energy_corrected():
     return fmap.G.shift_by(edge, "eV")
 
 
+def test_forward_conversion_of_cut():
+    cut = example_data.cut.spectrum
+    forward = convert_coordinates_to_kspace_forward(cut)
+    assert set(forward.data_vars) == {"kp", "kz"}
+    assert forward.kp.dims == ("phi", "eV")
+
+    kinetic_energy = cut.eV.values[None, :] + cut.S.hv - cut.S.work_function
+    phi = (cut.phi.values - cut.S.phi_offset)[:, None]
+    beta = cut.S.lookup_offset_coord("beta")
+    # kp is signed smoothly through zero
+    assert_array_almost_equal(forward.kp.values, euler_to_kx(kinetic_energy, phi, beta), decimal=4)
+    assert_array_almost_equal(
+        forward.kz.values,
+        euler_to_kz(kinetic_energy, phi, beta, inner_potential=cut.S.inner_potential),
+    )
+
+
+def test_analytic_momentum_bounds():
+    """Validates the analytic bounds against the momenta of every sample, with sample rotation."""
+    cut = example_data.cut.spectrum.isel(eV=slice(None, None, 20))
+    data = cut.expand_dims({"beta": np.linspace(-0.15, 0.2, 15)}).copy()
+    data.coords["chi"] = 0.4
+
+    (kx_low, kx_high), (ky_low, ky_high) = calculate_kx_ky_bounds(data)
+
+    k_tot = 0.5123167 * np.sqrt(data.eV.values + data.S.hv - data.S.work_function)
+    phi = data.phi.values - data.S.phi_offset
+    beta = data.beta.values - data.S.beta_offset
+    chi = data.S.lookup_offset_coord("chi")
+    k_tot, phi, beta = np.meshgrid(k_tot, phi, beta, indexing="ij")
+    rkx, rky = k_tot * np.sin(phi), -k_tot * np.cos(phi) * np.sin(beta)
+    kx, ky = rkx * np.cos(chi) + rky * np.sin(chi), rky * np.cos(chi) - rkx * np.sin(chi)
+
+    assert_array_almost_equal(
+        [kx_low, kx_high, ky_low, ky_high], [kx.min(), kx.max(), ky.min(), ky.max()], decimal=4
+    )
+
+
+def test_conversion_plan():
+    """Validates that the inferred grid matches the sampling of the data."""
+    cut = example_data.cut.spectrum
+    plan = plan_kspace_conversion(cut)
+    assert plan.dims == ["eV", "kp"]
+    assert plan.shape == convert_to_kspace(cut).shape
+    assert plan.growth < 1.5
+
+    with pytest.warns(UserWarning, match="Momentum conversion"):
+        convert_to_kspace(cut, resolution={"kp": 0.0001})
+
+
+def test_photon_energy_map_conversion():
+    """Validates that an hv scan of a kx-ky map agrees with a kx-ky map at fixed photon energy."""
+    cut = example_data.cut.spectrum.isel(eV=slice(100, None, 40), phi=slice(None, None, 4))
+    data = cut.expand_dims({"hv": np.linspace(30, 60, 16), "beta": np.linspace(-0.15, 0.2, 24)})
+    data = (data * (1 + 0.5 * np.sin(30 * data.beta))).assign_attrs(cut.attrs)
+    del data.attrs["hv"]
+
+    kdata = convert_to_kspace(data, resolution={"kx": 0.02, "ky": 0.02, "kz": 0.01})
+    assert kdata.dims == ("eV", "kx", "ky", "kz")
+
+    fixed_hv = data.sel(hv=40).drop_vars("hv").assign_attrs(hv=40.0)
+    expected = convert_to_kspace(fixed_hv, kx=kdata.kx.values, ky=kdata.ky.values)
+
+    kinetic_energy = 40 + data.eV.values[:, None, None] - data.S.work_function
+    kz = np.sqrt(
+        (kinetic_energy + data.S.inner_potential) / 3.814697265625
+        - kdata.kx.values[None, :, None] ** 2
+        - kdata.ky.values[None, None, :] ** 2
+    )
+    converted = kdata.interp(kz=xr.DataArray(kz, dims=["eV", "kx", "ky"]))
+
+    valid = expected.notnull() & converted.notnull()
+    assert valid.mean() > 0.5
+    np.testing.assert_allclose(
+        converted.where(valid).fillna(0).values,
+        expected.where(valid).fillna(0).values,
+        atol=1e-3 * float(expected.max()),
+    )
+
+
+def test_trapezoidal_correction():
+    """Validates that the correction broadcasts and can be fused into the momentum conversion."""
+    cut = example_data.cut.spectrum
+    corners = [
+        {"phi": 0.25, "eV": 0.0},
+        {"phi": 0.28, "eV": -0.4},
+        {"phi": 0.6, "eV": 0.0},
+        {"phi": 0.57, "eV": -0.4},
+    ]
+
+    corrected = apply_trapezoidal_correction(cut, corners)
+    stack = apply_trapezoidal_correction(cut.expand_dims({"cycle": np.arange(3)}), corners)
+    assert stack.dims == ("eV", "phi", "cycle")
+    np.testing.assert_array_equal(stack.isel(cycle=2).values, corrected.values)
+
+    kp = np.linspace(-0.1, 0.1, 200)
+    sequential = convert_to_kspace(corrected, kp=kp)
+    fused = convert_to_kspace(cut, kp=kp, calibration=trapezoidal_calibration(corners))
+    difference = np.abs(sequential - fused) / sequential.max()
+    assert float(difference.median()) < 2e-3
+
+
+def test_conversion_pipeline():
+    """Validates that chained corrections agree with applying each correction in turn."""
+    cut = example_data.cut.spectrum
+    edge = xr.DataArray(0.2 * (cut.phi.values - 0.43) ** 2, coords={"phi": cut.phi.values})
+    corners = [
+        {"phi": 0.25, "eV": 0.0},
+        {"phi": 0.28, "eV": -0.4},
+        {"phi": 0.6, "eV": 0.0},
+        {"phi": 0.57, "eV": -0.4},
+    ]
+    kp = np.linspace(-0.1, 0.1, 200)
+
+    sequential = convert_to_kspace(
+        apply_trapezoidal_correction(apply_direct_fermi_edge_correction(cut, edge), corners), kp=kp
+    )
+    pipeline = ConversionPipeline([FermiEdgeShift.from_direct_correction(edge)])
+    fused = pipeline.then(trapezoidal_calibration(corners)).convert(cut, kp=kp)
+
+    difference = np.abs(sequential - fused) / sequential.max()
+    assert float(difference.median()) < 2e-3
+
+
 def test_cut_momentum_conversion():
     """Validates that the core APIs are functioning."""
     kdata = convert_to_kspace(example_data.cut.spectrum, kp=np.linspace(-0.12, 0.12, 600))
@@ -41,6 +182,19 @@ def test_cut_momentum_conversion():
     )
 
 
+def test_single_precision_momentum_conversion():
+    """Validates that single precision data is converted without promotion."""
+    data = example_data.cut.spectrum
+    kp = np.linspace(-0.12, 0.12, 80)
+
+    kdata = convert_to_kspace(data, kp=kp)
+    kdata_single = convert_to_kspace(data.astype(np.float32), kp=kp)
+
+    assert_array_almost_equal(
+        np.nan_to_num(kdata.values), np.nan_to_num(kdata_single.values), decimal=2
+    )
+
+
 def test_cut_momentum_conversion_ranges():
     """Validates that the user can select momentum ranges."""
 
@@ -53,3 +53,69 @@ def test_label_for_dim():
 
 def test_label_for_symmetry_point():
     pass
+
+
+def test_write_movie(tmp_path):
+    import stat
+    import sys
+
+    import matplotlib.cm
+    import numpy as np
+    import xarray as xr
+
+    from arpes.plotting.movie import render_frames, write_movie
+
+    data = xr.DataArray(
+        np.random.default_rng(0).random((5, 7, 4)),
+        coords={"T": np.arange(5), "phi": np.linspace(0, 1, 7), "eV": np.linspace(1, 0, 4)},
+        dims=["T", "phi", "eV"],
+    )
+    data[0, 0, 0] = 1.0
+    frames = render_frames(data, "T", vmin=0, vmax=1, cmap="viridis")
+
+    # phi runs to the right and eV upward, so the highest eV is the top row; the width is padded
+    assert frames.shape == (5, 4, 8, 3)
+    expected = np.round(np.asarray(matplotlib.cm.get_cmap("viridis")(1.0)[:3]) * 255)
+    np.testing.assert_array_equal(frames[0, 0, 0], expected)
+
+    # frames are piped to ffmpeg as raw rgb24
+    fake_ffmpeg = tmp_path / "ffmpeg"
+    fake_ffmpeg.write_text(
+        f"#!{sys.executable}\n"
+        "import shutil, sys\n"
+        "shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[-1], 'wb'))\n"
+    )
+    fake_ffmpeg.chmod(fake_ffmpeg.stat().st_mode | stat.S_IEXEC)
+
+    out = str(tmp_path / "movie.mp4")
+    write_movie(data, "T", out, vmin=0, vmax=1, cmap="viridis", ffmpeg=str(fake_ffmpeg))
+    with open(out, "rb") as f:
+        assert f.read() == frames.tobytes()
+
+
+def test_image_pyramid():
+    import numpy as np
+    import xarray as xr
+
+    from arpes.plotting.level_of_detail import ImagePyramid
+
+    data = xr.DataArray(
+        np.random.default_rng(0).random((1000, 800)),
+        coords={"phi": np.linspace(0, 1, 1000), "eV": np.linspace(0.1, -0.7, 800)},
+        dims=["phi", "eV"],
+    )
+    pyramid = ImagePyramid(data, "phi", "eV")
+
+    # the full image at no more than twice the figure resolution, with eV increasing upward
+    view = pyramid.view(width=300, height=300)
+    assert view.factors == (2, 2)
+    assert view.image.shape == (400, 500)
+    block = data.isel(phi=slice(0, 2), eV=slice(798, 800)).mean().item()
+    np.testing.assert_allclose(view.image[0, 0], block)
+    np.testing.assert_allclose([view.x, view.x + view.dw], [-0.0005, 1.0005], atol=1e-6)
+    np.testing.assert_allclose([view.y, view.y + view.dh], [-0.7005, 0.1005], atol=1e-6)
+
+    # zooming in serves the raw data in view, with a margin
+    view = pyramid.view((0.4, 0.5), (-0.2, -0.1), width=300, height=300)
+    assert view.factors == (1, 1)
+    assert 100 < view.image.shape[1] < 200 and 100 < view.image.shape[0] < 200
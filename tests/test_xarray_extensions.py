@@ -1,4 +1,22 @@
+import numpy as np
 import pytest
+import xarray as xr
+
+import arpes.xarray_extensions  # pylint: disable=unused-import
+
+
+@pytest.fixture
+def spectrum():
+    rng = np.random.default_rng(0)
+    return xr.DataArray(
+        rng.random((40, 30, 5)),
+        coords={
+            "eV": np.linspace(-1, 0.1, 40),
+            "kp": np.linspace(-0.5, 0.5, 30),
+            "T": np.linspace(10, 100, 5),
+        },
+        dims=["eV", "kp", "T"],
+    )
 
 
 def test_experimental_conditions():
@@ -57,12 +75,55 @@ def test_transposition():
     pass
 
 
-def test_select_around_data():
-    pass
+def test_select_around_data(spectrum):
+    kfs = xr.DataArray(
+        np.linspace(-0.2, 0.2, 5), coords={"T": spectrum.coords["T"].values}, dims=["T"]
+    )
 
+    for mode in ["sum", "mean"]:
+        selected = spectrum.S.select_around_data(
+            {"kp": kfs}, radius={"kp": 0.1}, fast=True, mode=mode
+        )
+        assert selected.dims == ("eV", "T")
 
-def test_select_around():
-    pass
+        for i, T in enumerate(spectrum.coords["T"].values):
+            expected = getattr(spectrum.sel(T=T, kp=slice(kfs[i] - 0.1, kfs[i] + 0.1)), mode)("kp")
+            np.testing.assert_allclose(selected.isel(T=i).values, expected.values)
+
+
+def test_select_around(spectrum):
+    point = {"eV": -0.3, "kp": 0.1}
+    radius = {"eV": 0.1, "kp": 0.1}
+    window = spectrum.sel(eV=slice(-0.4, -0.2), kp=slice(0.0, 0.2))
+
+    selected = spectrum.S.select_around(point, radius=radius, fast=True)
+    np.testing.assert_allclose(selected.values, window.sum(["eV", "kp"]).values)
+
+    inside = ((window.eV + 0.3) / 0.1) ** 2 + ((window.kp - 0.1) / 0.1) ** 2 <= 1
+    selected = spectrum.S.select_around(point, radius=radius, fast=False)
+    np.testing.assert_allclose(selected.values, window.where(inside).sum(["eV", "kp"]).values)
+
+
+def test_select_around_single_point_of_large_array():
+    data = xr.DataArray(
+        np.random.default_rng(0).random((200, 200, 100)).astype(np.float32),
+        coords={"x": np.arange(200.0), "y": np.arange(200.0), "eV": np.linspace(-1, 0, 100)},
+        dims=["x", "y", "eV"],
+    )
+    data[49, 61, 3] = np.nan
+
+    # only the neighborhood of the point is read, and NaN values are skipped
+    window = data.sel(x=slice(47, 53), y=slice(57, 63))
+    for mode in ["sum", "mean"]:
+        selected = data.S.select_around({"x": 50, "y": 60}, {"x": 3, "y": 3}, fast=True, mode=mode)
+        assert selected.dims == ("eV",)
+        expected = getattr(window, mode)(["x", "y"])
+        np.testing.assert_allclose(selected.values, expected.values, rtol=1e-5)
+
+    inside = (window.x - 50) ** 2 + (window.y - 60) ** 2 <= 9
+    selected = data.S.select_around({"x": 50, "y": 60}, {"x": 3, "y": 3}, fast=False)
+    expected = window.where(inside).sum(["x", "y"])
+    np.testing.assert_allclose(selected.values, expected.values, rtol=1e-5)
 
 
 def test_shape():